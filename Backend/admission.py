@@ -0,0 +1,155 @@
+"""
+Admission control for the /predict/* endpoints.
+
+A job is admitted only if
+  - its client is under RATE_LIMIT_PER_MINUTE (fixed one-minute window),
+  - the Celery queue is under MAX_QUEUE_DEPTH, and
+  - fewer than MAX_INFLIGHT_<TYPE> jobs of its type are queued or running.
+Otherwise the endpoint answers 429 with a Retry-After estimated from the
+completions of that job type over the last THROUGHPUT_WINDOW_S seconds.
+
+In-flight jobs live in one Redis ZSET per type (scored by admission time) and
+are released by the task_postrun handler in celery_worker.py. Entries older
+than ADMISSION_JOB_TTL_S are pruned, so a lost worker can't hold a slot
+forever. If Redis can't be reached, requests are admitted.
+"""
+import math
+import time
+import uuid
+from fastapi import HTTPException, Request
+
+from config import settings
+from redis_client import get_redis
+
+JOB_TYPES = ('blend', 'batch', 'estimation')
+THROUGHPUT_WINDOW_S = 300
+DEFAULT_RETRY_AFTER_S = 30
+MAX_RETRY_AFTER_S = 600
+CELERY_QUEUE = 'celery'
+
+
+def _inflight_key(job_type):
+    return f"admission:inflight:{job_type}"
+
+
+def _done_key(job_type):
+    return f"admission:done:{job_type}"
+
+
+def inflight_limit(job_type):
+    return {
+        'blend': settings.MAX_INFLIGHT_BLEND,
+        'batch': settings.MAX_INFLIGHT_BATCH,
+        'estimation': settings.MAX_INFLIGHT_ESTIMATION,
+    }[job_type]
+
+
+def client_id(request: Request):
+    return request.client.host if request.client else 'unknown'
+
+
+def throughput(r, job_type, now=None):
+    """Completed jobs of this type per second over the last THROUGHPUT_WINDOW_S."""
+    now = now or time.time()
+    done = r.zcount(_done_key(job_type), now - THROUGHPUT_WINDOW_S, now)
+    return done / THROUGHPUT_WINDOW_S
+
+
+def retry_after(r, job_type, excess=1):
+    """Seconds until `excess` slots of this job type are expected to free up."""
+    rate = throughput(r, job_type)
+    if rate <= 0:
+        return DEFAULT_RETRY_AFTER_S
+    return int(min(max(math.ceil(excess / rate), 1), MAX_RETRY_AFTER_S))
+
+
+def _reject(detail, retry_after_s):
+    raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(retry_after_s)})
+
+
+def _check_rate_limit(r, request, now):
+    limit = settings.RATE_LIMIT_PER_MINUTE
+    if limit <= 0:
+        return
+    window = int(now // 60)
+    key = f"admission:rate:{client_id(request)}:{window}"
+    pipe = r.pipeline()
+    pipe.incr(key)
+    pipe.expire(key, 120)
+    count = pipe.execute()[0]
+    if count > limit:
+        _reject(f"Rate limit of {limit} jobs per minute exceeded.", max(int((window + 1) * 60 - now), 1))
+
+
+def admit(request: Request, job_type):
+    """
+    Reserves an in-flight slot for a new job and returns its job id, to be
+    passed as `task_id` to `apply_async`. Raises HTTPException(429) otherwise.
+    """
+    job_id = str(uuid.uuid4())
+    if not settings.ADMISSION_ENABLED:
+        return job_id
+    now = time.time()
+    try:
+        r = get_redis()
+        _check_rate_limit(r, request, now)
+
+        if settings.MAX_QUEUE_DEPTH > 0:
+            depth = r.llen(CELERY_QUEUE)
+            if depth >= settings.MAX_QUEUE_DEPTH:
+                _reject("Prediction queue is full, try again later.", retry_after(r, job_type, depth - settings.MAX_QUEUE_DEPTH + 1))
+
+        limit = inflight_limit(job_type)
+        if limit <= 0:
+            return job_id
+        key = _inflight_key(job_type)
+        # Reserve first, then check: concurrent requests can only over-reject
+        pipe = r.pipeline()
+        pipe.zremrangebyscore(key, 0, now - settings.ADMISSION_JOB_TTL_S)
+        pipe.zadd(key, {job_id: now})
+        pipe.zcard(key)
+        inflight = pipe.execute()[2]
+        if inflight > limit:
+            release(job_id, completed=False)
+            _reject(f"Too many {job_type} jobs in progress ({limit} max).", retry_after(r, job_type, inflight - limit))
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Warning: Admission control unavailable, admitting job: {e}")
+    return job_id
+
+
+def release(job_id, completed=True):
+    """Frees a job's in-flight slot; completed jobs count towards the throughput estimate."""
+    if not settings.ADMISSION_ENABLED:
+        return
+    try:
+        r = get_redis()
+        pipe = r.pipeline()
+        for job_type in JOB_TYPES:
+            pipe.zrem(_inflight_key(job_type), job_id)
+        removed = pipe.execute()
+        # Sub-tasks and untracked tasks never held a slot
+        if not completed or not any(removed):
+            return
+        job_type = JOB_TYPES[removed.index(1)]
+        now = time.time()
+        pipe = r.pipeline()
+        pipe.zadd(_done_key(job_type), {job_id: now})
+        pipe.zremrangebyscore(_done_key(job_type), 0, now - THROUGHPUT_WINDOW_S)
+        pipe.execute()
+    except Exception as e:
+        print(f"Warning: Could not release admission slot of {job_id}: {e}")
+
+
+def stats():
+    """In-flight counts, limits and throughput per job type."""
+    r = get_redis()
+    return {
+        job_type: {
+            'inflight': r.zcard(_inflight_key(job_type)),
+            'limit': inflight_limit(job_type),
+            'throughput_per_min': throughput(r, job_type) * 60,
+        }
+        for job_type in JOB_TYPES
+    }
@@ -0,0 +1,122 @@
+"""
+Burst load test of the /predict/* admission control.
+
+Runs the API in-process against a Redis stand-in (fakeredis), an in-memory
+Celery broker/backend and Mongo, with stub models (MODEL_BACKEND=stub). Jobs
+are fanned out (PREDICTION_FANOUT=target) so they can run on CPU.
+
+  1. A burst from several clients while no worker is running: at most
+     --max-inflight jobs are admitted, the rest get 429 with Retry-After.
+  2. A worker drains the queue; slots are released and throughput recorded.
+  3. A second burst: admission reopens and Retry-After now follows the
+     observed throughput instead of the default.
+
+Run from the Backend directory:
+
+    python benchmarks/admission_burst.py --requests 200 --clients 4 --max-inflight 20
+"""
+import sys
+import os
+import time
+import argparse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description="Burst load test of the prediction admission control.")
+parser.add_argument("--requests", type=int, default=200)
+parser.add_argument("--clients", type=int, default=4)
+parser.add_argument("--max-inflight", type=int, default=20)
+parser.add_argument("--rate-limit", type=int, default=40, help="Jobs per client per minute.")
+args = parser.parse_args()
+
+os.environ['REDIS_URL'] = 'fakeredis://'
+os.environ.setdefault('MONGO_URI', 'mongomock://localhost')
+os.environ.setdefault('DB_NAME', 'admission_check')
+os.environ.setdefault('HF_TOKEN', 'unused')
+os.environ['MODEL_BACKEND'] = 'stub'
+os.environ['PREDICTION_FANOUT'] = 'target'
+os.environ['MAX_INFLIGHT_BLEND'] = str(args.max_inflight)
+os.environ['RATE_LIMIT_PER_MINUTE'] = str(args.rate_limit)
+
+from fastapi.testclient import TestClient
+from celery.contrib.testing.worker import start_worker
+from celery_worker import celery_app
+import admission
+import main as api
+
+celery_app.conf.update(broker_url='memory://', result_backend='cache+memory://')
+
+
+def blend_request(rng):
+    fractions = rng.dirichlet(np.ones(5)) * 100
+    return {'components': [
+        {'name': f'C{i+1}', 'fraction': float(f), 'properties': rng.normal(size=10).tolist()}
+        for i, f in enumerate(fractions)
+    ]}
+
+
+def burst(n_requests, n_clients, rng, first_client=1):
+    """Sends n_requests blend jobs from n_clients concurrently; returns (status counts, Retry-After values, job ids)."""
+    clients = [TestClient(api.app, client=(f'10.0.0.{first_client + i}', 50000)) for i in range(n_clients)]
+    bodies = [blend_request(rng) for _ in range(n_requests)]
+
+    def send(i):
+        start = time.perf_counter()
+        response = clients[i % n_clients].post('/predict/blend_manual', json=bodies[i])
+        return response, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=n_clients * 4) as pool:
+        responses = list(pool.map(send, range(n_requests)))
+    statuses = Counter(r.status_code for r, _ in responses)
+    retry_after = [int(r.headers['retry-after']) for r, _ in responses if r.status_code == 429]
+    job_ids = [r.json()['job_id'] for r, _ in responses if r.status_code == 200]
+    latencies = sorted(t for _, t in responses)
+    print(f"  statuses: {dict(statuses)}, admission latency p50={latencies[len(latencies)//2]*1000:.1f}ms "
+          f"p99={latencies[int(len(latencies)*0.99)]*1000:.1f}ms")
+    if retry_after:
+        print(f"  Retry-After: min={min(retry_after)}s max={max(retry_after)}s")
+    return statuses, retry_after, job_ids
+
+
+def main():
+    rng = np.random.default_rng(0)
+    failures = []
+
+    print(f"Burst 1: {args.requests} requests from {args.clients} clients, no worker running")
+    statuses, retry_after, job_ids = burst(args.requests, args.clients, rng)
+    inflight = admission.stats()['blend']['inflight']
+    print(f"  in flight: {inflight} (limit {args.max_inflight})")
+    if statuses[200] > args.max_inflight or inflight > args.max_inflight:
+        failures.append("more jobs admitted than the in-flight limit")
+    if statuses[429] == 0 or not all(v > 0 for v in retry_after):
+        failures.append("no 429 with Retry-After under the burst")
+
+    print("Draining the queue with one worker")
+    start = time.perf_counter()
+    with start_worker(celery_app, pool='threads', concurrency=4, perform_ping_check=False):
+        results = [celery_app.AsyncResult(job_id) for job_id in job_ids]
+        while not all(r.ready() for r in results) and time.perf_counter() - start < 120:
+            time.sleep(0.1)
+        time.sleep(0.5)  # let task_postrun release the last slots
+    stats = admission.stats()['blend']
+    print(f"  {len(job_ids)} jobs in {time.perf_counter() - start:.1f}s, in flight: {stats['inflight']}, "
+          f"throughput: {stats['throughput_per_min']:.1f}/min")
+    if stats['inflight'] != 0:
+        failures.append("slots not released after the jobs finished")
+
+    print(f"Burst 2: {args.requests} requests from {args.clients} new clients")
+    statuses, retry_after, _ = burst(args.requests, args.clients, rng, first_client=args.clients + 1)
+    if statuses[200] == 0:
+        failures.append("admission did not reopen")
+    if retry_after and all(v == admission.DEFAULT_RETRY_AFTER_S for v in retry_after):
+        failures.append("Retry-After did not use the observed throughput")
+
+    print("OK" if not failures else "FAILED: " + "; ".join(failures))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Bulk catalog import/export timing against the configured Mongo (MONGO_URI).
+
+Writes into a scratch collection that is dropped afterwards, so the real
+catalogs are untouched. Run from the Backend directory:
+
+    python benchmarks/bench_catalog_import.py --rows 10000
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+import catalog_io
+from models import ComponentCreate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time a bulk component import and export.")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--collection", type=str, default="bench_components")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    rows = [
+        {'id': f'bench-{i}', 'name': f'Bench component {i}', 'cost': float(rng.uniform(0.1, 3.0)),
+         'properties': rng.normal(size=10).tolist()}
+        for i in range(args.rows)
+    ]
+    collection = database.db.get_collection(args.collection)
+    collection.drop()
+
+    try:
+        start = time.perf_counter()
+        result = catalog_io.import_rows(collection, rows, ComponentCreate)
+        print(f"Import of {args.rows} rows (insert): {time.perf_counter() - start:.2f}s "
+              f"-> {result['inserted']} inserted, {len(result['errors'])} errors")
+
+        start = time.perf_counter()
+        result = catalog_io.import_rows(collection, rows, ComponentCreate)
+        print(f"Import of {args.rows} rows (re-import): {time.perf_counter() - start:.2f}s "
+              f"-> {result['unchanged']} unchanged, {result['updated']} updated")
+
+        start = time.perf_counter()
+        size = sum(len(chunk) for chunk in catalog_io.stream_csv(collection.find(batch_size=1000)))
+        print(f"CSV export: {time.perf_counter() - start:.2f}s ({size / 1024:.0f} KiB)")
+    finally:
+        collection.drop()
+
+
+if __name__ == '__main__':
+    main()
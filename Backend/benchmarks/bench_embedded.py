@@ -0,0 +1,103 @@
+"""
+End-to-end latency of a blend prediction: Celery path vs embedded mode.
+
+Submits --requests blend_manual jobs one after the other and polls
+/predict/status until each finishes, first with EXECUTION_MODE='celery'
+(in-memory broker, a thread-pool worker, a CPU pool of one process) running
+predict_worker_script.py per job (PREDICTION_POOL='subprocess') and on the
+worker's persistent pool (PREDICTION_POOL='persistent'), then with
+EXECUTION_MODE='embedded'. Uses the stub models
+(MODEL_BACKEND=stub) and mongomock/fakeredis, so only the plumbing around
+the model calls differs; STUB_LATENCY_MS adds simulated model time.
+
+Run from the Backend directory:
+
+    python benchmarks/bench_embedded.py --requests 10 --stub-latency-ms 5
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description="Celery vs embedded blend prediction latency.")
+parser.add_argument("--requests", type=int, default=10)
+parser.add_argument("--stub-latency-ms", type=float, default=5.0)
+parser.add_argument("--poll-interval", type=float, default=0.01)
+args = parser.parse_args()
+
+os.environ['REDIS_URL'] = 'fakeredis://'
+os.environ['MONGO_URI'] = 'mongomock://localhost'
+os.environ['DB_NAME'] = 'embedded_bench'
+os.environ.setdefault('HF_TOKEN', 'unused')
+os.environ['MODEL_BACKEND'] = 'stub'
+os.environ['STUB_LATENCY_MS'] = str(args.stub_latency_ms)
+os.environ['PREDICT_CPU_WORKERS'] = '1'
+os.environ['RATE_LIMIT_PER_MINUTE'] = '0'
+
+from fastapi.testclient import TestClient
+from celery.contrib.testing.worker import start_worker
+from celery_worker import celery_app
+from config import settings
+import main as api
+
+celery_app.conf.update(broker_url='memory://', result_backend='cache+memory://')
+
+
+def blend_request(rng):
+    fractions = rng.dirichlet(np.ones(5)) * 100
+    return {'components': [
+        {'name': f'C{i+1}', 'fraction': float(f), 'properties': rng.normal(size=10).tolist()}
+        for i, f in enumerate(fractions)
+    ]}
+
+
+def run_jobs(client, n_requests, rng):
+    """Seconds from submit to SUCCESS of each job, and the last result."""
+    latencies = []
+    result = None
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        job_id = client.post('/predict/blend_manual', json=blend_request(rng)).json()['job_id']
+        while True:
+            status = client.get(f'/predict/status/{job_id}').json()
+            if status['status'] in ('SUCCESS', 'FAILURE'):
+                break
+            time.sleep(args.poll_interval)
+        if status['status'] != 'SUCCESS':
+            raise SystemExit(f"Job {job_id} failed: {status}")
+        latencies.append(time.perf_counter() - start)
+        result = status['result']
+    return latencies, result
+
+
+def report(name, latencies):
+    times = np.array(latencies) * 1000
+    print(f"{name:<22}{times[0]:>10.0f}ms{np.median(times[1:] if len(times) > 1 else times):>10.0f}ms"
+          f"{times.max():>10.0f}ms")
+
+
+def main():
+    client = TestClient(api.app)
+    print(f"{args.requests} sequential blend predictions, stub latency {args.stub_latency_ms}ms per model call")
+    print(f"{'mode':<22}{'first':>12}{'median rest':>12}{'max':>12}")
+
+    settings.EXECUTION_MODE = 'celery'
+    with start_worker(celery_app, pool='threads', concurrency=1, perform_ping_check=False):
+        for pool in ('subprocess', 'persistent'):
+            settings.PREDICTION_POOL = pool
+            celery_latencies, celery_result = run_jobs(client, args.requests, np.random.default_rng(0))
+            report(f"celery + {pool}", celery_latencies)
+
+    settings.EXECUTION_MODE = 'embedded'
+    embedded_latencies, embedded_result = run_jobs(client, args.requests, np.random.default_rng(0))
+    report("embedded", embedded_latencies)
+
+    diff = np.abs(np.array(celery_result['blended_properties']) - np.array(embedded_result['blended_properties'])).max()
+    print(f"Max difference of the last prediction: {diff:.2e}")
+
+
+if __name__ == '__main__':
+    main()
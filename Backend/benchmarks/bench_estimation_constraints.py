@@ -0,0 +1,81 @@
+"""
+Trials-to-target benchmark for constrained vs. unconstrained fraction estimation.
+
+The ensemble is replaced by a linear mixing surrogate (the `Weighted_avg_prop`
+features of `TrainedTabPFN.preprocess`), so the script only measures how fast
+the sampler parametrization reaches an acceptable MAPE, not model latency.
+
+    python benchmarks/bench_estimation_constraints.py --repeats 10 --n-trials 300
+"""
+import sys
+import os
+import argparse
+import numpy as np
+import optuna
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from estimation import resolve_bounds, free_indices, constrained_fractions
+
+optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+
+def trials_to_target(properties, target, lower, upper, n_trials, mape_threshold, seed):
+    """Number of trials until the surrogate MAPE drops below the threshold (None if never)."""
+    free = free_indices(lower, upper)
+    hit = {'trial': None}
+
+    def objective(trial):
+        x = [- np.log(trial.suggest_float(f"x_{i}", 0, 1)) for i in free]
+        p = constrained_fractions(x, lower, upper) / 100
+        blended = p @ properties
+        mape = float(np.mean(np.abs(target - blended) / np.abs(target)))
+        if mape < mape_threshold and hit['trial'] is None:
+            hit['trial'] = trial.number + 1
+            trial.study.stop()
+        return mape
+
+    study = optuna.create_study(direction='minimize', sampler=optuna.samplers.TPESampler(seed=seed))
+    study.optimize(objective, n_trials=n_trials)
+    return hit['trial']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark trials-to-target with and without fraction constraints.")
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--n-trials", type=int, default=300)
+    parser.add_argument("--mape", type=float, default=0.01, help="Acceptable MAPE (0-1).")
+    args = parser.parse_args()
+
+    names = [f"Component{i+1}" for i in range(5)]
+    components = [{'name': n} for n in names]
+    # "Component1 exactly 10%" and "Component2 at least 50%"
+    constraints = [
+        {'name': 'Component1', 'fixed_fraction': 10.0},
+        {'name': 'Component2', 'min_fraction': 50.0},
+    ]
+    recipe = np.array([10.0, 55.0, 15.0, 12.0, 8.0])
+
+    scenarios = {
+        'unconstrained': resolve_bounds(components),
+        'constrained': resolve_bounds(components, constraints),
+    }
+    results = {name: [] for name in scenarios}
+
+    for repeat in range(args.repeats):
+        rng = np.random.default_rng(repeat)
+        properties = rng.uniform(1.0, 10.0, size=(5, 10))
+        target = (recipe / 100) @ properties
+        for name, (lower, upper) in scenarios.items():
+            results[name].append(
+                trials_to_target(properties, target, lower, upper, args.n_trials, args.mape, seed=repeat)
+            )
+
+    print(f"Trials to reach MAPE < {args.mape:.2%} (budget {args.n_trials}, {args.repeats} repeats)")
+    for name, hits in results.items():
+        reached = [h for h in hits if h is not None]
+        median = np.median(reached) if reached else float('nan')
+        print(f"  {name:<14} median={median:>7.1f}  reached={len(reached)}/{len(hits)}  trials={hits}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Node memory and load time of pool workers: native vs memory-mapped weights.
+
+Saves a synthetic fold model with --mb MB of weights as a plain pickle (the
+'pickle' model type) and in the mapped format (model/mapped_weights.py), then
+starts pools of 1, 2, 4, ... processes that each load the model and predict
+once (touching every weight). While all workers of a pool are alive, their
+RSS and PSS (proportional set size, shared pages split between the sharers)
+are summed. With mapped weights the node PSS stays about constant as the
+pool grows. Run from the Backend directory:
+
+    python benchmarks/bench_mapped_weights.py --mb 128 --pool-sizes 1,2,4
+"""
+import sys
+import os
+import time
+import pickle
+import argparse
+import tempfile
+import multiprocessing as mp
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import mapped_weights
+
+
+class SyntheticFoldModel():
+    """A stack of dense layers standing in for a fitted model's weights."""
+    def __init__(self, n_features, total_mb, width=1024):
+        rng = np.random.default_rng(0)
+        n_layers = max(1, int(total_mb * 1024 * 1024 // (width * width * 4)))
+        self.input = rng.normal(size=(n_features, width)).astype(np.float32)
+        self.layers = [rng.normal(scale=width ** -0.5, size=(width, width)).astype(np.float32) for _ in range(n_layers)]
+
+    def predict(self, X):
+        hidden = np.tanh(np.asarray(X, dtype=np.float32) @ self.input)
+        for layer in self.layers:
+            hidden = np.tanh(hidden @ layer)
+        return hidden.mean(axis=1)
+
+
+def memory():
+    """(RSS, PSS) of this process in bytes."""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0]] = int(parts[1]) * 1024
+    return values.get('Rss:', 0), values.get('Pss:', 0)
+
+
+def worker(fmt, path, X, barrier, results):
+    start = time.perf_counter()
+    if fmt == 'native':
+        with open(path, 'rb') as f:
+            model = pickle.load(f)
+    else:
+        model = mapped_weights.load(path, 'cpu')
+    load_s = time.perf_counter() - start
+    prediction = model.predict(X)
+    # Measure while every worker of the pool holds its model
+    barrier.wait()
+    rss, pss = memory()
+    results.put((load_s, rss, pss, float(prediction.sum())))
+    barrier.wait()
+
+
+def run_pool(fmt, path, X, size):
+    ctx = mp.get_context('spawn')
+    barrier, results = ctx.Barrier(size), ctx.Queue()
+    processes = [ctx.Process(target=worker, args=(fmt, path, X, barrier, results)) for _ in range(size)]
+    for p in processes:
+        p.start()
+    rows = [results.get() for _ in range(size)]
+    for p in processes:
+        p.join()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pool memory with native vs memory-mapped model weights.")
+    parser.add_argument("--mb", type=int, default=128, help="Size of the synthetic model's weights.")
+    parser.add_argument("--pool-sizes", type=str, default="1,2,4")
+    args = parser.parse_args()
+
+    X = np.random.default_rng(1).normal(size=(8, 60))
+    model = SyntheticFoldModel(X.shape[1], args.mb)
+    expected = float(model.predict(X).sum())
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {'native': os.path.join(directory, 'model.pkl'), 'mmap': os.path.join(directory, 'model.mmap')}
+        with open(paths['native'], 'wb') as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        mapped_weights.save(model, paths['mmap'])
+        del model
+
+        print(f"{args.mb} MB of weights")
+        print(f"{'format':<8}{'pool':>6}{'node RSS':>12}{'node PSS':>12}{'load (mean)':>14}{'load (max)':>14}")
+        for size in [int(s) for s in args.pool_sizes.split(',')]:
+            for fmt in ('native', 'mmap'):
+                rows = run_pool(fmt, paths[fmt], X, size)
+                assert all(abs(r[3] - expected) < 1e-3 for r in rows), "predictions differ"
+                loads = [r[0] * 1000 for r in rows]
+                print(f"{fmt:<8}{size:>6}{sum(r[1] for r in rows) / 1e6:>10.0f}MB{sum(r[2] for r in rows) / 1e6:>10.0f}MB"
+                      f"{np.mean(loads):>11.1f} ms{max(loads):>11.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Multi-target fraction estimation vs one estimation job per target.
+
+Runs N single-target searches (estimate_fractions) and one multi-target
+search (estimate_fractions_multi) with the same trial budget per job, counts
+the blend predictions each needs and compares the best MAPE found per target.
+Predictions run in-process on the stub models (MODEL_BACKEND=stub), as in
+EXECUTION_MODE='embedded'. Run from the Backend directory:
+
+    python benchmarks/bench_multi_estimation.py --targets 3 --n-trials 40
+"""
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('MONGO_URI', 'mongomock://localhost')
+os.environ.setdefault('DB_NAME', 'multi_estimation_bench')
+os.environ.setdefault('HF_TOKEN', 'unused')
+os.environ['MODEL_BACKEND'] = 'stub'
+os.environ['WARM_START_TRIALS'] = '0'
+
+import optuna
+import embedded
+from celery_worker import estimate_fractions, estimate_fractions_multi
+
+optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+
+def components(rng, n=5):
+    return [
+        {'name': f'C{i+1}', 'fraction': 20.0, 'properties': rng.normal(size=10).tolist(), 'cost': float(rng.uniform(0.3, 1.0))}
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-target vs per-target fraction estimation.")
+    parser.add_argument("--targets", type=int, default=3)
+    parser.add_argument("--n-trials", type=int, default=40)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    comps = components(rng)
+    # Targets are predictions of random recipes, so each has an exact answer
+    target_matrix = []
+    for _ in range(args.targets):
+        recipe = [dict(c, fraction=float(f)) for c, f in zip(comps, rng.dirichlet(np.ones(len(comps))) * 100)]
+        target_matrix.append(embedded.predict_blend({'components': recipe})['blended_properties'])
+
+    calls = {'n': 0}
+
+    def counted_predict(request_data, on_progress=None):
+        calls['n'] += 1
+        return embedded.predict_blend(request_data, on_progress)
+
+    def no_progress(state=None, meta=None):
+        pass
+
+    start = time.perf_counter()
+    single_mapes = []
+    for target in target_matrix:
+        request = {'components': [dict(c) for c in comps], 'target_properties': target, 'n_trials': args.n_trials}
+        result = estimate_fractions(request, no_progress, predict_blend=counted_predict)['result']
+        single_mapes.append(result['mape_score'])
+    single_time, single_calls = time.perf_counter() - start, calls['n']
+
+    calls['n'] = 0
+    start = time.perf_counter()
+    request = {
+        'components': [dict(c) for c in comps], 'n_trials': args.n_trials,
+        'blend_targets': [{'name': f'T{i+1}', 'target_properties': t, 'target_cost': None} for i, t in enumerate(target_matrix)],
+    }
+    multi = estimate_fractions_multi(request, no_progress, predict_blend=counted_predict)['result']
+    multi_time, multi_calls = time.perf_counter() - start, calls['n']
+
+    print(f"{args.targets} targets, {args.n_trials} trials per job")
+    print(f"{'':<20}{'predictions':>12}{'time':>10}   best MAPE per target")
+    print(f"{'one job per target':<20}{single_calls:>12}{single_time:>9.1f}s   "
+          + ' '.join(f'{m:.4f}' for m in single_mapes))
+    print(f"{'multi-target job':<20}{multi_calls:>12}{multi_time:>9.1f}s   "
+          + ' '.join(f"{r['mape_score']:.4f}" for r in multi['results']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Payload size and serialization time of a large batch result.
+
+Compares the previous path (stdlib json, one object per row) with orjson and
+with the columnar format of `/predict/status/{job_id}?format=columnar`, raw and
+gzip-compressed (as sent by GZipMiddleware). Run from the Backend directory:
+
+    python benchmarks/bench_serialization.py --rows 100000
+"""
+import sys
+import os
+import gzip
+import json
+import time
+import random
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serialization import dumps, loads, to_columnar, GZIP_LEVEL
+
+
+def batch_result(n_rows, rng):
+    """A batch result shaped like predict_batch_worker.py's output."""
+    preds = rng.normal(size=(n_rows, 10))
+    return [
+        {
+            "blended_properties": list(row),
+            "confidence_score": random.random(),
+            "model_version": "v1.0-multiGPU-batch",
+            "quality": "full",
+            "targets": [f'BlendProperty{j}' for j in range(1, 11)],
+        }
+        for row in preds
+    ]
+
+
+def timed(fn, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch result serialization benchmark.")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    results = batch_result(args.rows, np.random.default_rng(0))
+    payload = {"status": "SUCCESS", "progress": 100, "result": results}
+
+    cases = [
+        ("json, rows (before)", lambda: json.dumps(payload).encode()),
+        ("orjson, rows", lambda: dumps(payload)),
+        ("orjson, columnar", lambda: dumps(dict(payload, result=to_columnar(results)))),
+    ]
+    print(f"{args.rows} rows")
+    print(f"{'format':<22}{'encode':>10}{'decode':>10}{'size':>12}{'gzip':>12}{'gzip time':>12}")
+    for name, fn in cases:
+        body, encode_time = timed(fn, args.repeats)
+        _, decode_time = timed(lambda: loads(body), args.repeats)
+        compressed, gzip_time = timed(lambda: gzip.compress(body, compresslevel=GZIP_LEVEL), 1)
+        print(f"{name:<22}{encode_time*1000:>8.0f}ms{decode_time*1000:>8.0f}ms"
+              f"{len(body)/2**20:>10.1f}MB{len(compressed)/2**20:>10.1f}MB{gzip_time*1000:>10.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Per-model prediction latency of cached (fit-with-cache) vs. uncached TabPFN models.
+
+Requires the caches from `python -m model.cache_models`. Run from the Backend directory:
+
+    python benchmarks/bench_tabpfn_cache.py --input-csv data/train.csv --rows 1 --repeats 20
+"""
+import sys
+import os
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from model.trained_tabpfn import TrainedTabPFN, cached_model_path, load_cached_tabpfn_model
+from tabpfn.model.loading import load_fitted_tabpfn_model
+
+
+def time_predict(model, X, repeats):
+    model.predict(X)  # warm-up
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.predict(X)
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cached vs. uncached TabPFN inference.")
+    parser.add_argument("--input-csv", required=True, type=str, help="CSV with the input columns to sample rows from.")
+    parser.add_argument("--rows", type=int, default=1, help="Rows per predict call.")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    tabpfn_model = TrainedTabPFN()
+    input_df = pd.read_csv(args.input_csv, nrows=args.rows)
+    X = tabpfn_model.preprocess(input_df[tabpfn_model.input_columns].copy())
+
+    print(f"{'model':<28} {'uncached ms':>12} {'cached ms':>10} {'speedup':>8}")
+    speedups = []
+    for col in tabpfn_model.target_columns:
+        for fold_idx in range(5):
+            model_info, used_features = tabpfn_model.models[col][fold_idx]
+            model_path, model_type = model_info
+            cache_path = cached_model_path(model_path)
+            if model_type != 'tabpfn' or not os.path.exists(cache_path):
+                continue
+            X_test = X.drop(used_features, axis=1)
+            uncached = time_predict(load_fitted_tabpfn_model(Path(model_path), device=device), X_test, args.repeats)
+            cached = time_predict(load_cached_tabpfn_model(cache_path, device), X_test, args.repeats)
+            speedups.append(uncached / cached)
+            print(f"{col + ' fold ' + str(fold_idx):<28} {uncached:>12.2f} {cached:>10.2f} {uncached / cached:>7.1f}x", flush=True)
+
+    if speedups:
+        print(f"Median speedup over {len(speedups)} models: {np.median(speedups):.1f}x ({args.rows} rows/call, {device})")
+    else:
+        print("No cached models found, run `python -m model.cache_models` first.")
+
+
+if __name__ == '__main__':
+    main()
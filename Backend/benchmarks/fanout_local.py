@@ -0,0 +1,157 @@
+"""
+Local multi-worker check of the Celery chord fan-out (PREDICTION_FANOUT).
+
+Runs two in-process Celery workers against an in-memory broker and result
+backend (standing in for Redis), with stub fold models (MODEL_BACKEND=stub)
+and an in-memory Mongo, so no GPU, weights or services are needed. A single
+blend and a small batch are fanned out, and the assembled predictions are
+compared against the same models combined locally. Then a job whose sub-tasks
+fail is checked to leave no fan-out state behind and to free its admission slot. Run from the Backend directory:
+
+    python benchmarks/fanout_local.py --mode target
+    python benchmarks/fanout_local.py --mode fold_target --latency-ms 20
+"""
+import sys
+import os
+import time
+import argparse
+import tempfile
+from contextlib import ExitStack
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser(description="Check the Celery chord fan-out with two local workers.")
+parser.add_argument("--mode", default="target", choices=["target", "fold_target"])
+parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated per-model latency.")
+parser.add_argument("--batch-rows", type=int, default=16)
+parser.add_argument("--quality", default="full", choices=["full", "preview"])
+args = parser.parse_args()
+
+os.environ.setdefault('MONGO_URI', 'mongomock://localhost')
+os.environ.setdefault('DB_NAME', 'fanout_check')
+os.environ.setdefault('HF_TOKEN', 'unused')
+os.environ.setdefault('REDIS_URL', 'fakeredis://')
+os.environ['MODEL_BACKEND'] = 'stub'
+os.environ['PREDICTION_FANOUT'] = args.mode
+os.environ['STUB_LATENCY_MS'] = str(args.latency_ms)
+
+from celery.contrib.testing.worker import start_worker
+from starlette.requests import Request
+import admission
+import celery_worker
+from celery_worker import celery_app, run_distributed_prediction, fanout_progress, _fanout_keys, _fanout_input_key
+from model.trained_tabpfn import TrainedTabPFN, INPUT_COLUMNS, load_fold_model
+
+celery_app.conf.update(broker_url='memory://', result_backend='cache+memory://')
+
+
+def random_components(rng):
+    fractions = rng.dirichlet(np.ones(5)) * 100
+    return [{'name': f'C{i+1}', 'fraction': float(f), 'properties': rng.normal(size=10).tolist()}
+            for i, f in enumerate(fractions)]
+
+
+def local_prediction(tabpfn_model, input_df, quality):
+    """The same stub models run in this process, combined with the fold weights."""
+    X = tabpfn_model.preprocess(input_df.copy())
+    folds_by_target = tabpfn_model.select_folds(quality)
+    results_map = {}
+    for col, folds in folds_by_target.items():
+        for fold_idx in folds:
+            model_info, used_features = tabpfn_model.models[col][fold_idx]
+            model = load_fold_model(model_info[0], model_info[1], 'cpu')
+            prediction = model.predict(X.drop(columns=used_features))
+            tabpfn_model.collect(results_map, (fold_idx, col, prediction, (0, len(X))), len(X))
+    return tabpfn_model.combine(results_map, folds_by_target)
+
+
+def wait(result):
+    progress_seen = set()
+    while not result.ready():
+        progress = fanout_progress(result.id)
+        if progress is not None:
+            progress_seen.add(progress)
+        time.sleep(0.01)
+    return result.get(timeout=5), sorted(progress_seen)
+
+
+def main():
+    fanout_input = celery_worker.fanout_input
+    rng = np.random.default_rng(0)
+    tabpfn_model = TrainedTabPFN()
+    failures = 0
+
+    with ExitStack() as stack:
+        for _ in range(2):
+            stack.enter_context(start_worker(celery_app, pool='threads', concurrency=2, perform_ping_check=False))
+
+        # --- Single blend ---
+        components = random_components(rng)
+        start = time.perf_counter()
+        result = run_distributed_prediction.delay({
+            'kind': 'single',
+            'request_data': {'components': components, 'quality': args.quality},
+        })
+        output, progress_seen = wait(result)
+        elapsed = time.perf_counter() - start
+        expected = local_prediction(tabpfn_model, tabpfn_model.components_frame(components), args.quality)[0]
+        diff = float(np.max(np.abs(np.array(output['result']['blended_properties']) - expected)))
+        print(f"single: {elapsed*1000:.0f} ms, max abs diff vs. local: {diff:.2e}, progress seen: {progress_seen}")
+        failures += diff > 1e-9
+
+        # --- Batch ---
+        rows = [tabpfn_model.components_frame(random_components(rng)) for _ in range(args.batch_rows)]
+        input_df = pd.concat(rows, ignore_index=True)[INPUT_COLUMNS]
+        fd, file_path = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        input_df.to_csv(file_path, index=False)
+
+        start = time.perf_counter()
+        result = run_distributed_prediction.delay({
+            'kind': 'batch', 'file_path': file_path, 'filename': 'fanout_check.csv', 'quality': args.quality,
+        })
+        output, progress_seen = wait(result)
+        elapsed = time.perf_counter() - start
+        expected = local_prediction(tabpfn_model, input_df, args.quality)
+        got = np.array([r['blended_properties'] for r in output['result']])
+        diff = float(np.max(np.abs(got - expected)))
+        print(f"batch ({args.batch_rows} rows): {elapsed*1000:.0f} ms, max abs diff vs. local: {diff:.2e}, "
+              f"progress seen: {progress_seen}")
+        failures += diff > 1e-9
+        failures += os.path.exists(file_path)
+
+        # --- Failing sub-tasks ---
+        # Sub-tasks that can't read the job's input (e.g. it expired) fail the
+        # chord; its error callback has to drop the counters and the input
+        def lost_input(job_id):
+            raise Exception(f"The input of job {job_id} is no longer stored.")
+        celery_worker.fanout_input = lost_input
+        # Admitted like an API request, so the job holds a blend slot
+        job_id = admission.admit(Request({'type': 'http', 'client': ('127.0.0.1', 0), 'headers': []}), 'blend')
+        try:
+            result = run_distributed_prediction.apply_async(({
+                'kind': 'single',
+                'request_data': {'components': random_components(rng), 'quality': args.quality},
+            },), task_id=job_id)
+            while not result.ready():
+                time.sleep(0.01)
+        finally:
+            celery_worker.fanout_input = fanout_input
+        leftover = [
+            key for key in _fanout_keys(result.id) + (_fanout_input_key(result.id),)
+            if celery_app.backend.get(key) is not None
+        ]
+        inflight = admission.stats()['blend']['inflight']
+        print(f"failing sub-tasks: state {result.state}, fan-out keys left: {leftover}, blend slots in use: {inflight}")
+        failures += result.state != 'FAILURE'
+        failures += bool(leftover)
+        failures += inflight != 0
+
+    print("OK" if not failures else f"FAILED ({failures} checks)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+"""
+HTTP load test of the API with mixed traffic.
+
+By default the whole stack runs in this process against local stand-ins, so no
+Mongo, Redis, GPU or HuggingFace weights are needed:
+  - Mongo: mongomock (MONGO_URI=mongomock://)
+  - Redis: fakeredis for admission control, in-memory Celery broker/backend
+  - models: MODEL_BACKEND=stub on a CPU process pool (PREDICT_CPU_WORKERS)
+The API is served by uvicorn on a local port and a Celery worker (thread pool)
+runs the jobs. Pass --url to load-test a running deployment instead.
+
+Each virtual user picks a request from the mix, and for prediction jobs polls
+/predict/status until the job finishes. Throughput and latency percentiles are
+reported per endpoint, plus the end-to-end time of each job type.
+
+Needs `pip install fakeredis mongomock` on top of requirements.txt. Run from
+the Backend directory:
+
+    python benchmarks/loadtest.py --users 8 --duration 60
+"""
+import sys
+import os
+import time
+import socket
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Share of each request type in the mix
+DEFAULT_MIX = {
+    'components': 0.5,
+    'blend_manual': 0.3,
+    'blend_batch': 0.1,
+    'estimate_fractions': 0.1,
+}
+N_COMPONENTS = 5
+N_PROPERTIES = 10
+BATCH_COLUMNS = (
+    [f'Component{i}_fraction' for i in range(1, N_COMPONENTS + 1)]
+    + [f'Component{i}_Property{j}' for j in range(1, N_PROPERTIES + 1) for i in range(1, N_COMPONENTS + 1)]
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Mixed-traffic HTTP load test of the API.")
+    parser.add_argument("--url", default=None, help="Base URL of a running API (default: boot a local stack).")
+    parser.add_argument("--users", type=int, default=8, help="Concurrent virtual users.")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to generate load.")
+    parser.add_argument("--mix", default=None,
+                        help="Request mix, e.g. 'components=5,blend_manual=3,blend_batch=1,estimate_fractions=1'.")
+    parser.add_argument("--batch-rows", type=int, default=200, help="Rows per blend_batch CSV.")
+    parser.add_argument("--n-trials", type=int, default=3, help="Optuna trials per estimate_fractions job.")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--job-timeout", type=float, default=300)
+    parser.add_argument("--celery-concurrency", type=int, default=4)
+    parser.add_argument("--cpu-workers", type=int, default=2, help="Prediction pool size of the stub models.")
+    parser.add_argument("--stub-latency-ms", type=float, default=5.0, help="Simulated time per model call.")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def parse_mix(spec):
+    if not spec:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in spec.split(','):
+        name, weight = part.split('=')
+        if name not in DEFAULT_MIX:
+            raise SystemExit(f"Unknown request type in --mix: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+# --- Local stack ---
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class LocalStack():
+    """The API (uvicorn) and a Celery worker in this process, on local stand-ins."""
+    def __init__(self, args):
+        os.environ['MONGO_URI'] = 'mongomock://localhost'
+        os.environ['DB_NAME'] = 'loadtest'
+        os.environ.setdefault('HF_TOKEN', 'unused')
+        os.environ['REDIS_URL'] = 'fakeredis://'
+        os.environ['MODEL_BACKEND'] = 'stub'
+        os.environ['STUB_LATENCY_MS'] = str(args.stub_latency_ms)
+        os.environ['PREDICT_CPU_WORKERS'] = str(args.cpu_workers)
+        # Measure the stack, not the per-client rate limit
+        os.environ['RATE_LIMIT_PER_MINUTE'] = '0'
+        self.args = args
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+
+    def __enter__(self):
+        import uvicorn
+        from celery.contrib.testing.worker import start_worker
+        from celery_worker import celery_app
+        import main as api
+
+        celery_app.conf.update(broker_url='memory://', result_backend='cache+memory://')
+        self._worker = start_worker(
+            celery_app, pool='threads', concurrency=self.args.celery_concurrency, perform_ping_check=False,
+        )
+        self._worker.__enter__()
+
+        self._server = uvicorn.Server(uvicorn.Config(api.app, host='127.0.0.1', port=self.port, log_level='warning'))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.05)
+        print(f"Local stack up at {self.url}")
+        return self
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
+        self._worker.__exit__(None, None, None)
+
+
+# --- Traffic ---
+
+class Recorder():
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)
+
+    def add(self, name, seconds, status_code=200):
+        with self._lock:
+            if status_code == 429:
+                self.rejected[name] += 1
+            elif status_code >= 400:
+                self.errors[name] += 1
+            else:
+                self.latencies[name].append(seconds)
+
+    def report(self, elapsed):
+        names = sorted(set(self.latencies) | set(self.errors) | set(self.rejected))
+        print(f"\n{'endpoint':<34}{'ok':>7}{'err':>6}{'429':>6}{'req/s':>8}{'p50':>11}{'p95':>11}{'p99':>11}{'max':>11}")
+        for name in names:
+            times = np.array(self.latencies[name]) * 1000
+            if len(times):
+                p50, p95, p99 = np.percentile(times, [50, 95, 99])
+                stats = f"{p50:>9.1f}ms{p95:>9.1f}ms{p99:>9.1f}ms{times.max():>9.1f}ms"
+            else:
+                stats = f"{'-':>11}" * 4
+            print(f"{name:<34}{len(times):>7}{self.errors[name]:>6}{self.rejected[name]:>6}"
+                  f"{len(times) / elapsed:>8.1f}{stats}")
+
+
+class VirtualUser():
+    def __init__(self, base_url, args, recorder, components, rng):
+        self.client = httpx.Client(base_url=base_url, timeout=args.job_timeout)
+        self.args = args
+        self.recorder = recorder
+        self.components = components
+        self.rng = rng
+
+    def request(self, name, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.client.request(method, path, **kwargs)
+            status_code = response.status_code
+        except httpx.HTTPError:
+            response, status_code = None, 599
+        self.recorder.add(name, time.perf_counter() - start, status_code)
+        return response if status_code < 400 else None
+
+    def blend_components(self):
+        picked = self.rng.choice(len(self.components), size=N_COMPONENTS, replace=len(self.components) < N_COMPONENTS)
+        fractions = self.rng.dirichlet(np.ones(N_COMPONENTS)) * 100
+        return [
+            {'name': self.components[i]['name'], 'fraction': float(f),
+             'properties': self.components[i]['properties'], 'cost': self.components[i].get('cost')}
+            for i, f in zip(picked, fractions)
+        ]
+
+    def batch_csv(self):
+        fractions = self.rng.dirichlet(np.ones(N_COMPONENTS), size=self.args.batch_rows) * 100
+        properties = self.rng.normal(size=(self.args.batch_rows, N_COMPONENTS * N_PROPERTIES))
+        rows = np.hstack([fractions, properties])
+        lines = [','.join(BATCH_COLUMNS)] + [','.join(f'{v:.6g}' for v in row) for row in rows]
+        return '\n'.join(lines).encode()
+
+    def wait_for(self, job_name, response, submitted_at):
+        if response is None:
+            return
+        job_id = response.json()['job_id']
+        deadline = time.perf_counter() + self.args.job_timeout
+        while time.perf_counter() < deadline:
+            status = self.request('GET /predict/status', 'GET', f'/predict/status/{job_id}')
+            state = status.json()['status'] if status is not None else None
+            if state == 'SUCCESS':
+                self.recorder.add(f'job {job_name}', time.perf_counter() - submitted_at)
+                return
+            if state == 'FAILURE':
+                break
+            time.sleep(self.args.poll_interval)
+        self.recorder.add(f'job {job_name}', time.perf_counter() - submitted_at, 500)
+
+    def run(self, op):
+        start = time.perf_counter()
+        if op == 'components':
+            self.request('GET /components', 'GET', '/components/')
+        elif op == 'blend_manual':
+            response = self.request('POST /predict/blend_manual', 'POST', '/predict/blend_manual',
+                                    json={'components': self.blend_components()})
+            self.wait_for(op, response, start)
+        elif op == 'blend_batch':
+            response = self.request('POST /predict/blend_batch', 'POST', '/predict/blend_batch',
+                                    files={'file': ('loadtest.csv', self.batch_csv(), 'text/csv')})
+            self.wait_for(op, response, start)
+        elif op == 'estimate_fractions':
+            body = {
+                'components': self.blend_components(),
+                'target_properties': self.rng.normal(size=N_PROPERTIES).tolist(),
+                'n_trials': self.args.n_trials,
+            }
+            response = self.request('POST /predict/estimate_fractions', 'POST', '/predict/estimate_fractions', json=body)
+            self.wait_for(op, response, start)
+
+
+def run_load(base_url, args):
+    mix = parse_mix(args.mix)
+    ops = list(mix)
+    weights = np.array([mix[op] for op in ops])
+    weights = weights / weights.sum()
+
+    components = httpx.get(f'{base_url}/components/', timeout=30).json()
+    if not components:
+        raise SystemExit("No components in the catalog to build blends from.")
+
+    recorder = Recorder()
+    deadline = time.perf_counter() + args.duration
+
+    def user_loop(user_idx):
+        rng = np.random.default_rng(args.seed + user_idx)
+        user = VirtualUser(base_url, args, recorder, components, rng)
+        while time.perf_counter() < deadline:
+            user.run(rng.choice(ops, p=weights))
+
+    print(f"{args.users} users for {args.duration:.0f}s, mix: {', '.join(f'{op}={w:.2f}' for op, w in zip(ops, weights))}")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        list(pool.map(user_loop, range(args.users)))
+    # Jobs still in flight at the deadline are waited for, so use the real elapsed time
+    recorder.report(time.perf_counter() - start)
+
+
+def main():
+    args = parse_args()
+    if args.url:
+        run_load(args.url.rstrip('/'), args)
+        return
+    with LocalStack(args) as stack:
+        run_load(stack.url, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+import io
+import csv
+import json
+from pydantic import ValidationError
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+N_PROPERTIES = 10
+CSV_COLUMNS = ['id', 'name', 'cost'] + [f'Property{j}' for j in range(1, N_PROPERTIES + 1)]
+
+
+# --- Import ---
+def rows_from_csv(text):
+    """
+    Parses a catalog CSV (columns: id, name, cost, Property1..Property10) into
+    row dicts shaped like the JSON bulk body. A row with fewer or more cells
+    than the header keeps the properties it has (see `stream_csv`).
+    """
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [c for c in CSV_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Missing CSV columns: {', '.join(missing)}")
+    rows = []
+    for record in reader:
+        row = {'id': record['id'], 'name': record['name'], 'cost': record['cost']}
+        # Missing trailing cells are None, extra ones are under the None key
+        properties = [record[f'Property{j}'] for j in range(1, N_PROPERTIES + 1) if record[f'Property{j}'] is not None]
+        properties += record.get(None) or []
+        # Empty cells are left to validation
+        row['properties'] = [p if p not in (None, '') else None for p in properties]
+        rows.append(row)
+    return rows
+
+
+def validate_rows(rows, model_cls):
+    """
+    Validates each row against model_cls. Returns (docs, errors): Mongo
+    documents keyed by id, and per-row errors for invalid or duplicate rows.
+    """
+    docs, errors = [], []
+    seen = {}
+    for idx, row in enumerate(rows):
+        try:
+            item = model_cls.model_validate(row)
+        except ValidationError as e:
+            errors.append({
+                'row': idx,
+                'id': row.get('id') if isinstance(row, dict) else None,
+                'error': '; '.join(
+                    f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" if err['loc'] else err['msg'] for err in e.errors()
+                ),
+            })
+            continue
+        if item.id in seen:
+            errors.append({'row': idx, 'id': item.id, 'error': f"Duplicate id, already given in row {seen[item.id]}"})
+            continue
+        seen[item.id] = idx
+        doc = item.model_dump()
+        doc['_id'] = item.id
+        docs.append((idx, doc))
+    return docs, errors
+
+
+def bulk_upsert(collection, docs, errors):
+    """
+    Replaces or inserts every (row, doc) in one unordered bulk_write. Write
+    errors are added to `errors` with their row number.
+    """
+    summary = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    if not docs:
+        return summary
+    requests = [ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for _, doc in docs]
+    try:
+        result = collection.bulk_write(requests, ordered=False)
+        details = result.bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for err in details.get('writeErrors', []):
+            row, doc = docs[err['index']]
+            errors.append({'row': row, 'id': doc['_id'], 'error': err.get('errmsg', 'Write failed')})
+    summary['inserted'] = details.get('nUpserted', 0)
+    summary['updated'] = details.get('nModified', 0)
+    summary['unchanged'] = details.get('nMatched', 0) - details.get('nModified', 0)
+    return summary
+
+
+def import_rows(collection, rows, model_cls):
+    docs, errors = validate_rows(rows, model_cls)
+    summary = bulk_upsert(collection, docs, errors)
+    errors.sort(key=lambda e: e['row'])
+    return {'received': len(rows), **summary, 'errors': errors}
+
+
+# --- Export ---
+def stream_csv(docs):
+    """
+    Yields the catalog CSV chunk by chunk (same columns as the import). A
+    document without exactly N_PROPERTIES properties is written as-is, with
+    fewer or more cells than the header, and `rows_from_csv` reads it back
+    unchanged.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    for n, doc in enumerate(docs, 1):
+        properties = list(doc.get('properties') or [])
+        writer.writerow([doc['_id'], doc.get('name'), doc.get('cost', 0.0)] + properties)
+        if n % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+    yield buffer.getvalue()
+
+
+def stream_json(docs):
+    """Yields the catalog as a JSON array, chunk by chunk."""
+    parts = ['[']
+    for n, doc in enumerate(docs):
+        item = {'id': doc['_id'], 'name': doc.get('name'), 'cost': doc.get('cost', 0.0),
+                'properties': doc.get('properties', [])}
+        parts.append((',' if n else '') + json.dumps(item))
+        if len(parts) >= 500:
+            yield ''.join(parts)
+            parts = []
+    parts.append(']')
+    yield ''.join(parts)
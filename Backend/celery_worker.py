@@ -1,16 +1,23 @@
-from celery import Celery
+from celery import Celery, chord, group
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown, task_prerun, task_postrun
 import time
 import random
 import csv
 import os
 import database
-from model.trained_tabpfn import TrainedTabPFN
+from model.trained_tabpfn import TrainedTabPFN, TARGET_COLUMNS
+from model.student import StudentModel, student_available
+from model.residency import get_residency_manager
+from shared_matrix import SharedFeatureMatrix, frame_from_handle, untrack_attached
 from tqdm import tqdm, trange
 import numpy as np
 import pandas as pd
 import subprocess
+import tempfile
+import threading
 import torch
 import multiprocessing as mp
+import billiard
 from itertools import cycle
 from pathlib import Path
 from tabpfn.model.loading import (
@@ -19,10 +26,25 @@ from tabpfn.model.loading import (
 )
 import json
 import pickle
+from kombu.utils.encoding import bytes_to_str
 from sklearn.metrics import mean_absolute_percentage_error
 import optuna
+from config import settings
+import serialization
+import admission
+import sensitivity
+import simplex_index
+import profiling
+import result_store
+import tracing
+from estimation import (
+    warm_start_candidates, fractions_to_params,
+    resolve_bounds, free_indices, constrained_fractions, align_target_properties,
+    component_costs, best_trials_per_target,
+)
 
 tabPFN_model = None
+student_model = None
 redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 celery_app = Celery(
     "tasks",
@@ -30,6 +52,14 @@ celery_app = Celery(
     backend=redis_url
 )
 
+# Task arguments and results (e.g. large batch results) go through orjson
+serialization.register_celery_serializer()
+celery_app.conf.update(
+    task_serializer='orjson',
+    result_serializer='orjson',
+    accept_content=['orjson', 'json'],
+)
+
 
 
 # It's a good practice to set the start method for multiprocessing, especially with CUDA.
@@ -40,44 +70,294 @@ try:
 except RuntimeError:
     pass
 
+def prediction_devices():
+    """
+    Devices and pool size of the prediction scripts: one pool worker per GPU,
+    or PREDICT_CPU_WORKERS on the CPU if there is none (pool size 0 = no capacity).
+    """
+    num_gpus = torch.cuda.device_count()
+    if num_gpus > 0:
+        return [f'cuda:{i}' for i in range(num_gpus)], num_gpus
+    if settings.PREDICT_CPU_WORKERS > 0:
+        return ['cpu'], settings.PREDICT_CPU_WORKERS
+    return [], 0
+
+
 # --- WORKER FUNCTION ---
+_worker_device = None
+
+
+def _init_prediction_worker(devices, pool_size, trace_parent=None, persistent=False):
+    """
+    Pool initializer: pins each worker to one device, so a model is only kept
+    resident once per worker, and sizes the worker's model memory budget.
+    The worker's task spans are children of `trace_parent` (the script's span).
+    The workers of a persistent pool also load the node's hottest models.
+    """
+    global _worker_device
+    identity = mp.current_process()._identity
+    worker_idx = identity[0] - 1 if identity else 0
+    _worker_device = devices[worker_idx % len(devices)]
+    get_residency_manager(pool_size, role='pool' if persistent else 'job_pool')
+    profiling.init_worker()
+    tracing.setup('pool-worker', simple=True)
+    tracing.attach(trace_parent)
+    if persistent:
+        # billiard workers have their own resource tracker (see shared_matrix.py)
+        untrack_attached()
+        preload_models(_worker_device)
+
+
 # This function will be executed in a separate process.
 def _load_and_predict_worker(args):
     """
     Worker function to load a model on a specific device and run a prediction.
     """
-    model_path, model_type, device, X_df, used_features, col_name, fold_idx = args
-
-    # 1. Load the model onto the assigned GPU
-    if model_type == 'tabpfn':
-        model = load_fitted_tabpfn_model(Path(model_path), device=device)
-    elif model_type == 'pickle':
-        with open(model_path, 'rb') as f:
-            model = pickle.load(f)
-        # Manually move the model to the target device if it's a PyTorch model
-        if hasattr(model, 'to'):
-            model.to(device)
-    else:
-        raise ValueError(f"Unknown model type: {model_type}")
+    return profiling.worker_call(_predict_task, args)
+
 
-    # 2. Prepare data (same logic as before)
-    X_test = X_df.drop(used_features + (['ID'] if 'ID' in X_df.columns else []), axis=1)
+def _predict_task(args):
+    model_path, model_type, device, X_ref, columns, col_name, fold_idx, row_range = args
+    device = _worker_device or device
 
-    # 3. Predict
-    prediction = model.predict(X_test)
+    with tracing.span('pool_task', target=col_name, fold=int(fold_idx), rows=row_range[1] - row_range[0], device=device):
+        # 1. Load the model onto the assigned GPU (or reuse it if it's still resident)
+        with tracing.span('model_load', model=os.path.basename(model_path)):
+            model = get_residency_manager().get(model_path, model_type, device)
+
+        # 2. Prepare data: only the model's columns of this task's rows
+        if isinstance(X_ref, dict):
+            X_test = frame_from_handle(X_ref, columns, row_range)
+        else:
+            X_test = X_ref[columns].iloc[row_range[0]:row_range[1]]
+
+        # 3. Predict
+        with tracing.span('predict'):
+            prediction = model.predict(X_test)
 
     # 4. Return the result along with identifiers to re-assemble later
-    return (fold_idx, col_name, prediction)
+    return (fold_idx, col_name, prediction, row_range)
+
+
+def preload_models(device):
+    """Loads the node's MODEL_PRELOAD_COUNT most frequently used models into this process."""
+    if settings.MODEL_PRELOAD_COUNT <= 0:
+        return
+    tabpfn_model = TrainedTabPFN()
+    candidates = []
+    for col in tabpfn_model.target_columns:
+        for fold_idx in range(5):
+            model_path, model_type = tabpfn_model.models[col][fold_idx][0]
+            candidates.append((model_path, model_type, device))
+    get_residency_manager().preload(candidates, settings.MODEL_PRELOAD_COUNT)
+
+
+# --- Persistent prediction pool (PREDICTION_POOL='persistent') ---
+# The prediction scripts start a pool per job, so whatever their workers load
+# is gone when the job ends. Instead each Celery worker process keeps one pool
+# for its lifetime and runs its full/preview predictions on it; the models
+# stay resident in the pool workers across jobs.
+_prediction_pool = None  # (pool, devices, pool_size)
+_prediction_pool_lock = threading.Lock()
+
+
+def get_prediction_pool():
+    """This process's prediction pool, started on first use (shared by the threads of a threads pool)."""
+    global _prediction_pool
+    with _prediction_pool_lock:
+        if _prediction_pool is None:
+            devices, pool_size = prediction_devices()
+            if pool_size == 0:
+                raise Exception("No GPUs found on worker.")
+            # billiard (Celery's fork of multiprocessing): prefork worker
+            # processes are daemonic, and the stdlib won't start children there
+            pool = billiard.get_context('spawn').Pool(
+                processes=pool_size, initializer=_init_prediction_worker, initargs=(devices, pool_size, None, True),
+            )
+            _prediction_pool = (pool, devices, pool_size)
+        return _prediction_pool
+
+
+def close_prediction_pool():
+    global _prediction_pool
+    if _prediction_pool is not None:
+        pool = _prediction_pool[0]
+        _prediction_pool = None
+        pool.terminate()
+        pool.join()
+
+
+def _run_pool_task(job_task):
+    """Persistent pool task: `_predict_task` under the trace and profile of its job."""
+    trace_parent, profile_dir, args = job_task
+    with tracing.attached(trace_parent):
+        return profiling.pool_call(_predict_task, args, profile_dir)
+
+
+def _pool_predict(X_ref, n_rows, quality='full', targets=None, on_progress=None, chunk_rows=0):
+    """
+    Runs the fold x target models of `quality`/`targets` on the persistent pool.
+    X_ref is the feature DataFrame or a SharedFeatureMatrix handle.
+    Returns (predictions of shape (n_rows, n_targets), folds_by_target).
+    """
+    global tabPFN_model
+    if tabPFN_model is None:
+        tabPFN_model = TrainedTabPFN()
+    pool, devices, pool_size = get_prediction_pool()
+    folds_by_target = tabPFN_model.select_folds(quality, targets)
+    tasks = tabPFN_model.prediction_tasks(X_ref, devices, folds_by_target, chunk_rows)
+
+    results_map = {}
+    # The pool outlives the job: its trace and profile go with every task
+    with tracing.span('pool_predict', tasks=len(tasks), pool_size=pool_size):
+        job_tasks = [(tracing.carrier(), profiling.current_dir(), task) for task in tasks]
+        for i, result in enumerate(pool.imap_unordered(_run_pool_task, job_tasks)):
+            tabPFN_model.collect(results_map, result, n_rows)
+            if on_progress is not None:
+                on_progress(int(((i + 1) / len(tasks)) * 100))
+
+    with tracing.span('aggregate', rows=n_rows):
+        return tabPFN_model.combine(results_map, folds_by_target), folds_by_target
+
+
+def predict_blend_in_pool(request_data, on_progress=None):
+    """Single blend prediction on the persistent pool (as predict_worker_script.py)."""
+    global tabPFN_model
+    if tabPFN_model is None:
+        tabPFN_model = TrainedTabPFN()
+    quality = request_data.get('quality', 'full')
+    with tracing.span('preprocess'):
+        X = tabPFN_model.preprocess(tabPFN_model.components_frame(request_data.get('components')))
+    predictions, folds_by_target = _pool_predict(X, len(X), quality, request_data.get('targets'), on_progress)
+    return {
+        "blended_properties": [float(v) for v in predictions[0]],
+        "confidence_score": random.random(),
+        "model_version": "v1.0-async-multiGPU-pool",
+        "quality": quality,
+        "targets": list(folds_by_target)
+    }
+
+
+def predict_file_in_pool(file_path, quality='full', targets=None, on_progress=None):
+    """Batch prediction of a CSV file on the persistent pool (as predict_batch_worker.py)."""
+    global tabPFN_model
+    if tabPFN_model is None:
+        tabPFN_model = TrainedTabPFN()
+    input_df = pd.read_csv(file_path)
+    with tracing.span('preprocess', rows=len(input_df)):
+        X = tabPFN_model.preprocess(input_df)
+    # X is placed in shared memory once; the tasks only carry its handle
+    with SharedFeatureMatrix(X) as shared_X:
+        predictions, folds_by_target = _pool_predict(
+            shared_X.handle, len(X), quality, targets, on_progress, settings.PREDICT_CHUNK_ROWS,
+        )
+    return [
+        {
+            "blended_properties": [float(v) for v in row],
+            "confidence_score": random.random(),
+            "model_version": "v1.0-multiGPU-batch",
+            "quality": quality,
+            "targets": list(folds_by_target)
+        }
+        for row in predictions
+    ]
+
+
+@worker_process_init.connect
+def preload_hot_models(**kwargs):
+    """
+    Preloads the hottest models where jobs will use them: into the persistent
+    pool (started right away) and, with fan-out, into the worker process itself,
+    which runs the model sub-tasks. Without either, nothing would keep them.
+    """
+    if settings.MODEL_PRELOAD_COUNT <= 0:
+        return
+    if settings.PREDICTION_POOL == 'persistent':
+        get_prediction_pool()
+    if settings.PREDICTION_FANOUT != 'local':
+        get_residency_manager(role='celery')
+        preload_models('cuda:0' if torch.cuda.is_available() else 'cpu')
+
+@worker_process_shutdown.connect
+def stop_prediction_pool(**kwargs):
+    close_prediction_pool()
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_history_log(**kwargs):
+    """Writes the buffered history entries before the worker (process) exits."""
+    database.history_writer.close()
+
+@task_prerun.connect
+def start_job_profile(task_id=None, task=None, **kwargs):
+    """Profiles jobs sent with the 'profile' header (see profiling.py)."""
+    if getattr(task.request, 'profile', None):
+        profiling.start_job(task_id)
+
+@task_postrun.connect
+def finish_job_profile(task_id=None, **kwargs):
+    profiling.finish_job(task_id)
+
+@task_prerun.connect
+def start_task_span(task_id=None, task=None, **kwargs):
+    """Continues the trace sent in the task headers (see tracing.py)."""
+    tracing.setup('worker')
+    traceparent = getattr(task.request, 'traceparent', None)
+    tracing.start_task(task_id, task.name, {'traceparent': traceparent} if traceparent else None)
+
+@task_postrun.connect
+def finish_task_span(task_id=None, state=None, **kwargs):
+    tracing.finish_task(task_id, state)
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_spans(**kwargs):
+    tracing.shutdown()
+
+@task_postrun.connect
+def release_admission_slot(task_id=None, state=None, **kwargs):
+    """Frees the job's in-flight slot once its task has finished."""
+    # A task replaced by a chord (fan-out) finishes as IGNORED; the job keeps
+    # its slot until the chord callback, which runs under the same task id,
+    # or its error callback (fail_distributed_prediction).
+    if state == 'IGNORED':
+        return
+    admission.release(task_id, completed=(state == 'SUCCESS'))
 
 # Assume celery_app and TrainedTabPFN are defined
 # and a global tabPFN_model instance is initialized elsewhere.
 
 
-@celery_app.task(bind=True)
-def run_single_prediction(self, request_data):
-    print(request_data)
-    # This task now DELEGATES the work to the standalone script.
-    
+def get_student_model():
+    """Loads the distilled student model once per worker process."""
+    global student_model
+    if student_model is None:
+        if not student_available():
+            raise Exception("The 'fast' quality tier is not available: run `python -m model.distill` first.")
+        student_model = StudentModel.load()
+    return student_model
+
+
+def predict_with_student(request_data):
+    """Single blend prediction through the distilled student (quality='fast')."""
+    student = get_student_model()
+    targets = request_data.get('targets') or student.target_columns
+    prediction = student.predict_components(request_data['components'], targets)[0]
+    return {
+        "blended_properties": [float(v) for v in prediction],
+        "confidence_score": random.random(),
+        "model_version": "v1.0-student",
+        "quality": "fast",
+        "targets": list(targets),
+        "student_error": student.error_summary(),
+    }
+
+
+def _run_prediction_script(request_data, on_progress=None):
+    """
+    Runs predict_worker_script.py for a single blend and returns its result.
+    `on_progress` is called with the script's progress (0-100).
+    """
     # We pass the data to the script via standard input as a JSON string.
     # We must wrap the request_data to avoid confusion with progress messages.
     payload = json.dumps({"request_data": request_data})
@@ -96,6 +376,7 @@ def run_single_prediction(self, request_data):
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
         text=True, # Work with text streams (encoding handled automatically)
+        env=tracing.child_env(profiling.child_env()),  # None (inherit) unless the job is profiled or traced
     )
 
     # Write the payload to the script's stdin and close it.
@@ -110,10 +391,11 @@ def run_single_prediction(self, request_data):
         
         try:
             # Each line from the script is a JSON object
-            message = json.loads(line.strip())
+            message = serialization.loads(line.strip())
             
             if message.get("type") == "progress":
-                self.update_state(state='PROGRESS', meta={'progress': message["value"]})
+                if on_progress is not None:
+                    on_progress(message["value"])
             elif message.get("type") == "result":
                 final_result = message["data"]
             elif message.get("type") == "error":
@@ -132,70 +414,137 @@ def run_single_prediction(self, request_data):
         
     if final_result is None:
         raise Exception("Prediction script finished without producing a result.")
+    return final_result
+
+
+def _predict_blend(request_data, on_progress=None):
+    """Full/preview single blend prediction, on the persistent pool or through the script (PREDICTION_POOL)."""
+    if settings.PREDICTION_POOL == 'persistent':
+        return predict_blend_in_pool(request_data, on_progress)
+    return _run_prediction_script(request_data, on_progress)
+
+
+@celery_app.task(bind=True)
+def run_single_prediction(self, request_data):
+    print(request_data)
+    if request_data.get('quality') == 'fast':
+        final_result = predict_with_student(request_data)
+    else:
+        final_result = _predict_blend(
+            request_data,
+            on_progress=lambda value: self.update_state(state='PROGRESS', meta={'progress': value}),
+        )
 
     # Your database logging logic
     database.add_history_log("blender", request_data, final_result)
     
     return {'progress': 100, 'result': final_result}
 
+def predict_batch_with_student(file_path, targets=None):
+    """Batch prediction through the distilled student (quality='fast')."""
+    student = get_student_model()
+    targets = targets or student.target_columns
+    input_df = pd.read_csv(file_path)
+    predictions = student.predict(input_df, targets)
+    return [
+        {
+            "blended_properties": [float(v) for v in row],
+            "confidence_score": random.random(),
+            "model_version": "v1.0-student",
+            "quality": "fast",
+            "targets": list(targets)
+        }
+        for row in predictions
+    ]
+
+
+def _run_batch_script(file_path, quality='full', targets=None, on_progress=None):
+    """
+    Runs predict_batch_worker.py on a CSV file and returns its list of row results.
+    `on_progress` is called with the script's progress (0-100).
+    """
+    final_result_list = None
+
+    # --- 1. Command to execute the worker script with the file path ---
+    command = ['python3', 'predict_batch_worker.py', '--file-path', file_path, '--quality', quality]
+    if targets:
+        command += ['--targets', ','.join(targets)]
+    
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE,  # stdin is not used, but Popen requires it
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env=tracing.child_env(profiling.child_env()),
+    )
+
+    # We are not writing to stdin, so we can close it immediately.
+    process.stdin.close()
+    
+    # --- 2. Read progress and results from the script's output ---
+    while True:
+        line = process.stdout.readline()
+        if not line:
+            break
+        
+        try:
+            message = serialization.loads(line.strip())
+            
+            if message.get("type") == "progress":
+                if on_progress is not None:
+                    on_progress(message["value"])
+            elif message.get("type") == "result":
+                final_result_list = message["data"] # This will be a list of dicts
+            elif message.get("type") == "error":
+                raise Exception(f"Prediction script error: {message.get('message')}")
+        
+        except (json.JSONDecodeError, KeyError) as e:
+            print(f"Warning: Could not parse line from subprocess: {line.strip()}. Error: {e}")
+
+    # --- 3. Wait for process to finish and check for errors ---
+    process.wait()
+    if process.returncode != 0:
+        stderr_output = process.stderr.read()
+        raise Exception(f"Prediction script failed with exit code {process.returncode}:\n{stderr_output}")
+        
+    if final_result_list is None:
+        raise Exception("Prediction script finished without producing a result.")
+    return final_result_list
+
+
+def _predict_file(file_path, quality='full', targets=None, on_progress=None):
+    """Full/preview batch prediction of a CSV file, on the persistent pool or through the script (PREDICTION_POOL)."""
+    if settings.PREDICTION_POOL == 'persistent':
+        return predict_file_in_pool(file_path, quality, targets, on_progress)
+    return _run_batch_script(file_path, quality, targets, on_progress)
+
+
 @celery_app.task(bind=True)
-def run_batch_prediction(self, file_path: str, original_filename: str):
+def run_batch_prediction(self, file_path: str, original_filename: str, quality: str = 'full', targets=None):
     """
-    Background task to process an uploaded CSV file using a separate, multi-GPU process.
+    Background task to process an uploaded CSV file on the multi-GPU prediction pool.
     """
     global tabPFN_model
     if tabPFN_model is None:
         # This is a lightweight initialization of paths, so it's fine here.
         tabPFN_model = TrainedTabPFN()
 
-    final_result_list = None
     try:
-        # --- 1. Command to execute the worker script with the file path ---
-        command = ['python3', 'predict_batch_worker.py', '--file-path', file_path]
-        
-        process = subprocess.Popen(
-            command,
-            stdin=subprocess.PIPE,  # stdin is not used, but Popen requires it
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-        )
-
-        # We are not writing to stdin, so we can close it immediately.
-        process.stdin.close()
-        
-        # --- 2. Read progress and results from the script's output ---
-        while True:
-            line = process.stdout.readline()
-            if not line:
-                break
-            
-            try:
-                message = json.loads(line.strip())
-                
-                if message.get("type") == "progress":
-                    self.update_state(state='PROGRESS', meta={'progress': message["value"]})
-                elif message.get("type") == "result":
-                    final_result_list = message["data"] # This will be a list of dicts
-                elif message.get("type") == "error":
-                    raise Exception(f"Prediction script error: {message.get('message')}")
-            
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"Warning: Could not parse line from subprocess: {line.strip()}. Error: {e}")
-
-        # --- 3. Wait for process to finish and check for errors ---
-        process.wait()
-        if process.returncode != 0:
-            stderr_output = process.stderr.read()
-            raise Exception(f"Prediction script failed with exit code {process.returncode}:\n{stderr_output}")
-            
-        if final_result_list is None:
-            raise Exception("Prediction script finished without producing a result.")
+        if quality == 'fast':
+            final_result_list = predict_batch_with_student(file_path, targets)
+        else:
+            final_result_list = _predict_file(
+                file_path, quality, targets,
+                on_progress=lambda value: self.update_state(state='PROGRESS', meta={'progress': value}),
+            )
+        # Also kept as a matrix for /predict/result paging
+        result_store.save(self.request.id, final_result_list)
 
         # --- 4. Log to database and return final result ---
         database.add_history_log(
             "blender_batch", 
-            {"filename": original_filename}, 
+            {"filename": original_filename, "quality": quality, "targets": targets}, 
             {"results": final_result_list}
         )
 
@@ -206,13 +555,308 @@ def run_batch_prediction(self, file_path: str, original_filename: str):
         if os.path.exists(file_path):
             os.remove(file_path)
 
+def predict_rows(input_df, quality='full', targets=None, on_progress=None):
+    """
+    Multi-row prediction through `_predict_file` (the student for
+    'fast'). Returns (predictions of shape (n_rows, n_targets), targets).
+    """
+    fd, file_path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        input_df.to_csv(file_path, index=False)
+        if quality == 'fast':
+            rows = predict_batch_with_student(file_path, targets)
+        else:
+            rows = _predict_file(file_path, quality, targets, on_progress)
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    return np.array([row['blended_properties'] for row in rows]), rows[0]['targets']
+
+
+@celery_app.task(bind=True)
+def run_sensitivity_analysis(self, request_data):
+    return sensitivity_analysis(request_data, self.update_state)
+
+
+def sensitivity_analysis(request_data, update_state, predict=predict_rows):
+    """
+    Fraction -> property Jacobian around the requested blend, from one batched
+    prediction of all perturbed blends (see sensitivity.py).
+    `predict(input_df, quality, targets, on_progress)` returns (predictions, targets).
+    """
+    global tabPFN_model
+    if tabPFN_model is None:
+        tabPFN_model = TrainedTabPFN()
+
+    components = request_data['components']
+    quality = request_data.get('quality', 'full')
+    step = request_data.get('step', 1.0)
+    rows, plan = sensitivity.perturbation_rows([c['fraction'] for c in components], step)
+    input_df = tabPFN_model.blends_frame(components, rows)
+
+    predictions, targets = predict(
+        input_df, quality, request_data.get('targets'),
+        on_progress=lambda value: update_state(state='PROGRESS', meta={'progress': value}),
+    )
+    final_result = {
+        "base_fractions": [float(f) for f in rows[0]],
+        "blended_properties": [float(v) for v in predictions[0]],
+        # jacobian[t][i]: change of targets[t] per percentage point of components[i]
+        "jacobian": sensitivity.jacobian(predictions, plan).tolist(),
+        "components": [c['name'] for c in components],
+        "targets": list(targets),
+        "step": step,
+        "rows_evaluated": len(rows),
+        "quality": quality,
+    }
+    database.add_history_log("sensitivity", request_data, final_result)
+    return {'progress': 100, 'result': final_result}
+
+@celery_app.task(bind=True)
+def run_simplex_index_build(self, request_data):
+    return build_simplex_index(request_data, self.update_state)
+
+
+def build_simplex_index(request_data, update_state, predict=predict_rows):
+    """Predicts and saves the simplex grid of a component set (see simplex_index.py)."""
+    global tabPFN_model
+    if tabPFN_model is None:
+        tabPFN_model = TrainedTabPFN()
+    summary = simplex_index.build(
+        request_data['components'], predict, tabPFN_model, request_data['n_points'], request_data.get('quality', 'full'),
+        on_progress=lambda value: update_state(state='PROGRESS', meta={'progress': value}),
+    )
+    return {'progress': 100, 'result': summary}
+
+# --- Cluster-wide fan-out (PREDICTION_FANOUT='target' or 'fold_target') ---
+# Instead of one subprocess running all fold x target models on one machine,
+# the models are split into sub-tasks that any worker can pick up, joined by a
+# chord callback that applies the fold weights.
+
+def _fanout_keys(job_id):
+    return f"fanout-done-{job_id}", f"fanout-total-{job_id}"
+
+
+def _fanout_input_key(job_id):
+    return f"fanout-X-{job_id}"
+
+
+def _clear_fanout(job_id):
+    for key in _fanout_keys(job_id) + (_fanout_input_key(job_id),):
+        celery_app.backend.delete(key)
+
+
+# Feature matrix of the last fanned-out job this process ran sub-tasks of
+_fanout_input = {}
+
+
+def fanout_input(job_id):
+    """The feature matrix of a fanned-out job, fetched from the result backend once per process."""
+    global _fanout_input
+    X = _fanout_input.get(job_id)
+    if X is None:
+        raw = celery_app.backend.get(_fanout_input_key(job_id))
+        if raw is None:
+            raise Exception(f"The input of job {job_id} is no longer stored.")
+        payload = serialization.loads(raw)
+        X = pd.DataFrame(payload['data'], columns=payload['columns'])
+        _fanout_input = {job_id: X}
+    return X
+
+
+def fanout_progress(job_id):
+    """Progress (0-100) of a fanned-out job, from the sub-task counters in the result backend."""
+    done_key, total_key = _fanout_keys(job_id)
+    try:
+        total = celery_app.backend.get(total_key)
+        if not total:
+            return None
+        done = celery_app.backend.get(done_key) or 0
+        return int(int(done) / int(total) * 100)
+    except Exception as e:
+        print(f"Warning: Could not read fan-out progress: {e}")
+        return None
+
+
+def job_states(job_ids):
+    """
+    (state, info, result, fan-out progress) of many jobs, fetched with a single
+    MGET of their result metas and fan-out counters. Falls back to one
+    AsyncResult per job on result backends without mget.
+    """
+    backend = celery_app.backend
+    if not hasattr(backend, 'mget') or not hasattr(backend, 'get_key_for_task'):
+        results = [celery_app.AsyncResult(job_id) for job_id in job_ids]
+        return [(r.state, r.info, r.result, fanout_progress(r.id)) for r in results]
+
+    keys = [backend.get_key_for_task(job_id) for job_id in job_ids]
+    for job_id in job_ids:
+        keys.extend(_fanout_keys(job_id))
+    values = backend.mget(keys)
+    if hasattr(values, 'items'):
+        # Some stores (e.g. the cache backend) return a key -> value dict
+        values = [values.get(key, values.get(bytes_to_str(key))) for key in keys]
+    n = len(job_ids)
+
+    states = []
+    for i in range(n):
+        meta = backend.decode_result(values[i]) if values[i] is not None else {'status': 'PENDING', 'result': None}
+        done, total = values[n + 2 * i], values[n + 2 * i + 1]
+        progress = int(int(done or 0) / int(total) * 100) if total and int(total) else None
+        # As AsyncResult: `info` and `result` are both the meta's result
+        states.append((meta['status'], meta.get('result'), meta.get('result'), progress))
+    return states
+
+
+def _fanout_assignments(folds_by_target, mode):
+    """Groups of [target, fold] pairs, one per sub-task: per target or per (fold, target)."""
+    if mode == 'fold_target':
+        return [[[col, fold_idx]] for col, folds in folds_by_target.items() for fold_idx in folds]
+    return [[[col, fold_idx] for fold_idx in folds] for col, folds in folds_by_target.items()]
+
+
+@celery_app.task(bind=True)
+def run_distributed_prediction(self, job):
+    """
+    Fans a single or batch prediction out as a chord of model sub-tasks.
+    job: {'kind': 'single', 'request_data': ...} or
+         {'kind': 'batch', 'file_path': ..., 'filename': ..., 'quality': ..., 'targets': ...}
+    The job id's result is the one of `assemble_distributed_prediction`.
+    The feature matrix is stored once in the result backend; the sub-tasks
+    only carry the job id.
+    """
+    global tabPFN_model
+    if tabPFN_model is None:
+        tabPFN_model = TrainedTabPFN()
+
+    job_id = self.request.id
+    if job['kind'] == 'single':
+        quality = job['request_data'].get('quality', 'full')
+        targets = job['request_data'].get('targets')
+        input_df = tabPFN_model.components_frame(job['request_data']['components'])
+    else:
+        quality = job.get('quality', 'full')
+        targets = job.get('targets')
+        try:
+            input_df = pd.read_csv(job['file_path'])
+        finally:
+            if os.path.exists(job['file_path']):
+                os.remove(job['file_path'])
+
+    X = tabPFN_model.preprocess(input_df).drop(columns=['ID'], errors='ignore')
+    folds_by_target = tabPFN_model.select_folds(quality, targets)
+    assignments = _fanout_assignments(folds_by_target, settings.PREDICTION_FANOUT)
+
+    done_key, total_key = _fanout_keys(job_id)
+    celery_app.backend.set(done_key, 0)
+    celery_app.backend.set(total_key, sum(len(a) for a in assignments))
+    self.update_state(state='PROGRESS', meta={'progress': 0})
+
+    X_payload = {'columns': list(X.columns), 'data': np.ascontiguousarray(X.to_numpy())}
+    celery_app.backend.set(_fanout_input_key(job_id), serialization.dumps(X_payload))
+    job = dict(job, quality=quality, folds_by_target=folds_by_target, n_rows=len(X))
+    # The sub-tasks and the callback continue this task's trace
+    trace_headers = tracing.carrier()
+    callback = assemble_distributed_prediction.s(job_id, job).set(headers=trace_headers)
+    # Runs instead of the callback if a sub-task fails (and if the callback does)
+    callback.link_error(fail_distributed_prediction.s(job_id))
+    return self.replace(chord(
+        group(predict_model_group.s(job_id, assignment).set(headers=trace_headers) for assignment in assignments),
+        callback,
+    ))
+
+
+@celery_app.task
+def predict_model_group(job_id, assignment):
+    """Chord header task: runs the [target, fold] models of `assignment` on this worker."""
+    global tabPFN_model
+    if tabPFN_model is None:
+        tabPFN_model = TrainedTabPFN()
+
+    X = fanout_input(job_id)
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    done_key, _ = _fanout_keys(job_id)
+
+    results = []
+    for col, fold_idx in assignment:
+        model_info, used_features = tabPFN_model.models[col][fold_idx]
+        model_path, model_type = model_info
+        with tracing.span('model_load', model=os.path.basename(model_path), target=col, fold=int(fold_idx)):
+            model = get_residency_manager(role='celery').get(model_path, model_type, device)
+        X_test = X.drop(columns=used_features)
+        with tracing.span('predict', target=col, fold=int(fold_idx), rows=len(X_test)):
+            results.append([fold_idx, col, [float(v) for v in model.predict(X_test)]])
+        celery_app.backend.incr(done_key)
+    return results
+
+
+@celery_app.task
+def assemble_distributed_prediction(group_results, job_id, job):
+    """Chord callback: re-assembles the fold predictions and applies the fold weights."""
+    global tabPFN_model
+    if tabPFN_model is None:
+        tabPFN_model = TrainedTabPFN()
+
+    n_rows = job['n_rows']
+    results_map = {}
+    with tracing.span('aggregate', rows=n_rows):
+        for group_result in group_results:
+            for fold_idx, col, prediction in group_result:
+                tabPFN_model.collect(results_map, (int(fold_idx), col, prediction, (0, n_rows)), n_rows)
+        final_pred = tabPFN_model.combine(results_map, job['folds_by_target'])
+
+    def row_result(row):
+        return {
+            "blended_properties": [float(v) for v in row],
+            "confidence_score": random.random(),
+            "model_version": "v1.0-distributed",
+            "quality": job['quality'],
+            "targets": list(job['folds_by_target'])
+        }
+
+    if job['kind'] == 'single':
+        final_result = row_result(final_pred[0])
+        database.add_history_log("blender", job['request_data'], final_result)
+    else:
+        final_result = [row_result(row) for row in final_pred]
+        result_store.save(job_id, final_result)
+        database.add_history_log(
+            "blender_batch",
+            {"filename": job['filename'], "quality": job['quality'], "targets": job.get('targets')},
+            {"results": final_result}
+        )
+
+    _clear_fanout(job_id)
+    return {'progress': 100, 'result': final_result}
+
+
+@celery_app.task
+def fail_distributed_prediction(request, exc, traceback, job_id):
+    """
+    Chord error callback: drops the progress counters and stored input of a
+    failed fan-out job, and frees its admission slot (the replaced task ended
+    as IGNORED and the callback, which would have released it, never ran).
+    """
+    print(f"Fanned-out job {job_id} failed: {exc!r}")
+    _clear_fanout(job_id)
+    admission.release(job_id, completed=False)
+
 @celery_app.task(bind=True)
 def run_fraction_estimation(self, request_data):
-    # This task now DELEGATES the work to the standalone script.
-    
-    # We pass the data to the script via standard input as a JSON string.
-    # We must wrap the request_data to avoid confusion with progress messages.
-    target_properties = request_data['target_properties']
+    # Each trial's prediction runs on the prediction pool (or script, see _predict_blend)
+    return estimate_fractions(request_data, self.update_state)
+
+
+def estimate_fractions(request_data, update_state, predict_blend=_predict_blend):
+    """
+    Optuna search for the fractions matching the target properties.
+    `update_state(state=..., meta=...)` reports progress (Celery's or embedded.py's),
+    `predict_blend(request_data, on_progress)` runs one full/preview prediction.
+    """
+    # Only the requested targets are predicted and scored
+    targets = request_data.get('targets')
+    target_properties = align_target_properties(request_data['target_properties'], targets, TARGET_COLUMNS)
     components = request_data['components']
     target_cost = request_data.get('target_cost')
     n_components = len(components)
@@ -224,58 +868,12 @@ def run_fraction_estimation(self, request_data):
     except Exception:
         db_components = {}
 
-    # Command to execute the worker script.
-    # Ensure 'python' and 'predict_worker_script.py' are in your system's PATH
-    # or use absolute paths.
-    def objective(trial, study=None):
-        x = []
-        for i in range(n_components):
-            x.append(- np.log(trial.suggest_float(f"x_{i}", 0, 1)))
-
-        p = []
-        for i in range(n_components):
-            p.append(x[i] / sum(x))
-
-        # Compute fractions (% for reporting, 0-1 for cost calc)
-        for i in range(n_components):
-            trial.set_user_attr(f"p_{i}", p[i]*100)
-            components[i]['fraction'] = p[i]*100
-
-        # Compute blend cost (weighted sum of component costs)
-        comp_costs = []
-        for i in range(n_components):
-            c = components[i]
-            cost_val = c.get('cost')
-            if cost_val is None:
-                cost_val = db_components.get(c.get('name'), 0.0)
-            try:
-                cost_val = float(cost_val)
-            except Exception:
-                cost_val = 0.0
-            comp_costs.append(cost_val)
-        blend_cost = float(np.dot(p, comp_costs))  # cost per unit volume
-        trial.set_user_attr('blend_cost', blend_cost)
-
-        
-        payload = json.dumps({"request_data": {'components':components}})
-        print(payload)
-
-        command = ['python3', 'predict_worker_script.py']
-        
-        final_result = None
-        
-        # Use Popen to have real-time communication for progress updates.
-        process = subprocess.Popen(
-            command,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True, # Work with text streams (encoding handled automatically)
-        )
+    # Only components that aren't fixed by the constraints get a sampler dimension
+    lower, upper = resolve_bounds(components, request_data.get('constraints'))
+    free = free_indices(lower, upper)
+    quality = request_data.get('quality', 'full')
 
-        # Write the payload to the script's stdin and close it.
-        process.stdin.write(payload)
-        process.stdin.close()
+    def progress_payload(study):
         # Determine current best trial by (MAPE, then Cost)
         try:
             completed = [t for t in study.trials if t.values is not None]
@@ -293,58 +891,87 @@ def run_fraction_estimation(self, request_data):
             best_value_cost = None
             best_params = None
         print(f"Current best values: MAPE={best_value_mape}, Cost={best_value_cost}, params: {best_params}")
-    
-        # Read the script's output line-by-line to get progress updates.
-        while True:
-            line = process.stdout.readline()
-            if not line:
-                break
-            
+
+        payload = {
+            'mape_score': (best_value_mape/100) if best_value_mape is not None else None,
+            'blend_cost': best_value_cost,
+            'estimated_fractions': [
+                {'name': components[idx]['name'], 'fraction': best_params[f'p_{idx}'] if best_params else None}
+                for idx in range(n_components)
+            ]
+        }
+        # Include savings percent during progress if possible
+        if target_cost and best_value_cost is not None and target_cost != 0:
             try:
-                # Each line from the script is a JSON object
-                message = json.loads(line.strip())
-                
-                if message.get("type") == "progress":
-                    progress_payload = {
-                        'mape_score': (best_value_mape/100) if best_value_mape is not None else None,
-                        'blend_cost': best_value_cost,
-                        'estimated_fractions': [
-                            {'name': components[idx]['name'], 'fraction': best_params[f'p_{idx}'] if best_params else None}
-                            for idx in range(n_components)
-                        ]
-                    }
-                    # Include savings percent during progress if possible
-                    if target_cost and best_value_cost is not None and target_cost != 0:
-                        try:
-                            savings_pct = (float(target_cost) - float(best_value_cost)) / float(target_cost) * 100.0
-                            progress_payload['savings_percent'] = savings_pct
-                        except Exception:
-                            pass
-                    self.update_state(state='PROGRESS', meta={'progress': (((trial.number+(message["value"]/100))/n_trials)*100), 'result': progress_payload})
-                elif message.get("type") == "result":
-                    final_result = message["data"]
-                elif message.get("type") == "error":
-                    # Propagate the error from the subprocess
-                    raise Exception(f"Prediction script error: {message.get('message')}")
-            
-            except (json.JSONDecodeError, KeyError) as e:
-                # Handle malformed output from the script
-                print(f"Warning: Could not parse line from subprocess: {line.strip()}. Error: {e}")
-
-        # Wait for the process to terminate and get any errors
-        process.wait()
-        if process.returncode != 0:
-            stderr_output = process.stderr.read()
-            raise Exception(f"Prediction script failed with exit code {process.returncode}:\n{stderr_output}")
-            
-        if final_result is None:
-            raise Exception("Prediction script finished without producing a result.")
+                savings_pct = (float(target_cost) - float(best_value_cost)) / float(target_cost) * 100.0
+                payload['savings_percent'] = savings_pct
+            except Exception:
+                pass
+        return payload
+
+    def objective(trial, study=None):
+        x = []
+        for i in free:
+            x.append(- np.log(trial.suggest_float(f"x_{i}", 0, 1)))
+
+        p = [float(f) / 100 for f in constrained_fractions(x, lower, upper)]
+
+        # Compute fractions (% for reporting, 0-1 for cost calc)
+        for i in range(n_components):
+            trial.set_user_attr(f"p_{i}", p[i]*100)
+            components[i]['fraction'] = p[i]*100
+
+        # Compute blend cost (weighted sum of component costs)
+        comp_costs = component_costs(components, db_components)
+        blend_cost = float(np.dot(p, comp_costs))  # cost per unit volume
+        trial.set_user_attr('blend_cost', blend_cost)
+
+        best_so_far = progress_payload(study)
+
+        def report(value):
+            update_state(state='PROGRESS', meta={'progress': (((trial.number+(value/100))/n_trials)*100), 'result': best_so_far})
+
+        if quality == 'fast':
+            final_result = predict_with_student({'components': components, 'targets': targets})
+            report(100)
+        else:
+            final_result = predict_blend(
+                {'components': components, 'quality': quality, 'targets': targets}, on_progress=report,
+            )
+
         print(target_properties, final_result['blended_properties'])
         print(trial.user_attrs)
         mape_pct = 100*mean_absolute_percentage_error(target_properties, final_result['blended_properties'])
         # Return two objectives: minimize MAPE and minimize blend cost
         return mape_pct, blend_cost
     study = optuna.create_study(directions=['minimize', 'minimize'])
+
+    # Seed the study with the best recipes of previous jobs on the same component set
+    warm_started = 0
+    if request_data.get('warm_start', True) and settings.WARM_START_TRIALS > 0:
+        try:
+            history = database.get_estimation_history([c['name'] for c in components])
+            candidates = warm_start_candidates(
+                history, components, target_properties,
+                limit=min(settings.WARM_START_TRIALS, n_trials),
+                targets=targets, all_targets=TARGET_COLUMNS,
+            )
+        except Exception as e:
+            print(f"Warning: Could not load warm start candidates: {e}")
+            candidates = []
+        for fractions in candidates:
+            params = fractions_to_params(fractions, lower, upper)
+            if params is None:
+                continue  # Recipe is outside of the current constraints
+            study.enqueue_trial(params)
+            warm_started += 1
+    # Best recipes of the simplex index, when refining its answer
+    for fractions in request_data.get('seed_fractions') or []:
+        params = fractions_to_params(fractions, lower, upper)
+        if params is not None:
+            study.enqueue_trial(params)
+    print(f"Warm-started trials: {warm_started}")
+
     study.optimize(lambda trial: objective(trial, study), n_trials=n_trials)
 
     # Choose final trial by lexicographic order (MAPE first, then Cost)
@@ -362,7 +989,10 @@ def run_fraction_estimation(self, request_data):
             for idx, comp in enumerate(request_data['components'])
         ],
         "mape_score": final_mape/100,
-        "blend_cost": final_cost
+        "blend_cost": final_cost,
+        "warm_started_trials": warm_started,
+        "quality": quality,
+        "targets": list(targets or TARGET_COLUMNS)
     }
     # Optionally include savings percent if target cost provided
     try:
@@ -373,4 +1003,140 @@ def run_fraction_estimation(self, request_data):
     # Your database logging logic
     database.add_history_log("blender", request_data, final_result)
     
-    return {'progress': 100, 'result': final_result}
\ No newline at end of file
+    return {'progress': 100, 'result': final_result}
+
+@celery_app.task(bind=True)
+def run_multi_fraction_estimation(self, request_data):
+    return estimate_fractions_multi(request_data, self.update_state)
+
+
+def estimate_fractions_multi(request_data, update_state, predict_blend=_predict_blend):
+    """
+    One Optuna search for several targets on the same component set. Each
+    candidate blend is predicted once and scored against every target (one
+    MAPE objective per target, plus cost); the best candidate per target is
+    returned. request_data['blend_targets'] holds {'name', 'target_properties',
+    'target_cost'} per target, with target_properties aligned to 'targets'.
+    """
+    targets = request_data.get('targets')
+    blend_targets = request_data['blend_targets']
+    target_matrix = [bt['target_properties'] for bt in blend_targets]
+    components = request_data['components']
+    n_components = len(components)
+    n_trials = request_data['n_trials']
+    quality = request_data.get('quality', 'full')
+
+    try:
+        db_components = {c['name']: c.get('cost', 0.0) for c in database.get_all_components()}
+    except Exception:
+        db_components = {}
+    comp_costs = component_costs(components, db_components)
+
+    lower, upper = resolve_bounds(components, request_data.get('constraints'))
+    free = free_indices(lower, upper)
+
+    # (mape_1, ..., mape_n, cost) and fractions (%) of every evaluated candidate
+    trial_values = []
+    trial_fractions = []
+
+    def target_result(idx, trial_idx):
+        bt = blend_targets[idx]
+        result = {'name': bt.get('name'), 'target_properties': bt['target_properties']}
+        if trial_idx is None:
+            return dict(result, estimated_fractions=None, mape_score=None, blend_cost=None)
+        values = trial_values[trial_idx]
+        result.update({
+            'estimated_fractions': [
+                {'name': comp['name'], 'fraction': trial_fractions[trial_idx][i]} for i, comp in enumerate(components)
+            ],
+            'mape_score': values[idx] / 100,
+            'blend_cost': values[-1],
+        })
+        target_cost = bt.get('target_cost')
+        if target_cost:
+            result['savings_percent'] = (float(target_cost) - values[-1]) / float(target_cost) * 100.0
+        return result
+
+    def best_results():
+        best = best_trials_per_target(trial_values, len(blend_targets))
+        return [target_result(idx, trial_idx) for idx, trial_idx in enumerate(best)]
+
+    def objective(trial):
+        x = [- np.log(trial.suggest_float(f"x_{i}", 0, 1)) for i in free]
+        p = [float(f) / 100 for f in constrained_fractions(x, lower, upper)]
+        for i in range(n_components):
+            trial.set_user_attr(f"p_{i}", p[i]*100)
+            components[i]['fraction'] = p[i]*100
+        blend_cost = float(np.dot(p, comp_costs))
+
+        best_so_far = best_results()
+
+        def report(value):
+            update_state(state='PROGRESS', meta={'progress': (((trial.number+(value/100))/n_trials)*100), 'result': best_so_far})
+
+        if quality == 'fast':
+            prediction = predict_with_student({'components': components, 'targets': targets})
+            report(100)
+        else:
+            prediction = predict_blend(
+                {'components': components, 'quality': quality, 'targets': targets}, on_progress=report,
+            )
+
+        # The one prediction is scored against every target
+        mapes = [
+            100*mean_absolute_percentage_error(target_properties, prediction['blended_properties'])
+            for target_properties in target_matrix
+        ]
+        trial_values.append(tuple(mapes) + (blend_cost,))
+        trial_fractions.append([p[i]*100 for i in range(n_components)])
+        return (*mapes, blend_cost)
+
+    study = optuna.create_study(directions=['minimize'] * (len(blend_targets) + 1))
+
+    # Warm start from the best recipes previously found for any of the targets
+    warm_started = 0
+    if request_data.get('warm_start', True) and settings.WARM_START_TRIALS > 0:
+        per_target = max(settings.WARM_START_TRIALS // len(blend_targets), 1)
+        try:
+            history = database.get_estimation_history([c['name'] for c in components])
+            candidates = []
+            for target_properties in target_matrix:
+                candidates += warm_start_candidates(
+                    history, components, target_properties, limit=per_target,
+                    targets=targets, all_targets=TARGET_COLUMNS,
+                )
+        except Exception as e:
+            print(f"Warning: Could not load warm start candidates: {e}")
+            candidates = []
+        for fractions in candidates[:n_trials]:
+            params = fractions_to_params(fractions, lower, upper)
+            if params is None:
+                continue
+            study.enqueue_trial(params)
+            warm_started += 1
+    print(f"Warm-started trials: {warm_started}")
+
+    study.optimize(objective, n_trials=n_trials)
+    if not trial_values:
+        raise Exception("No successful trials in optimization.")
+
+    results = best_results()
+    # Logged per target, so later single- or multi-target jobs can warm-start from them
+    for bt, result in zip(blend_targets, results):
+        database.add_history_log(
+            "blender",
+            {
+                'components': request_data['components'], 'target_properties': bt['target_properties'],
+                'targets': targets, 'n_trials': n_trials, 'quality': quality, 'target_name': bt.get('name'),
+            },
+            dict(result, quality=quality, targets=list(targets or TARGET_COLUMNS)),
+        )
+
+    final_result = {
+        'results': results,
+        'evaluated_candidates': len(trial_values),
+        'warm_started_trials': warm_started,
+        'quality': quality,
+        'targets': list(targets or TARGET_COLUMNS),
+    }
+    return {'progress': 100, 'result': final_result}
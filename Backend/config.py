@@ -4,6 +4,78 @@ class Settings(BaseSettings):
     MONGO_URI: str
     DB_NAME: str
     HF_TOKEN: str
+    # Max number of trials seeded from previous estimation jobs
+    WARM_START_TRIALS: int = 5
+    # 'cached' uses the fit-with-cache models from model/cache_models.py when present, 'standard' never does
+    TABPFN_INFERENCE_MODE: str = "cached"
+    # 'mmap' loads the fold/target models from the memory-mapped files of
+    # model/map_models.py when present (shared by all processes of a node), 'native' never does
+    WEIGHT_FORMAT: str = "native"
+    MAPPED_WEIGHTS_DIR: str = "./model/mapped"
+    # Memory budgets for resident fold/target models (0 = unlimited)
+    MODEL_MEMORY_BUDGET_MB: int = 0
+    MODEL_NODE_MEMORY_BUDGET_MB: int = 0
+    # Number of hottest models loaded at startup by each process that serves
+    # predictions (persistent pool workers, and Celery worker processes with fan-out)
+    MODEL_PRELOAD_COUNT: int = 0
+    # Split batch predictions into row chunks of this size per pool task (0 = one chunk)
+    PREDICT_CHUNK_ROWS: int = 0
+    # Prediction pool size on nodes without a GPU (0 = fail the job)
+    PREDICT_CPU_WORKERS: int = 0
+    # 'persistent' keeps one prediction pool per Celery worker process, so the
+    # models its workers load stay resident across jobs; 'subprocess' runs every
+    # job through predict_worker_script.py / predict_batch_worker.py, whose pool
+    # (and resident models) only lives as long as the job
+    PREDICTION_POOL: str = "persistent"
+    # 'local' runs the fold x target models in one process pool; 'target' or
+    # 'fold_target' fans them out as a Celery chord across all workers
+    PREDICTION_FANOUT: str = "local"
+    # 'tabpfn' loads the trained models, 'stub' uses model/stub.py (no GPU or weights needed)
+    MODEL_BACKEND: str = "tabpfn"
+    STUB_LATENCY_MS: float = 0.0
+    # 'celery' queues /predict/* jobs for the Celery workers, 'embedded' runs
+    # them in the API process (embedded.py) on EMBEDDED_WORKERS threads
+    EXECUTION_MODE: str = "celery"
+    EMBEDDED_WORKERS: int = 2
+    # Finished embedded jobs are kept this long for /predict/status
+    EMBEDDED_RESULT_TTL_S: int = 3600
+    # Precomputed simplex grids for fraction estimation (simplex_index.py)
+    SIMPLEX_INDEX_DIR: str = "./model/simplex"
+    SIMPLEX_INDEX_CANDIDATES: int = 50
+    # Share of jobs profiled without asking (profile=true); see profiling.py
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_DIR: str = "./profiles"
+    # Finished batch results kept for paged reads (result_store.py), removed after RESULT_STORE_TTL_S (0 = never)
+    RESULT_STORE_DIR: str = "./results"
+    RESULT_STORE_TTL_S: int = 86400
+    RESULT_PAGE_MAX_ROWS: int = 10000
+    # Tracing of jobs across API, worker, scripts and pool workers (tracing.py):
+    # 'none', 'otlp' (OTLP/HTTP to TRACING_OTLP_ENDPOINT) or 'file' (JSON lines)
+    TRACING_EXPORTER: str = "none"
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_FILE: str = "./traces/spans.jsonl"
+    TRACING_SERVICE_NAME: str = "fuelblend"
+    # 'buffered' writes history entries behind the request (history_writer.py), 'sync' inserts them directly
+    HISTORY_WRITE_MODE: str = "buffered"
+    HISTORY_FLUSH_SIZE: int = 100
+    HISTORY_FLUSH_INTERVAL_S: float = 2.0
+    # Where entries are spooled while Mongo is unreachable
+    HISTORY_SPOOL_DIR: str = "./history_spool"
+    # Admission control for /predict/* (see admission.py, 0 = unlimited)
+    ADMISSION_ENABLED: bool = True
+    MAX_INFLIGHT_BLEND: int = 200
+    MAX_INFLIGHT_BATCH: int = 10
+    MAX_INFLIGHT_ESTIMATION: int = 10
+    # Max messages waiting in the Celery queue
+    MAX_QUEUE_DEPTH: int = 0
+    RATE_LIMIT_PER_MINUTE: int = 120
+    # In-flight entries older than this are dropped (e.g. lost workers)
+    ADMISSION_JOB_TTL_S: int = 21600
+    # /ready answers 503 above this many queued messages, or when no model is
+    # resident yet in a process that serves jobs if READY_REQUIRE_WARM is set
+    # (persistent pool, fan-out or embedded; never with PREDICTION_POOL='subprocess')
+    READY_MAX_QUEUE_DEPTH: int = 100
+    READY_REQUIRE_WARM: bool = False
 
     class Config:
         env_file = ".env"
@@ -1,8 +1,10 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from typing import List, Dict
 import uuid
 from datetime import datetime, timezone
 from config import settings
+from history_writer import HistoryWriter
+import catalog_io
 from models import (
     Component, ComponentCreate, ComponentUpdate,
     TargetComponent, TargetComponentCreate, TargetComponentUpdate,
@@ -10,7 +12,12 @@ from models import (
 )
 
 # --- Database Connection ---
-client = MongoClient(settings.MONGO_URI)
+if settings.MONGO_URI.startswith("mongomock://"):
+    # In-memory stand-in for local runs and load tests
+    import mongomock
+    client = mongomock.MongoClient()
+else:
+    client = MongoClient(settings.MONGO_URI)
 db = client[settings.DB_NAME]
 
 # --- Collections ---
@@ -18,6 +25,42 @@ component_collection = db.get_collection("components")
 target_component_collection = db.get_collection("target_components")
 history_collection = db.get_collection("history")
 settings_collection = db.get_collection("settings")
+meta_collection = db.get_collection("meta")
+
+# Write-behind buffer for history entries
+history_writer = HistoryWriter(
+    history_collection,
+    max_batch=settings.HISTORY_FLUSH_SIZE,
+    flush_interval=settings.HISTORY_FLUSH_INTERVAL_S,
+    spool_dir=settings.HISTORY_SPOOL_DIR,
+)
+
+
+# --- Catalog Revisions (used for ETags) ---
+def get_revision(name: str) -> str:
+    """
+    Current revision of a catalog as '<epoch>-<counter>'. The epoch is random
+    per meta document, so revisions never repeat if the document is lost.
+    """
+    doc = meta_collection.find_one({"_id": f"revision:{name}"})
+    if doc is None:
+        # Only the first read of a catalog writes; later ones are plain reads
+        doc = meta_collection.find_one_and_update(
+            {"_id": f"revision:{name}"},
+            {"$setOnInsert": {"epoch": uuid.uuid4().hex[:12], "rev": 0}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    return f"{doc['epoch']}-{doc['rev']}"
+
+
+def bump_revision(name: str):
+    """Called after every write to a catalog, invalidating its ETag."""
+    meta_collection.update_one(
+        {"_id": f"revision:{name}"},
+        {"$inc": {"rev": 1}, "$setOnInsert": {"epoch": uuid.uuid4().hex[:12]}},
+        upsert=True,
+    )
 
 
 # --- Helper function to format the document ---
@@ -107,6 +150,7 @@ def seed_defaults_if_empty():
             component_collection.insert_many(defaults, ordered=True)
         except Exception:
             pass
+        bump_revision("components")
 
     # Seed a default target component if empty
     if target_component_collection.estimated_document_count() == 0:
@@ -141,6 +185,7 @@ def seed_defaults_if_empty():
             target_component_collection.insert_many(default_target, ordered=True)
         except Exception:
             pass
+        bump_revision("target_components")
 
 
 def get_all_components() -> List[Dict]:
@@ -151,6 +196,7 @@ def add_component(component: ComponentCreate) -> Dict:
     component_dict = component.model_dump()
     component_dict["_id"] = component.id
     component_collection.insert_one(component_dict)
+    bump_revision("components")
     # Return the formatted document
     return component_helper(component_dict)
 
@@ -165,11 +211,15 @@ def update_component_by_id(component_id: str, component_update: ComponentUpdate)
         {"$set": update_data},
         return_document=True
     )
+    if result is not None:
+        bump_revision("components")
     return component_helper(result)
 
 
 def delete_component_by_id(component_id: str) -> bool:
     result = component_collection.delete_one({"_id": component_id})
+    if result.deleted_count > 0:
+        bump_revision("components")
     return result.deleted_count > 0
 
 
@@ -182,6 +232,7 @@ def add_target_component(component: TargetComponentCreate) -> Dict:
     comp_dict = component.model_dump()
     comp_dict["_id"] = component.id
     target_component_collection.insert_one(comp_dict)
+    bump_revision("target_components")
     return target_component_helper(comp_dict)
 
 
@@ -195,14 +246,41 @@ def update_target_component_by_id(component_id: str, update: TargetComponentUpda
         {"$set": update_data},
         return_document=True
     )
+    if result is not None:
+        bump_revision("target_components")
     return target_component_helper(result)
 
 
 def delete_target_component_by_id(component_id: str) -> bool:
     result = target_component_collection.delete_one({"_id": component_id})
+    if result.deleted_count > 0:
+        bump_revision("target_components")
     return result.deleted_count > 0
 
 
+# --- Bulk Import / Export ---
+def bulk_import_components(rows: List[Dict]) -> Dict:
+    result = catalog_io.import_rows(component_collection, rows, ComponentCreate)
+    if result['inserted'] or result['updated']:
+        bump_revision("components")
+    return result
+
+
+def bulk_import_target_components(rows: List[Dict]) -> Dict:
+    result = catalog_io.import_rows(target_component_collection, rows, TargetComponentCreate)
+    if result['inserted'] or result['updated']:
+        bump_revision("target_components")
+    return result
+
+
+def iter_components():
+    return component_collection.find(batch_size=1000)
+
+
+def iter_target_components():
+    return target_component_collection.find(batch_size=1000)
+
+
 # --- App Data Functions (with similar formatting) ---
 
 def settings_helper(s) -> dict:
@@ -231,7 +309,24 @@ def add_history_log(log_type: str, data: dict, response_data:dict):
         "data": data,
         "response": response_data
     }
-    history_collection.insert_one(log_entry)
+    if settings.HISTORY_WRITE_MODE == "sync":
+        history_collection.insert_one(log_entry)
+    else:
+        # Queued; written in the background by history_writer
+        history_writer.add(log_entry)
+
+
+def get_estimation_history(component_names: List[str], limit: int = 200) -> List[Dict]:
+    """Previous fraction estimation jobs that used all of the given components."""
+    # Include this process' own entries that are still buffered
+    history_writer.flush()
+    query = {
+        "response.estimated_fractions": {"$exists": True},
+        "data.components.name": {"$all": component_names},
+    }
+    projection = {"data.components": 1, "data.target_properties": 1, "data.targets": 1, "response": 1}
+    cursor = history_collection.find(query, projection).sort("timestamp", -1).limit(limit)
+    return [history_helper(h) for h in cursor]
 
 
 def get_settings() -> Dict:
@@ -251,4 +346,5 @@ def update_settings(settings_data: SettingsDB) -> Dict:
         {"$set": settings_dict},
         upsert=True
     )
+    bump_revision("settings")
     return settings_helper(settings_dict)
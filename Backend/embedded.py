@@ -0,0 +1,227 @@
+"""
+Embedded execution (EXECUTION_MODE='embedded').
+
+Runs the /predict/* jobs inside the API process on a bounded thread pool
+(EMBEDDED_WORKERS) instead of going API -> Redis -> Celery -> subprocess ->
+process pool. The fold/target models stay resident in the residency manager
+of this process, so a blend prediction is only the model calls. Job state is
+kept in memory with the same states and metadata as Celery results, so
+/predict/status answers the same way in both modes.
+
+Meant for small single-node deployments and tests: jobs don't survive a
+restart and aren't shared between several API processes.
+"""
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import torch
+
+import database, admission, profiling, tracing, result_store
+from config import settings
+from model.trained_tabpfn import TrainedTabPFN
+from model.residency import get_residency_manager
+from celery_worker import (
+    predict_with_student, predict_batch_with_student, predict_rows,
+    estimate_fractions, estimate_fractions_multi, sensitivity_analysis, build_simplex_index,
+)
+
+_lock = threading.Lock()
+_jobs = {}  # job_id -> {'state', 'info', 'result', 'finished_at'}
+_executor = None
+_model = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.EMBEDDED_WORKERS, thread_name_prefix='embedded')
+    return _executor
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _lock:
+            if _model is None:
+                _model = TrainedTabPFN()
+    return _model
+
+
+# --- Job store ---
+
+def _set_state(job_id, state, meta=None):
+    with _lock:
+        job = _jobs.setdefault(job_id, {'state': 'PENDING', 'info': None, 'result': None, 'finished_at': None})
+        job['state'] = state
+        if state == 'SUCCESS':
+            job['result'] = meta
+        else:
+            job['info'] = meta
+        if state in ('SUCCESS', 'FAILURE'):
+            job['finished_at'] = time.time()
+
+
+def _prune(now):
+    with _lock:
+        expired = [
+            job_id for job_id, job in _jobs.items()
+            if job['finished_at'] and now - job['finished_at'] > settings.EMBEDDED_RESULT_TTL_S
+        ]
+        for job_id in expired:
+            del _jobs[job_id]
+
+
+def job_state(job_id):
+    """(state, info, result) of a job, like a Celery AsyncResult; unknown ids are PENDING."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return 'PENDING', None, None
+        return job['state'], job['info'], job['result']
+
+
+def store_result(job_id, result):
+    """Records a job that was answered without running (e.g. from the simplex index)."""
+    _prune(time.time())
+    _set_state(job_id, 'SUCCESS', result)
+
+
+def submit(job_id, fn, *args, profile=False):
+    """Queues fn(update_state, *args) on the pool under an admitted job id."""
+    _prune(time.time())
+    _set_state(job_id, 'PENDING')
+
+    def update_state(state='PROGRESS', meta=None):
+        _set_state(job_id, state, meta)
+
+    # The job's span continues the trace of the request that submitted it
+    trace_parent = tracing.carrier()
+
+    def run():
+        try:
+            with profiling.job(job_id, profile), tracing.span(f"job {fn.__name__}", parent=trace_parent, job_id=job_id):
+                result = fn(update_state, *args)
+            _set_state(job_id, 'SUCCESS', result)
+            admission.release(job_id)
+        except Exception as e:
+            print(f"Embedded job {job_id} failed: {e}")
+            _set_state(job_id, 'FAILURE', {'exc_type': type(e).__name__, 'exc_message': str(e)})
+            admission.release(job_id, completed=False)
+
+    try:
+        get_executor().submit(run)
+    except Exception:
+        admission.release(job_id, completed=False)
+        raise
+    return job_id
+
+
+def shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    database.history_writer.close()
+
+
+# --- Jobs ---
+
+def predict_frame(input_df, quality='full', targets=None, on_progress=None):
+    """Runs the selected fold/target models on input_df in this thread; returns (predictions, targets)."""
+    model = get_model()
+    X = model.preprocess(input_df).drop(columns=['ID'], errors='ignore')
+    folds_by_target = model.select_folds(quality, targets)
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    total = sum(len(folds) for folds in folds_by_target.values())
+
+    results_map = {}
+    done = 0
+    for col, folds in folds_by_target.items():
+        for fold_idx in folds:
+            (model_path, model_type), used_features = model.models[col][fold_idx]
+            with tracing.span('model_load', model=os.path.basename(model_path), target=col, fold=int(fold_idx)):
+                fold_model = get_residency_manager(role='embedded').get(model_path, model_type, device)
+            with tracing.span('predict', target=col, fold=int(fold_idx), rows=len(X)):
+                prediction = fold_model.predict(X.drop(columns=used_features))
+            model.collect(results_map, (fold_idx, col, prediction, (0, len(X))), len(X))
+            done += 1
+            if on_progress is not None:
+                on_progress(int(done / total * 100))
+    with tracing.span('aggregate', rows=len(X)):
+        return model.combine(results_map, folds_by_target), list(folds_by_target)
+
+
+def _row_result(row, quality, targets):
+    return {
+        "blended_properties": [float(v) for v in row],
+        "confidence_score": random.random(),
+        "model_version": "v1.0-embedded",
+        "quality": quality,
+        "targets": targets,
+    }
+
+
+def predict_blend(request_data, on_progress=None):
+    """Single blend prediction, same result as predict_worker_script.py."""
+    quality = request_data.get('quality', 'full')
+    if quality == 'fast':
+        return predict_with_student(request_data)
+    input_df = get_model().components_frame(request_data['components'])
+    final_pred, targets = predict_frame(input_df, quality, request_data.get('targets'), on_progress)
+    return _row_result(final_pred[0], quality, targets)
+
+
+def run_single_prediction(update_state, request_data):
+    final_result = predict_blend(
+        request_data, on_progress=lambda value: update_state(state='PROGRESS', meta={'progress': value}),
+    )
+    database.add_history_log("blender", request_data, final_result)
+    return {'progress': 100, 'result': final_result}
+
+
+def run_batch_prediction(update_state, file_path, original_filename, quality='full', targets=None, job_id=None):
+    try:
+        if quality == 'fast':
+            final_result_list = predict_batch_with_student(file_path, targets)
+        else:
+            final_pred, used_targets = predict_frame(
+                pd.read_csv(file_path), quality, targets,
+                on_progress=lambda value: update_state(state='PROGRESS', meta={'progress': value}),
+            )
+            final_result_list = [_row_result(row, quality, used_targets) for row in final_pred]
+        if job_id is not None:
+            result_store.save(job_id, final_result_list)
+        database.add_history_log(
+            "blender_batch",
+            {"filename": original_filename, "quality": quality, "targets": targets},
+            {"results": final_result_list}
+        )
+        return {'progress': 100, 'result': final_result_list}
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def run_fraction_estimation(update_state, request_data):
+    return estimate_fractions(request_data, update_state, predict_blend=predict_blend)
+
+
+def run_multi_fraction_estimation(update_state, request_data):
+    return estimate_fractions_multi(request_data, update_state, predict_blend=predict_blend)
+
+
+def _predict_rows(input_df, quality='full', targets=None, on_progress=None):
+    if quality == 'fast':
+        return predict_rows(input_df, quality, targets)
+    return predict_frame(input_df, quality, targets, on_progress)
+
+
+def run_sensitivity_analysis(update_state, request_data):
+    return sensitivity_analysis(request_data, update_state, predict=_predict_rows)
+
+
+def run_simplex_index_build(update_state, request_data):
+    return build_simplex_index(request_data, update_state, predict=_predict_rows)
@@ -0,0 +1,227 @@
+import numpy as np
+
+EPS = 1e-9
+
+
+# --- Warm Start Helpers ---
+def same_component_set(history_components, components, atol=1e-6):
+    """
+    Checks whether a logged request used the same components (by name and
+    properties) as the current one, regardless of their order.
+    """
+    if len(history_components) != len(components):
+        return False
+    by_name = {c.get('name'): c.get('properties') for c in history_components}
+    if len(by_name) != len(history_components):
+        return False
+    for comp in components:
+        props = by_name.get(comp.get('name'))
+        if props is None or len(props) != len(comp.get('properties')):
+            return False
+        if not np.allclose(props, comp.get('properties'), atol=atol):
+            return False
+    return True
+
+
+def target_distance(a, b):
+    """Mean absolute relative distance between two target property vectors."""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    if a.shape != b.shape:
+        return float('inf')
+    return float(np.mean(np.abs(a - b) / np.maximum(np.abs(a), 1e-6)))
+
+
+def align_target_properties(target_properties, targets, all_targets):
+    """
+    Target property values for `targets` (None = all_targets), in that order.
+    `target_properties` either has one value per requested target or is the
+    full vector over all_targets. Raises ValueError for any other length.
+    """
+    targets = list(targets or all_targets)
+    if len(target_properties) == len(targets):
+        return [float(v) for v in target_properties]
+    if len(target_properties) == len(all_targets):
+        by_name = dict(zip(all_targets, target_properties))
+        return [float(by_name[t]) for t in targets]
+    raise ValueError(
+        f"Expected {len(targets)} target properties (or all {len(all_targets)}), got {len(target_properties)}"
+    )
+
+
+def _history_targets(data, targets, all_targets):
+    """A logged request's target properties for `targets`, or None if it didn't cover them all."""
+    try:
+        logged = align_target_properties(data.get('target_properties', []), data.get('targets'), all_targets)
+    except ValueError:
+        return None
+    by_name = dict(zip(data.get('targets') or all_targets, logged))
+    if any(t not in by_name for t in targets):
+        return None
+    return [by_name[t] for t in targets]
+
+
+def warm_start_candidates(history_entries, components, target_properties, limit, targets=None, all_targets=None):
+    """
+    Picks the best fraction vectors from previous estimation jobs on the same
+    component set, nearest target first.
+
+    If `all_targets` is given, `target_properties` is aligned with `targets`
+    (None = all) and logged jobs are compared on those targets only.
+
+    Returns a list of fraction vectors (in %), ordered like `components`.
+    """
+    scored = []
+    for entry in history_entries:
+        data = entry.get('data') or {}
+        response = entry.get('response') or {}
+        estimated = response.get('estimated_fractions')
+        if not estimated or not same_component_set(data.get('components', []), components):
+            continue
+
+        fractions_by_name = {f.get('name'): f.get('fraction') for f in estimated}
+        fractions = [fractions_by_name.get(c['name']) for c in components]
+        if any(f is None for f in fractions):
+            continue
+
+        if all_targets is not None:
+            logged = _history_targets(data, list(targets or all_targets), all_targets)
+            distance = target_distance(target_properties, logged) if logged is not None else float('inf')
+        else:
+            distance = target_distance(target_properties, data.get('target_properties', []))
+        mape = response.get('mape_score')
+        scored.append((distance, mape if mape is not None else float('inf'), fractions))
+
+    scored.sort(key=lambda s: (s[0], s[1]))
+
+    candidates = []
+    for _, _, fractions in scored:
+        # Skip near-duplicate recipes, they would waste a trial
+        if any(np.allclose(fractions, c, atol=1e-3) for c in candidates):
+            continue
+        candidates.append(fractions)
+        if len(candidates) >= limit:
+            break
+    return candidates
+
+
+def fractions_to_params(fractions, lower=None, upper=None):
+    """
+    Inverts the sampler parametrization (see `constrained_fractions`) so that
+    `study.enqueue_trial` reproduces the given fractions (in %) exactly.
+
+    Returns None if the fractions violate the bounds.
+    """
+    fractions = np.asarray(fractions, dtype=float)
+    if lower is None:
+        lower = np.zeros(len(fractions))
+    if upper is None:
+        upper = np.full(len(fractions), 100.0)
+    if np.any(fractions < lower - 1e-6) or np.any(fractions > upper + 1e-6):
+        return None
+
+    mass = 100.0 - lower.sum()
+    if mass <= EPS:
+        return {}
+    return {
+        f"x_{i}": float(np.exp(-max(fractions[i] - lower[i], 0.0) / mass))
+        for i in free_indices(lower, upper)
+    }
+
+
+def component_costs(components, known_costs):
+    """Cost of each component: its own 'cost', else the catalog's by name (`known_costs`), else 0."""
+    costs = []
+    for c in components:
+        cost_val = c.get('cost')
+        if cost_val is None:
+            cost_val = known_costs.get(c.get('name'), 0.0)
+        try:
+            cost_val = float(cost_val)
+        except Exception:
+            cost_val = 0.0
+        costs.append(cost_val)
+    return costs
+
+
+# --- Multi-Target Estimation ---
+def best_trials_per_target(trial_values, n_targets):
+    """
+    trial_values: one (mape_1, ..., mape_n, cost) tuple per evaluated candidate.
+    Returns, for each target, the index of the candidate with the lowest MAPE
+    on it (ties broken by cost), or None if there are no candidates.
+    """
+    if not trial_values:
+        return [None] * n_targets
+    return [
+        min(range(len(trial_values)), key=lambda i: (trial_values[i][t], trial_values[i][-1]))
+        for t in range(n_targets)
+    ]
+
+
+# --- Fraction Constraints ---
+def resolve_bounds(components, constraints=None):
+    """
+    Turns per-component min/max/fixed constraints (in %) into lower and upper
+    bound arrays ordered like `components`.
+
+    Raises ValueError for unknown components or an infeasible set of bounds.
+    """
+    names = [c['name'] for c in components]
+    lower = np.zeros(len(components))
+    upper = np.full(len(components), 100.0)
+
+    for con in constraints or []:
+        name = con.get('name')
+        if name not in names:
+            raise ValueError(f"Constraint refers to unknown component: {name}")
+        idx = names.index(name)
+
+        if con.get('fixed_fraction') is not None:
+            lo = hi = float(con['fixed_fraction'])
+        else:
+            lo = float(con['min_fraction']) if con.get('min_fraction') is not None else 0.0
+            hi = float(con['max_fraction']) if con.get('max_fraction') is not None else 100.0
+        if not 0.0 <= lo <= hi <= 100.0:
+            raise ValueError(f"Invalid fraction bounds for {name}: min={lo}, max={hi}")
+        lower[idx], upper[idx] = lo, hi
+
+    if lower.sum() > 100.0 + 1e-6:
+        raise ValueError(f"Fraction constraints are infeasible: minimums add up to {lower.sum():.2f}%")
+    if upper.sum() < 100.0 - 1e-6:
+        raise ValueError(f"Fraction constraints are infeasible: maximums add up to {upper.sum():.2f}%")
+    return lower, upper
+
+
+def free_indices(lower, upper):
+    """Indices of the components whose fraction is not fixed by the bounds."""
+    return [i for i in range(len(lower)) if upper[i] - lower[i] > EPS]
+
+
+def constrained_fractions(weights, lower, upper):
+    """
+    Maps non-negative weights of the free components to fractions (in %) that
+    sum to 100 and respect the bounds.
+
+    Every component starts at its lower bound and the remaining mass is shared
+    in proportion to the weights; shares that hit an upper bound are clamped
+    and the excess is redistributed among the others.
+    """
+    fractions = np.array(lower, dtype=float)
+    free = free_indices(lower, upper)
+    w = np.zeros(len(fractions))
+    w[free] = weights
+
+    mass = 100.0 - fractions.sum()
+    active = np.zeros(len(fractions), dtype=bool)
+    active[free] = True
+    while mass > EPS and active.any():
+        active_w = w[active]
+        if active_w.sum() <= 0:
+            active_w = np.ones(len(active_w))
+        share = mass * active_w / active_w.sum()
+        take = np.minimum(share, upper[active] - fractions[active])
+        fractions[active] += take
+        mass -= take.sum()
+        active &= (upper - fractions) > EPS
+    return fractions
@@ -0,0 +1,35 @@
+from fastapi import Request, Response
+
+import database
+
+
+def catalog_etag(name):
+    """Strong ETag of a catalog ('components', 'target_components', 'settings'), from its revision."""
+    return f'"{name}-{database.get_revision(name)}"'
+
+
+def _matches(request: Request, etag):
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # If-None-Match uses the weak comparison
+    candidates = [tag.strip() for tag in header.split(',')]
+    return any(tag.removeprefix('W/') == etag for tag in candidates)
+
+
+def conditional(request: Request, response: Response, name):
+    """
+    Handles If-None-Match for a GET on a catalog: returns a 304 response if the
+    client's copy is current, otherwise None after setting the ETag on `response`.
+
+    The revision is read before the catalog is queried, so a concurrent write
+    can only make the ETag older than the body, never newer.
+    """
+    etag = catalog_etag(name)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
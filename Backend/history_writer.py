@@ -0,0 +1,182 @@
+import os
+import json
+import glob
+import time
+import atexit
+import threading
+from collections import deque
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+DUPLICATE_KEY = 11000
+
+
+class HistoryWriter():
+    """
+    Write-behind buffer for history entries.
+
+    `add` only queues the entry; a background thread writes the queue with
+    `insert_many` once `max_batch` entries are pending or every
+    `flush_interval` seconds. Entries that can't be written (Mongo down) are
+    appended to a JSONL spool file in `spool_dir` and replayed on a later
+    flush, by this or any other process on the node. Pending entries are
+    flushed at interpreter exit and on Celery worker shutdown (see
+    celery_worker.py).
+
+    Entries carry their own `_id`, so a replayed entry that already made it to
+    Mongo is skipped as a duplicate. Spool lines that can't be parsed (e.g. cut
+    off by a crash) are moved to `<pid>.bad` instead of blocking the rest.
+    """
+    def __init__(self, collection, max_batch=100, flush_interval=2.0, spool_dir='./history_spool'):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.spool_dir = spool_dir
+        self._reset()
+        atexit.register(self.close)
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _ensure_thread(self):
+        # Forked processes (Celery prefork) start with a copy of the parent's
+        # buffer; those entries are the parent's to write.
+        if os.getpid() != self._pid:
+            self._reset()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='history-writer', daemon=True)
+            self._thread.start()
+
+    def add(self, entry):
+        with self._lock:
+            self._ensure_thread()
+            self._pending.append(entry)
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Warning: History flush failed: {e}")
+
+    def flush(self):
+        """Writes all pending entries (and any spooled ones). Returns the number written."""
+        if os.getpid() != self._pid:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                entries = list(self._pending)
+                self._pending.clear()
+            written = 0
+            if entries:
+                if self._insert(entries):
+                    written += len(entries)
+                else:
+                    self._spool(entries)
+                    return written
+            written += self._replay_spool()
+            return written
+
+    def close(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval + 5)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Warning: Final history flush failed: {e}")
+
+    # --- Mongo ---
+    def _insert(self, entries):
+        try:
+            self.collection.insert_many(entries, ordered=False)
+            return True
+        except BulkWriteError as e:
+            errors = e.details.get('writeErrors', [])
+            if all(err.get('code') == DUPLICATE_KEY for err in errors):
+                return True
+            print(f"Warning: History insert failed: {errors[:1]}")
+            return False
+        except PyMongoError as e:
+            print(f"Warning: History insert failed, spooling to disk: {e}")
+            return False
+
+    # --- On-disk spool ---
+    def _spool_path(self):
+        return os.path.join(self.spool_dir, f"{self._pid}.jsonl")
+
+    def _spool(self, entries):
+        try:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            with open(self._spool_path(), 'a') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, default=str) + '\n')
+        except OSError as e:
+            print(f"Error: Could not spool {len(entries)} history entries, they are lost: {e}")
+
+    def _claimable(self):
+        paths = glob.glob(os.path.join(self.spool_dir, '*.jsonl'))
+        # Claims left behind by processes that died while replaying
+        for path in glob.glob(os.path.join(self.spool_dir, '*.claim')):
+            try:
+                os.kill(int(path.rsplit('.', 2)[-2]), 0)
+            except (OSError, ValueError):
+                paths.append(path)
+        return paths
+
+    def _set_aside(self, path, lines):
+        """Keeps unreadable spool lines (e.g. truncated by a crash) in a .bad file, out of the replay."""
+        bad_path = os.path.join(self.spool_dir, os.path.basename(path).split('.', 1)[0] + '.bad')
+        print(f"Warning: Skipping {len(lines)} unreadable spooled history entries, kept in {bad_path}")
+        try:
+            with open(bad_path, 'a') as f:
+                f.writelines(line if line.endswith('\n') else line + '\n' for line in lines)
+        except OSError as e:
+            print(f"Error: Could not keep unreadable history entries: {e}")
+
+    def _replay_spool(self):
+        if not os.path.isdir(self.spool_dir):
+            return 0
+        written = 0
+        for path in self._claimable():
+            # Renaming is atomic, so only one process replays a spool file
+            claim = f"{path}.{self._pid}.claim"
+            try:
+                os.replace(path, claim)
+                with open(claim) as f:
+                    lines = [line for line in f if line.strip()]
+            except OSError:
+                continue
+            entries = []
+            bad_lines = []
+            for line in lines:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    bad_lines.append(line)
+            if bad_lines:
+                self._set_aside(path, bad_lines)
+            if entries and not self._insert(entries):
+                self._spool(entries)
+            else:
+                written += len(entries)
+            os.remove(claim)
+        if written:
+            print(f"Replayed {written} spooled history entries")
+        return written
@@ -1,12 +1,16 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from routers import components, predictions, app_data, target_components
-import database
+from fastapi.middleware.gzip import GZipMiddleware
+from serialization import FastJSONResponse, GZIP_MIN_SIZE, GZIP_LEVEL
+from routers import components, predictions, app_data, target_components, models_status, health
+import database, embedded, tracing
+from config import settings
 
 app = FastAPI(
     title="FuelBlend AI Backend",
     description="API for handling chemical component management and blend predictions.",
     version="1.0.0",
+    default_response_class=FastJSONResponse,
 )
 
 # --- CORS Configuration ---
@@ -22,18 +26,39 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large bodies (batch results, catalog exports)
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_SIZE, compresslevel=GZIP_LEVEL)
+
+# --- Tracing: one server span per request, continuing the caller's traceparent ---
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    if not tracing.enabled():
+        return await call_next(request)
+    with tracing.span(f"{request.method} {request.url.path}", parent=dict(request.headers), kind=tracing.trace.SpanKind.SERVER, **{'http.method': request.method}) as span:
+        response = await call_next(request)
+        route = request.scope.get('route')
+        if route is not None:
+            span.update_name(f"{request.method} {route.path}")
+        span.set_attribute('http.status_code', response.status_code)
+        return response
+
 # --- Include Routers ---
 app.include_router(components.router)
 app.include_router(predictions.router)
 app.include_router(app_data.router)
 app.include_router(target_components.router)
+app.include_router(models_status.router)
+app.include_router(health.router)
 
 # --- Startup Event: seed default components once ---
 @app.on_event("startup")
 async def startup_seed():
     database.seed_defaults_if_empty()
+    tracing.setup('api')
 
-# --- Health Check Endpoint ---
-@app.get("/health", tags=["Health"])
-async def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+# --- Shutdown Event: stop the embedded job pool (EXECUTION_MODE='embedded'), flush spans ---
+@app.on_event("shutdown")
+async def shutdown_embedded():
+    if settings.EXECUTION_MODE == 'embedded':
+        embedded.shutdown()
+    tracing.shutdown()
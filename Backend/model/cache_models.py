@@ -0,0 +1,99 @@
+"""
+Pre-computes the fit-with-cache variant of every stored TabPFN fold/target model.
+
+TabPFN is an in-context learner: a plain fitted model re-encodes its whole
+training context on every `predict`. With `fit_mode='fit_with_cache'` the
+encoded context (KV cache) is computed once at fit time and kept on the
+estimator, which is what we persist here. `load_fold_model` picks these up
+when TABPFN_INFERENCE_MODE is 'cached'.
+
+Each fold's training split is rebuilt from the training CSV with the same
+KFold used for training (`TrainedTabPFN.folds`). A cached model only replaces
+the stored one if its predictions on --check-rows validation rows agree within
+--tolerance; otherwise it is discarded and the script exits non-zero.
+Run from the Backend directory:
+
+    python -m model.cache_models --train-csv data/train.csv
+"""
+import os
+import sys
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import torch
+from sklearn.base import clone
+
+from model.trained_tabpfn import (
+    TrainedTabPFN, CACHE_DIR, cached_model_path, load_cached_tabpfn_model,
+)
+from tabpfn.model.loading import load_fitted_tabpfn_model
+
+
+def build_cached_model(model, X_train, y_train, device):
+    cached = clone(model)
+    cached.set_params(fit_mode='fit_with_cache', device=device)
+    cached.fit(X_train, y_train)
+    return cached
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persist fit-with-cache TabPFN models for fast inference.")
+    parser.add_argument("--train-csv", required=True, type=str, help="Training data the fold models were fitted on.")
+    parser.add_argument("--check-rows", type=int, default=32, help="Validation rows compared against the uncached model.")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="Max abs prediction difference vs. the uncached model.")
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+    tabpfn_model = TrainedTabPFN()
+    train_df = pd.read_csv(args.train_csv)
+    X = tabpfn_model.preprocess(train_df[tabpfn_model.input_columns].copy())
+    splits = list(tabpfn_model.folds.split(X))
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    rejected = []
+
+    for col in tabpfn_model.target_columns:
+        for fold_idx in range(5):
+            model_info, used_features = tabpfn_model.models[col][fold_idx]
+            model_path, model_type = model_info
+            if model_type != 'tabpfn':
+                # Tuned/post-hoc ensembles are pickled wrappers around several
+                # estimators; they keep using the standard inference path.
+                print(f"Skipping {col} fold {fold_idx}: '{model_type}' model")
+                continue
+
+            cache_path = cached_model_path(model_path)
+            if os.path.exists(cache_path) and not args.overwrite:
+                print(f"Skipping {col} fold {fold_idx}: {cache_path} exists")
+                continue
+
+            train_idx, valid_idx = splits[fold_idx]
+            X_fold = X.drop(used_features, axis=1)
+            y = train_df[col]
+
+            model = load_fitted_tabpfn_model(Path(model_path), device=device)
+            cached = build_cached_model(model, X_fold.iloc[train_idx], y.iloc[train_idx], device)
+            tmp_path = cache_path + '.tmp'
+            torch.save(cached, tmp_path)
+
+            # Sanity check: the cached model must agree with the stored one
+            # before it's put where the workers load it from
+            X_check = X_fold.iloc[valid_idx[:args.check_rows]]
+            reloaded = load_cached_tabpfn_model(tmp_path, device)
+            max_diff = float(np.max(np.abs(model.predict(X_check) - reloaded.predict(X_check))))
+            if not max_diff <= args.tolerance:
+                os.remove(tmp_path)
+                rejected.append(f"{col} fold {fold_idx}")
+                print(f"Rejected {col} fold {fold_idx}: max abs diff vs. uncached {max_diff:.2e} > {args.tolerance:.2e}", flush=True)
+                continue
+            os.replace(tmp_path, cache_path)
+            print(f"Cached {col} fold {fold_idx} -> {cache_path} (max abs diff vs. uncached: {max_diff:.2e})", flush=True)
+
+    if rejected:
+        print(f"{len(rejected)} cached models disagree with the stored ones and were not written: {', '.join(rejected)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
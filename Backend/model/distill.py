@@ -0,0 +1,122 @@
+"""
+Distills the TabPFN fold/target ensemble into the fast student tier.
+
+Run from the Backend directory:
+
+    python -m model.distill --n-samples 20000
+"""
+import os
+import argparse
+import json
+import numpy as np
+import pandas as pd
+import torch
+
+from model.trained_tabpfn import TrainedTabPFN, load_fold_model, INPUT_COLUMNS
+from model.student import (
+    STUDENT_DIR, train_student, features_from_frame, save_metrics,
+    N_COMPONENTS, N_PROPERTIES,
+)
+
+SAMPLES_PATH = f'{STUDENT_DIR}/distill_samples.npz'
+
+
+def property_pool_from_catalog():
+    import database
+    return [c['properties'][:N_PROPERTIES] for c in database.get_all_components()
+            if len(c.get('properties', [])) >= N_PROPERTIES]
+
+
+def property_pool_from_csv(path):
+    df = pd.read_csv(path)
+    pool = []
+    for i in range(1, N_COMPONENTS + 1):
+        cols = [f'Component{i}_Property{j}' for j in range(1, N_PROPERTIES + 1)]
+        pool.extend(df[cols].dropna().to_numpy().tolist())
+    return pool
+
+
+def sample_blends(property_pool, n_samples, jitter, rng):
+    """
+    Random blends over the component-property space: components drawn from the
+    pool with Gaussian jitter, 1-5 active components with Dirichlet fractions.
+    """
+    pool = np.asarray(property_pool, dtype=np.float64)
+    spread = pool.std(axis=0)
+
+    properties = pool[rng.integers(0, len(pool), size=(n_samples, N_COMPONENTS))]
+    properties = properties + rng.normal(size=properties.shape) * spread * jitter
+
+    n_active = rng.integers(1, N_COMPONENTS + 1, size=n_samples)
+    active = np.arange(N_COMPONENTS)[None, :] < n_active[:, None]
+    fractions = rng.dirichlet(np.ones(N_COMPONENTS), size=n_samples) * active
+    fractions = fractions / fractions.sum(axis=1, keepdims=True)
+    # Unused slots look like the API's padded components (filled with 0)
+    properties[~active] = 0.0
+
+    data = {}
+    for i in range(N_COMPONENTS):
+        data[f'Component{i+1}_fraction'] = fractions[:, i]
+    for j in range(N_PROPERTIES):
+        for i in range(N_COMPONENTS):
+            data[f'Component{i+1}_Property{j+1}'] = properties[:, i, j]
+    return pd.DataFrame(data, columns=INPUT_COLUMNS)
+
+
+def label_with_ensemble(tabpfn_model, input_df, device, batch_size):
+    """Labels the samples with the full 5-fold x 10-target ensemble."""
+    X = tabpfn_model.preprocess(input_df.copy())
+    preds = np.zeros((5, len(X), len(tabpfn_model.target_columns)))
+    for j, col in enumerate(tabpfn_model.target_columns):
+        for fold_idx in range(5):
+            model_info, used_features = tabpfn_model.models[col][fold_idx]
+            model_path, model_type = model_info
+            model = load_fold_model(model_path, model_type, device)
+            X_test = X.drop(used_features, axis=1)
+            for start in range(0, len(X_test), batch_size):
+                preds[fold_idx, start:start + batch_size, j] = model.predict(X_test.iloc[start:start + batch_size])
+            del model
+            print(f"Labelled {col} fold {fold_idx}", flush=True)
+    return tabpfn_model.weighted_mean(preds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill the TabPFN ensemble into a fast student model.")
+    parser.add_argument("--n-samples", type=int, default=20000)
+    parser.add_argument("--train-csv", type=str, default=None, help="Optional CSV to draw component properties from.")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Property noise, relative to the pool's std.")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--reuse-samples", action="store_true", help=f"Skip labelling and reuse {SAMPLES_PATH}.")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    tabpfn_model = TrainedTabPFN()
+
+    if args.reuse_samples:
+        saved = np.load(SAMPLES_PATH, allow_pickle=True)
+        input_df = pd.DataFrame(saved['inputs'], columns=list(saved['columns']))
+        labels = saved['labels']
+    else:
+        pool = property_pool_from_catalog()
+        if args.train_csv:
+            pool += property_pool_from_csv(args.train_csv)
+        if not pool:
+            raise SystemExit("No component properties available to sample from.")
+
+        rng = np.random.default_rng(args.seed)
+        input_df = sample_blends(pool, args.n_samples, args.jitter, rng)
+        device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+        labels = label_with_ensemble(tabpfn_model, input_df, device, args.batch_size)
+        os.makedirs(STUDENT_DIR, exist_ok=True)
+        np.savez_compressed(SAMPLES_PATH, inputs=input_df.to_numpy(), columns=np.array(input_df.columns), labels=labels)
+
+    student = train_student(features_from_frame(input_df), labels, tabpfn_model.target_columns, random_state=args.seed)
+    student.save()
+    save_metrics(student.metrics)
+
+    print(json.dumps(student.metrics, indent=2))
+    print(f"Student error vs. ensemble: {student.error_summary()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Writes the memory-mapped variant (model/mapped_weights.py) of every stored
+fold/target model. `load_fold_model` picks these up when WEIGHT_FORMAT is
+'mmap', so the pool workers of a node share one read-only copy of the weights
+instead of deserializing their own.
+
+Each model is converted from the file it would otherwise be loaded from (the
+fit-with-cache variant when TABPFN_INFERENCE_MODE='cached' and it exists), so
+run this after model/cache_models.py, with the same settings as the workers.
+Run from the Backend directory:
+
+    python -m model.map_models [--check-csv data/train.csv]
+"""
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from config import settings
+from model import mapped_weights
+from model.trained_tabpfn import TrainedTabPFN, load_fold_model, model_source, mapped_model_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persist memory-mappable copies of the fold/target models.")
+    parser.add_argument("--check-csv", type=str, default=None, help="Rows compared between the native and the mapped model.")
+    parser.add_argument("--check-rows", type=int, default=32)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+
+    # Convert from the native files, on the CPU
+    settings.WEIGHT_FORMAT = 'native'
+    tabpfn_model = TrainedTabPFN()
+    X_check = None
+    if args.check_csv:
+        X_check = tabpfn_model.preprocess(pd.read_csv(args.check_csv, nrows=args.check_rows)[tabpfn_model.input_columns].copy())
+    os.makedirs(settings.MAPPED_WEIGHTS_DIR, exist_ok=True)
+
+    for col in tabpfn_model.target_columns:
+        for fold_idx in range(5):
+            model_info, used_features = tabpfn_model.models[col][fold_idx]
+            model_path, model_type = model_info
+            path = mapped_model_path(model_path, model_type)
+            if os.path.exists(path) and not args.overwrite:
+                print(f"Skipping {col} fold {fold_idx}: {path} exists")
+                continue
+
+            model = load_fold_model(model_path, model_type, 'cpu')
+            tensor_bytes, skeleton_bytes = mapped_weights.save(model, path)
+
+            start = time.perf_counter()
+            mapped = mapped_weights.load(path, 'cpu')
+            load_ms = (time.perf_counter() - start) * 1000
+            message = (f"Mapped {col} fold {fold_idx} ({os.path.basename(model_source(model_path, model_type))}) -> {path}: "
+                       f"{tensor_bytes / 1e6:.1f} MB mapped, {skeleton_bytes / 1e3:.1f} kB skeleton, load {load_ms:.1f} ms")
+            if X_check is not None:
+                # Sanity check: the mapped model must agree with the native one
+                X_fold = X_check.drop(columns=used_features)
+                max_diff = float(np.max(np.abs(model.predict(X_fold) - mapped.predict(X_fold))))
+                message += f", max abs diff vs. native: {max_diff:.2e}"
+            print(message, flush=True)
+
+
+if __name__ == '__main__':
+    main()
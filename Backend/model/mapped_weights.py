@@ -0,0 +1,137 @@
+"""
+Memory-mappable storage of fitted fold/target models (WEIGHT_FORMAT='mmap').
+
+A plain pickle / `.tabpfn_fit` load gives every pool worker its own copy of
+the weights. Here a model is split into its tensors and large arrays, laid
+out raw and 64-byte aligned in one file, and a small pickle of everything
+else (the estimator wrapper) that refers to them by index:
+
+    MAGIC | header length (8 bytes) | JSON header | tensor data ... | skeleton pickle
+
+`load` maps the file copy-on-write and rebuilds the estimator around views of
+the mapping, so all processes on a node share the same page-cache pages, and
+a load is an unpickle of the skeleton once the file is in the page cache.
+Tensors for a CUDA device are copied to it from the mapping.
+"""
+import io
+import os
+import json
+import pickle
+import numpy as np
+import torch
+
+MAGIC = b'BLENDMM1'
+ALIGN = 64
+# Smaller numpy arrays stay in the skeleton pickle
+MIN_ARRAY_BYTES = 64 * 1024
+
+
+def mapped_path(source_path, mapped_dir):
+    """Mapped file of a model file (its name is kept, so fitted and fit-with-cache variants don't clash)."""
+    return os.path.join(mapped_dir, os.path.basename(source_path) + '.mmap')
+
+
+class _SkeletonPickler(pickle.Pickler):
+    def __init__(self, file, blocks):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.blocks = blocks
+        self._ids = {}  # id(obj) -> persistent id, so shared/tied tensors stay shared
+
+    def _block(self, raw):
+        self.blocks.append(raw)
+        return len(self.blocks) - 1
+
+    def persistent_id(self, obj):
+        if isinstance(obj, torch.Tensor):
+            key = id(obj)
+            if key not in self._ids:
+                tensor = obj.detach().cpu().contiguous()
+                raw = tensor.reshape(-1).view(torch.uint8).numpy()
+                self._ids[key] = (
+                    'tensor', self._block(raw), str(tensor.dtype).replace('torch.', ''), list(tensor.shape),
+                    isinstance(obj, torch.nn.Parameter), bool(obj.requires_grad),
+                )
+            return self._ids[key]
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject and obj.nbytes >= MIN_ARRAY_BYTES:
+            key = id(obj)
+            if key not in self._ids:
+                array = np.ascontiguousarray(obj)
+                self._ids[key] = ('array', self._block(array.reshape(-1).view(np.uint8)), array.dtype.str, list(array.shape))
+            return self._ids[key]
+        return None
+
+
+class _SkeletonUnpickler(pickle.Unpickler):
+    def __init__(self, file, mapping, blocks, device):
+        super().__init__(file)
+        self.mapping = mapping
+        self.blocks = blocks
+        self.device = device
+        self._loaded = {}
+
+    def persistent_load(self, pid):
+        key = tuple(pid[:2])
+        if key in self._loaded:
+            return self._loaded[key]
+        kind, index = pid[0], pid[1]
+        offset, nbytes = self.blocks[index]
+        raw = self.mapping[offset:offset + nbytes]
+        if kind == 'array':
+            _, _, dtype, shape = pid
+            value = raw.view(dtype=np.dtype(dtype), type=np.ndarray).reshape(shape)
+        else:
+            _, _, dtype, shape, is_parameter, requires_grad = pid
+            value = torch.from_numpy(raw.view(type=np.ndarray)).view(getattr(torch, dtype)).reshape(shape)
+            if str(self.device) != 'cpu':
+                value = value.to(self.device)
+            if is_parameter:
+                value = torch.nn.Parameter(value, requires_grad=requires_grad)
+        self._loaded[key] = value
+        return value
+
+
+def _aligned(offset):
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def save(model, path):
+    """Writes `model` (any picklable object holding tensors/arrays) in the mapped format."""
+    blocks = []
+    skeleton = io.BytesIO()
+    _SkeletonPickler(skeleton, blocks).dump(model)
+    skeleton = skeleton.getvalue()
+
+    # The header length depends on the offsets, which depend on the header
+    # length: reserve a generous fixed-size header instead
+    header_size = _aligned(len(MAGIC) + 8 + 64 * (len(blocks) + 4))
+    offsets, offset = [], header_size
+    for raw in blocks:
+        offsets.append([offset, int(raw.nbytes)])
+        offset = _aligned(offset + raw.nbytes)
+    header = json.dumps({'blocks': offsets, 'skeleton': [offset, len(skeleton)]}).encode()
+    if len(MAGIC) + 8 + len(header) > header_size:
+        raise ValueError("Mapped weights header overflow.")
+
+    tmp_path = path + '.tmp'
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + len(header).to_bytes(8, 'little') + header)
+        for (block_offset, _), raw in zip(offsets, blocks):
+            f.seek(block_offset)
+            f.write(memoryview(raw))
+        f.seek(offset)
+        f.write(skeleton)
+    os.replace(tmp_path, path)
+    return sum(raw.nbytes for raw in blocks), len(skeleton)
+
+
+def load(path, device='cpu'):
+    """Rebuilds a model saved by `save` around a copy-on-write mapping of its file."""
+    mapping = np.memmap(path, dtype=np.uint8, mode='c')
+    if bytes(mapping[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a mapped weights file.")
+    header_length = int.from_bytes(bytes(mapping[len(MAGIC):len(MAGIC) + 8]), 'little')
+    header = json.loads(bytes(mapping[len(MAGIC) + 8:len(MAGIC) + 8 + header_length]))
+    skeleton_offset, skeleton_length = header['skeleton']
+    skeleton = io.BytesIO(bytes(mapping[skeleton_offset:skeleton_offset + skeleton_length]))
+    return _SkeletonUnpickler(skeleton, mapping, header['blocks'], device).load()
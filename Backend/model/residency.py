@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import fcntl
+import socket
+import threading
+from collections import OrderedDict, Counter
+
+import torch
+
+from config import settings
+from model.trained_tabpfn import load_fold_model
+
+RESIDENCY_STATS_DIR = './model/cache/residency'
+HOT_MODELS_FILE = 'hot_models.json'
+
+# Role of a process holding models:
+#   'pool'      worker of a Celery worker's persistent prediction pool
+#   'job_pool'  worker of a prediction script's pool (PREDICTION_POOL='subprocess'), ends with its job
+#   'celery'    Celery worker process running fan-out sub-tasks
+#   'embedded'  API process in EXECUTION_MODE='embedded'
+# Models resident in these outlive the job that loaded them:
+SERVING_ROLES = ('pool', 'celery', 'embedded')
+
+
+def current_rss():
+    """Resident set size of this process in bytes (0 if unavailable)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _cuda_allocated(device):
+    if str(device).startswith('cuda') and torch.cuda.is_available():
+        return torch.cuda.memory_allocated(torch.device(device))
+    return 0
+
+
+def budget_bytes(pool_size=1):
+    """
+    Per-process model memory budget: MODEL_MEMORY_BUDGET_MB, further limited by
+    this process' share of MODEL_NODE_MEMORY_BUDGET_MB. 0 means unlimited.
+    """
+    budgets = []
+    if settings.MODEL_MEMORY_BUDGET_MB > 0:
+        budgets.append(settings.MODEL_MEMORY_BUDGET_MB * 1024 * 1024)
+    if settings.MODEL_NODE_MEMORY_BUDGET_MB > 0:
+        budgets.append(settings.MODEL_NODE_MEMORY_BUDGET_MB * 1024 * 1024 // max(pool_size, 1))
+    return min(budgets) if budgets else 0
+
+
+class ModelResidencyManager():
+    """
+    Keeps loaded fold/target models resident within a memory budget.
+
+    Each model's footprint is measured when it's loaded (RSS + CUDA allocation
+    delta, at least the file size). When the budget is exceeded the least
+    recently used models are evicted. Hit/load/reload/eviction counters are
+    written to RESIDENCY_STATS_DIR so `/models/residency` can report them for
+    every process on the node.
+    """
+    def __init__(self, budget=0, loader=load_fold_model, stats_dir=RESIDENCY_STATS_DIR, role='process'):
+        self.budget = budget
+        self.role = role
+        self.loader = loader
+        self.stats_dir = stats_dir
+        self._models = OrderedDict()  # (model_path, device) -> (model, size_bytes)
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._loading = {}  # key -> lock held while one thread loads it
+        self._last_write = 0.0
+        self.access_counts = Counter()
+        self.hits = 0
+        self.loads = 0
+        self.reloads = 0
+        self.evictions = 0
+
+    def get(self, model_path, model_type, device):
+        key = (model_path, device)
+        with self._lock:
+            self.access_counts[model_path] += 1
+            model = self._resident(key)
+            if model is None:
+                loading = self._loading.setdefault(key, threading.Lock())
+        if model is not None:
+            self.write_stats()
+            return model
+
+        # Threads missing the same model wait for the one loading it
+        with loading:
+            with self._lock:
+                model = self._resident(key)
+            if model is not None:
+                self.write_stats()
+                return model
+            try:
+                rss_before, cuda_before = current_rss(), _cuda_allocated(device)
+                model = self.loader(model_path, model_type, device)
+                size = (current_rss() - rss_before) + (_cuda_allocated(device) - cuda_before)
+                size = max(size, os.path.getsize(model_path) if os.path.exists(model_path) else 0)
+
+                with self._lock:
+                    self.loads += 1
+                    if key in self._seen:
+                        self.reloads += 1
+                    self._seen.add(key)
+                    self._models[key] = (model, size)
+                    self._evict_to_budget(keep=key)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        self.write_stats(force=True)
+        return model
+
+    def _resident(self, key):
+        """The resident model of `key` (counted as a hit) or None; call with the lock held."""
+        if key not in self._models:
+            return None
+        self._models.move_to_end(key)
+        self.hits += 1
+        return self._models[key][0]
+
+    def _evict_to_budget(self, keep):
+        if self.budget <= 0:
+            return
+        while self.resident_bytes() > self.budget and len(self._models) > 1:
+            key = next(iter(self._models))
+            if key == keep:
+                break
+            del self._models[key]
+            self.evictions += 1
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def resident_bytes(self):
+        return sum(size for _, size in self._models.values())
+
+    def preload(self, candidates, limit):
+        """
+        Loads the hottest models (by access counts recorded on this node) until
+        `limit` models are resident or the budget is full.
+        candidates: list of (model_path, model_type, device).
+        """
+        counts = node_access_counts(self.stats_dir)
+        ranked = sorted(candidates, key=lambda c: counts.get(c[0], 0), reverse=True)
+        for model_path, model_type, device in ranked[:limit]:
+            if self.budget > 0 and self.resident_bytes() >= self.budget:
+                break
+            self.get(model_path, model_type, device)
+            self.access_counts[model_path] -= 1  # Preloading isn't an access
+
+    def stats(self):
+        with self._lock:
+            return {
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'role': self.role,
+                'updated_at': time.time(),
+                'budget_bytes': self.budget,
+                'resident_models': len(self._models),
+                'resident_bytes': self.resident_bytes(),
+                'rss_bytes': current_rss(),
+                'hits': self.hits,
+                'loads': self.loads,
+                'reloads': self.reloads,
+                'evictions': self.evictions,
+                'access_counts': dict(self.access_counts),
+            }
+
+    def write_stats(self, force=False):
+        # Hits are frequent, only persist them once a second
+        now = time.time()
+        if not force and now - self._last_write < 1.0:
+            return
+        self._last_write = now
+        try:
+            os.makedirs(self.stats_dir, exist_ok=True)
+            path = os.path.join(self.stats_dir, f"{socket.gethostname()}-{os.getpid()}.json")
+            # Per-thread temp file, thread-pool workers share the process
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.stats(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not write residency stats: {e}")
+
+
+def _read_hot_models(stats_dir):
+    try:
+        with open(os.path.join(stats_dir, HOT_MODELS_FILE)) as f:
+            return Counter(json.load(f))
+    except (OSError, ValueError):
+        return Counter()
+
+
+def _retire_stats(stats_dir, path, stats):
+    """Folds a finished process' access counts into the node totals and drops its file."""
+    hot_path = os.path.join(stats_dir, HOT_MODELS_FILE)
+    try:
+        # Several processes may retire files at once: one at a time, and each
+        # file only once; readers only ever see a complete hot list
+        with open(hot_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not os.path.exists(path):
+                return
+            hot = _read_hot_models(stats_dir)
+            hot.update(stats.get('access_counts', {}))
+            tmp_path = f"{hot_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(dict(hot), f)
+            os.replace(tmp_path, hot_path)
+            os.remove(path)
+    except OSError:
+        pass
+
+
+def read_node_stats(stats_dir=RESIDENCY_STATS_DIR, max_age=3600):
+    """Stats of all live processes on this node; files of finished processes are retired."""
+    host = socket.gethostname()
+    processes = []
+    if not os.path.isdir(stats_dir):
+        return processes
+    for name in os.listdir(stats_dir):
+        if not name.endswith('.json') or name == HOT_MODELS_FILE:
+            continue
+        path = os.path.join(stats_dir, name)
+        try:
+            with open(path) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if stats.get('host') == host:
+            try:
+                os.kill(stats['pid'], 0)
+                alive = True
+            except OSError:
+                alive = False
+        else:
+            alive = time.time() - stats.get('updated_at', 0) < max_age
+        if not alive:
+            _retire_stats(stats_dir, path, stats)
+            continue
+        processes.append(stats)
+    return processes
+
+
+def node_access_counts(stats_dir=RESIDENCY_STATS_DIR):
+    counts = _read_hot_models(stats_dir)
+    for stats in read_node_stats(stats_dir):
+        counts.update(stats.get('access_counts', {}))
+    return counts
+
+
+def summarize(processes):
+    return {
+        'processes': len(processes),
+        'roles': dict(Counter(p.get('role', 'process') for p in processes)),
+        'resident_models': sum(p['resident_models'] for p in processes),
+        'resident_bytes': sum(p['resident_bytes'] for p in processes),
+        'rss_bytes': sum(p['rss_bytes'] for p in processes),
+        'hits': sum(p['hits'] for p in processes),
+        'loads': sum(p['loads'] for p in processes),
+        'reloads': sum(p['reloads'] for p in processes),
+        'evictions': sum(p['evictions'] for p in processes),
+    }
+
+
+# --- Process-wide manager ---
+residency_manager = None
+
+
+def warm_processes(processes):
+    """Processes with resident models that will serve later jobs (see SERVING_ROLES)."""
+    return [p for p in processes if p.get('role') in SERVING_ROLES and p['resident_models'] > 0]
+
+
+def get_residency_manager(pool_size=1, role='process'):
+    """This process's manager; the first call sets its budget and role."""
+    global residency_manager
+    if residency_manager is None:
+        residency_manager = ModelResidencyManager(budget=budget_bytes(pool_size), role=role)
+    return residency_manager
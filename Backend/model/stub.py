@@ -0,0 +1,26 @@
+import time
+import zlib
+import numpy as np
+
+from config import settings
+
+
+class StubFoldModel():
+    """
+    Stand-in for a fitted fold/target model (MODEL_BACKEND='stub'), for load
+    tests and local runs without GPUs or HuggingFace weights.
+
+    Predictions are a fixed random projection of the input columns, seeded by
+    the model path, so they're deterministic per model. STUB_LATENCY_MS
+    simulates per-call model time.
+    """
+    def __init__(self, model_path):
+        self.model_path = model_path
+        self.seed = zlib.crc32(model_path.encode())
+
+    def predict(self, X):
+        if settings.STUB_LATENCY_MS > 0:
+            time.sleep(settings.STUB_LATENCY_MS / 1000)
+        values = np.nan_to_num(np.asarray(X, dtype=np.float64))
+        coefs = np.random.default_rng(self.seed).normal(scale=1.0 / max(values.shape[1], 1), size=values.shape[1])
+        return values @ coefs
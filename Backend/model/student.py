@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import pickle
+import numpy as np
+
+STUDENT_DIR = './model/student'
+STUDENT_PATH = os.path.join(STUDENT_DIR, 'student.pkl')
+METRICS_PATH = os.path.join(STUDENT_DIR, 'metrics.json')
+
+N_COMPONENTS = 5
+N_PROPERTIES = 10
+
+
+# --- Feature Construction (NumPy mirror of TrainedTabPFN.preprocess) ---
+def blend_features(fractions, properties):
+    """
+    Builds the student's input features.
+
+    fractions: (n, 5) fractions in 0-1, properties: (n, 5, 10).
+    Returns (n, 115): fractions, raw properties, per-component weighted
+    properties and the weighted average of each property.
+    """
+    fractions = np.asarray(fractions, dtype=np.float64)
+    properties = np.asarray(properties, dtype=np.float64)
+    n = fractions.shape[0]
+    weighted = fractions[:, :, None] * properties
+    return np.concatenate([
+        fractions,
+        properties.reshape(n, -1),
+        weighted.reshape(n, -1),
+        weighted.sum(axis=1),
+    ], axis=1)
+
+
+def features_from_frame(df):
+    """Student features from a DataFrame with the `INPUT_COLUMNS` layout."""
+    fractions = np.stack([
+        df[f'Component{i}_fraction'].to_numpy(dtype=np.float64) for i in range(1, N_COMPONENTS + 1)
+    ], axis=1)
+    properties = np.stack([
+        np.stack([df[f'Component{i}_Property{j}'].to_numpy(dtype=np.float64) for j in range(1, N_PROPERTIES + 1)], axis=1)
+        for i in range(1, N_COMPONENTS + 1)
+    ], axis=1)
+    return blend_features(np.nan_to_num(fractions), np.nan_to_num(properties))
+
+
+def features_from_components(components):
+    """Student features for a single blend given as request components (fraction in %)."""
+    fractions = np.zeros((1, N_COMPONENTS))
+    properties = np.zeros((1, N_COMPONENTS, N_PROPERTIES))
+    for idx, component in enumerate(components[:N_COMPONENTS]):
+        fractions[0, idx] = float(component.get('fraction')) / 100
+        properties[0, idx, :] = [float(v) for v in component.get('properties')[:N_PROPERTIES]]
+    return blend_features(fractions, properties)
+
+
+# --- Student Model ---
+class StudentModel():
+    """
+    Per-target MLPs distilled from the TabPFN ensemble (see model/distill.py).
+
+    The sklearn estimators are only used for training; prediction runs the
+    stored weights with plain NumPy so a single blend costs well under a
+    millisecond.
+    """
+    def __init__(self, state):
+        self.target_columns = state['target_columns']
+        self.x_mean = state['x_mean']
+        self.x_scale = state['x_scale']
+        self.layers = state['layers']
+        self.y_mean = state['y_mean']
+        self.y_scale = state['y_scale']
+        self.metrics = state.get('metrics', {})
+
+    @classmethod
+    def load(cls, path=STUDENT_PATH):
+        with open(path, 'rb') as f:
+            return cls(pickle.load(f))
+
+    def save(self, path=STUDENT_PATH):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        state = {
+            'target_columns': self.target_columns,
+            'x_mean': self.x_mean,
+            'x_scale': self.x_scale,
+            'layers': self.layers,
+            'y_mean': self.y_mean,
+            'y_scale': self.y_scale,
+            'metrics': self.metrics,
+        }
+        with open(path, 'wb') as f:
+            pickle.dump(state, f)
+
+    def predict_features(self, features, targets=None):
+        """Returns predictions of shape (n_samples, n_targets)."""
+        targets = targets or self.target_columns
+        z = (features - self.x_mean) / self.x_scale
+        outputs = []
+        for col in targets:
+            h = z
+            layers = self.layers[col]
+            for W, b in layers[:-1]:
+                h = np.maximum(h @ W + b, 0.0)
+            W, b = layers[-1]
+            outputs.append((h @ W + b)[:, 0])
+        cols = [self.target_columns.index(c) for c in targets]
+        return np.stack(outputs, axis=1) * self.y_scale[cols] + self.y_mean[cols]
+
+    def predict(self, df, targets=None):
+        return self.predict_features(features_from_frame(df), targets)
+
+    def predict_components(self, components, targets=None):
+        return self.predict_features(features_from_components(components), targets)
+
+    def error_summary(self):
+        """Mean error of the student vs. the full ensemble on its hold-out set."""
+        per_target = self.metrics.get('per_target', {})
+        if not per_target:
+            return None
+        return {
+            'mae': float(np.mean([m['mae'] for m in per_target.values()])),
+            'mape': float(np.mean([m['mape'] for m in per_target.values()])),
+        }
+
+
+def student_available(path=STUDENT_PATH):
+    return os.path.exists(path)
+
+
+# --- Training ---
+def train_student(features, labels, target_columns, hidden_layers=(64, 64), test_size=0.2, random_state=42):
+    """
+    Fits one small MLP per target on ensemble-labelled samples and measures
+    its hold-out error against the ensemble and its single-row latency.
+    """
+    from sklearn.neural_network import MLPRegressor
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import mean_absolute_error, mean_absolute_percentage_error
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        features, labels, test_size=test_size, random_state=random_state
+    )
+    x_mean = X_train.mean(axis=0)
+    x_scale = X_train.std(axis=0)
+    x_scale[x_scale == 0] = 1.0
+    y_mean = y_train.mean(axis=0)
+    y_scale = y_train.std(axis=0)
+    y_scale[y_scale == 0] = 1.0
+
+    z_train = (X_train - x_mean) / x_scale
+    layers = {}
+    for j, col in enumerate(target_columns):
+        mlp = MLPRegressor(
+            hidden_layer_sizes=hidden_layers, activation='relu',
+            early_stopping=True, max_iter=1000, random_state=random_state,
+        )
+        mlp.fit(z_train, (y_train[:, j] - y_mean[j]) / y_scale[j])
+        layers[col] = [(W, b) for W, b in zip(mlp.coefs_, mlp.intercepts_)]
+        print(f"Trained student for {col} ({mlp.n_iter_} iterations)")
+
+    student = StudentModel({
+        'target_columns': list(target_columns),
+        'x_mean': x_mean, 'x_scale': x_scale,
+        'layers': layers,
+        'y_mean': y_mean, 'y_scale': y_scale,
+    })
+
+    y_pred = student.predict_features(X_test)
+    per_target = {}
+    for j, col in enumerate(target_columns):
+        per_target[col] = {
+            'mae': float(mean_absolute_error(y_test[:, j], y_pred[:, j])),
+            'mape': float(mean_absolute_percentage_error(y_test[:, j], y_pred[:, j])),
+        }
+
+    single = X_test[:1]
+    n_calls = 1000
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        student.predict_features(single)
+    latency_ms = (time.perf_counter() - start) / n_calls * 1000
+
+    student.metrics = {
+        'n_train': int(len(X_train)),
+        'n_test': int(len(X_test)),
+        'per_target': per_target,
+        'single_prediction_ms': latency_ms,
+    }
+    return student
+
+
+def save_metrics(metrics, path=METRICS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(metrics, f, indent=2)
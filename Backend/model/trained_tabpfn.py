@@ -4,6 +4,7 @@ from tabpfn.model.loading import (
     save_fitted_tabpfn_model,
 )
 from pathlib import Path
+from itertools import cycle
 from tabpfn_extensions import TunedTabPFNRegressor
 import pickle
 from sklearn.metrics import mean_absolute_percentage_error
@@ -19,6 +20,9 @@ warnings.filterwarnings('ignore')
 
 import os
 os.environ['TABPFN_ALLOW_CPU_LARGE_DATASET'] = '1'
+import torch
+from model.stub import StubFoldModel
+from model import mapped_weights
 import pandas as pd
 import pickle
 import numpy as np
@@ -44,12 +48,111 @@ from tabpfn.model.loading import (
     save_fitted_tabpfn_model,
 )
 
+TARGET_COLUMNS = ['BlendProperty1', 'BlendProperty2', 'BlendProperty3', 'BlendProperty4', 'BlendProperty5',
+                  'BlendProperty6', 'BlendProperty7', 'BlendProperty8', 'BlendProperty9', 'BlendProperty10']
+INPUT_COLUMNS = ['Component1_fraction','Component2_fraction','Component3_fraction','Component4_fraction','Component5_fraction','Component1_Property1','Component2_Property1','Component3_Property1','Component4_Property1','Component5_Property1','Component1_Property2','Component2_Property2','Component3_Property2','Component4_Property2','Component5_Property2','Component1_Property3','Component2_Property3','Component3_Property3','Component4_Property3','Component5_Property3','Component1_Property4','Component2_Property4','Component3_Property4','Component4_Property4','Component5_Property4','Component1_Property5','Component2_Property5','Component3_Property5','Component4_Property5','Component5_Property5','Component1_Property6','Component2_Property6','Component3_Property6','Component4_Property6','Component5_Property6','Component1_Property7','Component2_Property7','Component3_Property7','Component4_Property7','Component5_Property7','Component1_Property8','Component2_Property8','Component3_Property8','Component4_Property8','Component5_Property8','Component1_Property9','Component2_Property9','Component3_Property9','Component4_Property9','Component5_Property9','Component1_Property10','Component2_Property10','Component3_Property10','Component4_Property10','Component5_Property10']
+
+QUALITY_TIERS = ('full', 'preview', 'fast')
+
+# Per-target weights of the 5 fold models in the final ensemble
+FOLD_WEIGHTS = {
+    'BlendProperty1': [0.2, 0.2, 0.2, 0.2, 0.2],
+    'BlendProperty2': [0.2, 0.2, 0.2, 0.2, 0.2],
+    'BlendProperty3': [0.4, 0.05, 0.15, 0.05, 0.35],  # [0.15,0.1,0.15,0.5,0.1]
+    'BlendProperty4': [0.5, 0.1, 0.3, 0.05, 0.05],
+    'BlendProperty5': [0.3, 0.3, 0.1, 0.1, 0.2],
+    'BlendProperty6': [0.1, 0.1, 0.4, 0.1, 0.3],
+    'BlendProperty7': [1.5, -0.2, -0.1, -0.15, -0.05],  ### 3 [0.2,0.05,0.05,0.4,0.3] == 93.083
+    'BlendProperty8': [-0.05, 0.54, -0.05, 0.6, -0.05],  ### 2 [0.5,0.03,0.03,0.36,0.03] == 92.986
+    'BlendProperty9': [0.22, 0.1, 0.3, 0.18, 0.18],  ### 1 [1,0,0,0,0] == 93 | [0.92,0.015,0.05,0.01,0.005] == 92.93
+    'BlendProperty10': [0.1, 0.1, 0.15, 0.5, 0.15],  ### 4 [0,0,0,1,0]  | [0.03,0.03,0.03,0.88,0.03]
+}
+
+
+def resolve_targets(targets=None):
+    """
+    Validates a requested subset of TARGET_COLUMNS, keeping the request order.
+    None or an empty list means all targets. Raises ValueError on unknown names.
+    """
+    if not targets:
+        return list(TARGET_COLUMNS)
+    unknown = [t for t in targets if t not in TARGET_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown target properties: {', '.join(unknown)}")
+    return list(dict.fromkeys(targets))
+
+
+CACHE_DIR = './model/cache'
+
+
+def cached_model_path(model_path):
+    """Where the fit-with-cache variant of a `.tabpfn_fit` model is persisted."""
+    return os.path.join(CACHE_DIR, Path(model_path).stem + '.tabpfn_cache')
+
+
+def load_cached_tabpfn_model(cache_path, device):
+    """
+    Loads a TabPFN model persisted with `fit_mode='fit_with_cache'`, i.e. with
+    the training context already encoded, so `predict` only runs the test rows.
+    """
+    model = torch.load(cache_path, map_location=device, weights_only=False)
+    return _set_estimator_device(model, device)
+
+
+def _set_estimator_device(model, device):
+    model.device = device
+    if hasattr(model, 'device_'):
+        model.device_ = torch.device(device)
+    return model
+
+
+def model_source(model_path, model_type):
+    """The file `load_fold_model` reads a model from natively: its fit-with-cache variant if that's used."""
+    if model_type == 'tabpfn':
+        cache_path = cached_model_path(model_path)
+        if settings.TABPFN_INFERENCE_MODE == 'cached' and os.path.exists(cache_path):
+            return cache_path
+    return model_path
+
+
+def mapped_model_path(model_path, model_type):
+    return mapped_weights.mapped_path(model_source(model_path, model_type), settings.MAPPED_WEIGHTS_DIR)
+
+
+def load_fold_model(model_path, model_type, device):
+    """
+    Loads one of the stored fold/target models onto the given device.
+    """
+    if settings.MODEL_BACKEND == 'stub':
+        return StubFoldModel(model_path)
+    if settings.WEIGHT_FORMAT == 'mmap':
+        mapped_path = mapped_model_path(model_path, model_type)
+        if os.path.exists(mapped_path):
+            model = mapped_weights.load(mapped_path, device)
+            return _set_estimator_device(model, device) if model_type == 'tabpfn' else model
+    if model_type == 'tabpfn':
+        source = model_source(model_path, model_type)
+        if source != model_path:
+            return load_cached_tabpfn_model(source, device)
+        model = load_fitted_tabpfn_model(Path(model_path), device=device)
+    elif model_type == 'pickle':
+        with open(model_path, 'rb') as f:
+            model = pickle.load(f)
+        # Manually move the model to the target device if it's a PyTorch model
+        if hasattr(model, 'to'):
+            model.to(device)
+    else:
+        raise ValueError(f"Unknown model type: {model_type}")
+    return model
+
 
 class TrainedTabPFN():
-    def __init__(self):
-        print('Downloading trained TabPFN models from HuggingFace Hub')
-        snapshot_download(repo_id='akhil838/FuelBlend_Trained_models_v2', local_dir='./model/weights', token = settings.HF_TOKEN )
-        print('Saved to weights folder')
+    def __init__(self, download=True):
+        # download=False only builds the model table (e.g. to check the weights on disk)
+        if download and settings.MODEL_BACKEND != 'stub':
+            print('Downloading trained TabPFN models from HuggingFace Hub')
+            snapshot_download(repo_id='akhil838/FuelBlend_Trained_models_v2', local_dir='./model/weights', token = settings.HF_TOKEN )
+            print('Saved to weights folder')
         print(os.path.abspath('.'))
         self.models = {
             "BlendProperty1":{#97.866 ### + 
@@ -126,11 +229,14 @@ class TrainedTabPFN():
 
         }
         self.folds = KFold(n_splits=5, shuffle=True, random_state=42)
-        self.target_columns = ['BlendProperty1', 'BlendProperty2', 'BlendProperty3', 'BlendProperty4', 'BlendProperty5',
-                  'BlendProperty6', 'BlendProperty7', 'BlendProperty8', 'BlendProperty9', 'BlendProperty10']
-        self.input_columns = ['Component1_fraction','Component2_fraction','Component3_fraction','Component4_fraction','Component5_fraction','Component1_Property1','Component2_Property1','Component3_Property1','Component4_Property1','Component5_Property1','Component1_Property2','Component2_Property2','Component3_Property2','Component4_Property2','Component5_Property2','Component1_Property3','Component2_Property3','Component3_Property3','Component4_Property3','Component5_Property3','Component1_Property4','Component2_Property4','Component3_Property4','Component4_Property4','Component5_Property4','Component1_Property5','Component2_Property5','Component3_Property5','Component4_Property5','Component5_Property5','Component1_Property6','Component2_Property6','Component3_Property6','Component4_Property6','Component5_Property6','Component1_Property7','Component2_Property7','Component3_Property7','Component4_Property7','Component5_Property7','Component1_Property8','Component2_Property8','Component3_Property8','Component4_Property8','Component5_Property8','Component1_Property9','Component2_Property9','Component3_Property9','Component4_Property9','Component5_Property9','Component1_Property10','Component2_Property10','Component3_Property10','Component4_Property10','Component5_Property10']
+        self.target_columns = list(TARGET_COLUMNS)
+        self.input_columns = list(INPUT_COLUMNS)
     
 
+    def model_files(self):
+        """(model_path, model_type) of every fold/target model."""
+        return [tuple(self.models[col][fold_idx][0]) for col in self.target_columns for fold_idx in range(5)]
+
     def predict(self, X):
         X = self.preprocess(X)
         final_pred = []
@@ -168,6 +274,35 @@ class TrainedTabPFN():
         pred_col = model.predict(X_test)
 
         return pred_col
+
+    def components_frame(self, components):
+        """Single-row input frame for a blend given as request components (fraction in %)."""
+        input_df = {}
+        for idx, component in enumerate(components):
+            input_df[f'Component{idx+1}_fraction'] = [float(component.get('fraction')/100)]
+            for j in range(1, 11):
+                input_df[f'Component{idx+1}_Property{j}'] = [float(component.get('properties')[j-1])]
+
+        input_df = pd.DataFrame(input_df, columns=self.input_columns)
+        input_df.fillna(0, inplace=True)
+        return input_df
+
+    def blends_frame(self, components, fractions):
+        """
+        Input frame with one row per fraction vector (in %, ordered like
+        `components`) over the same components.
+        """
+        fractions = np.asarray(fractions, dtype=float)
+        input_df = {}
+        for idx, component in enumerate(components):
+            input_df[f'Component{idx+1}_fraction'] = fractions[:, idx] / 100
+            for j in range(1, 11):
+                input_df[f'Component{idx+1}_Property{j}'] = np.full(len(fractions), float(component.get('properties')[j-1]))
+
+        input_df = pd.DataFrame(input_df, columns=self.input_columns)
+        input_df.fillna(0, inplace=True)
+        return input_df
+
     def preprocess(self, X):
         for col in ['Component1_fraction', 'Component2_fraction', 'Component3_fraction', 'Component4_fraction',
                     'Component5_fraction']:
@@ -246,39 +381,74 @@ class TrainedTabPFN():
         return best_fractions
 
     def weighted_mean(self, preds):
+        """
+        Combines the per-fold predictions of shape (5, n_samples, n_targets)
+        with the per-target fold weights in FOLD_WEIGHTS.
+        """
         print(preds.shape)
         d, r, c = preds.shape
-        final_pred = [[0 for i in range(c)] for j in range(r)]
-
-        for i in range(r):
-            for j in range(c):  # 3 7 8 9
-                f1, f2, f3, f4, f5 = [0.2, 0.2, 0.2, 0.2, 0.2]
-
-                if j + 1 == 1:
-                    f1, f2, f3, f4, f5 = [0.2, 0.2, 0.2, 0.2, 0.2]
-                elif j + 1 == 3:  ###
-                    f1, f2, f3, f4, f5 = [0.4, 0.05, 0.15, 0.05, 0.35]  # [0.15,0.1,0.15,0.5,0.1]
-                elif j + 1 == 4:
-                    f1, f2, f3, f4, f5 = [0.5, 0.1, 0.3, 0.05, 0.05]
-                elif j + 1 == 5:
-                    f1, f2, f3, f4, f5 = [0.3, 0.3, 0.1, 0.1, 0.2]
-                elif j + 1 == 6:
-                    f1, f2, f3, f4, f5 = [0.1, 0.1, 0.4, 0.1, 0.3]
-                elif j + 1 == 7:  ###
-                    f1, f2, f3, f4, f5 = [1.5, -0.2, -0.1, -0.15, -0.05]  ### 3 [0.2,0.05,0.05,0.4,0.3] == 93.083
-                elif j + 1 == 8:  ###
-                    f1, f2, f3, f4, f5 = [-0.05, 0.54, -0.05, 0.6,
-                                          -0.05]  # [0.5,0.03,0.03,0.36,0.03] ### 2 [0.5,0.03,0.03,0.36,0.03] == 92.986
-                elif j + 1 == 9:  ###
-                    f1, f2, f3, f4, f5 = [0.22, 0.1, 0.3, 0.18,
-                                          0.18]  ### 1 [1,0,0,0,0] == 93 | [0.92,0.015,0.05,0.01,0.005] == 92.93 | [0.97,0.05,-0.1,-0.15,-0.1]
-                elif j + 1 == 10:
-                    f1, f2, f3, f4, f5 = [0.1, 0.1, 0.15, 0.5, 0.15]  ### 4 [0,0,0,1,0]  | [0.03,0.03,0.03,0.88,0.03]
-                final_pred[i][j] = preds[0][i][j] * f1 + preds[1][i][j] * f2 + preds[2][i][j] * f3 + preds[3][i][
-                    j] * f4 + preds[4][i][j] * f5
-
-        final_pred = np.array(final_pred)
+        weights = np.array([FOLD_WEIGHTS[col] for col in self.target_columns[:c]]).T  # (5, n_targets)
+        final_pred = np.einsum('drc,dc->rc', preds, weights)
         print(final_pred.shape)
         return final_pred
 
-
+    def select_folds(self, quality='full', targets=None):
+        """
+        Folds to run per target for a quality tier: 'full' uses all 5 folds,
+        'preview' only the highest-weighted fold of each target.
+        """
+        folds_by_target = {}
+        for col in targets or self.target_columns:
+            if quality == 'preview':
+                folds_by_target[col] = [int(np.argmax(FOLD_WEIGHTS[col]))]
+            else:
+                folds_by_target[col] = list(range(5))
+        return folds_by_target
+
+    def prediction_tasks(self, X, devices, folds_by_target, chunk_rows=0):
+        """
+        Argument tuples for `_load_and_predict_worker`, one per (fold, target)
+        and row chunk. X is either the feature DataFrame or the handle of a
+        SharedFeatureMatrix; each task carries the columns its model uses and
+        its (start, stop) row range.
+        """
+        if isinstance(X, dict):
+            all_columns, n_rows = X['columns'], X['shape'][0]
+        else:
+            all_columns, n_rows = list(X.columns), len(X)
+        chunk_rows = chunk_rows if chunk_rows > 0 else max(n_rows, 1)
+        row_ranges = [(start, min(start + chunk_rows, n_rows)) for start in range(0, max(n_rows, 1), chunk_rows)]
+
+        device_cycle = cycle(devices)
+        tasks = []
+        for col, folds in folds_by_target.items():
+            for fold_idx in folds:
+                model_info, used_features = self.models[col][fold_idx]
+                model_path, model_type = model_info
+                columns = [c for c in all_columns if c not in used_features and c != 'ID']
+                for row_range in row_ranges:
+                    tasks.append((model_path, model_type, next(device_cycle), X, columns, col, fold_idx, row_range))
+        return tasks
+
+    def collect(self, results_map, result, n_rows):
+        """Stores one `_load_and_predict_worker` result in results_map[fold_idx][col]."""
+        fold_idx, col_name, prediction, (start, stop) = result
+        fold_results = results_map.setdefault(fold_idx, {})
+        if col_name not in fold_results:
+            fold_results[col_name] = np.empty(n_rows)
+        fold_results[col_name][start:stop] = prediction
+
+    def combine(self, results_map, folds_by_target):
+        """
+        Weighted mean of the fold predictions in results_map[fold_idx][col].
+        Weights of a fold subset are re-normalized to sum to 1.
+        Returns shape (n_samples, n_targets), targets ordered like folds_by_target.
+        """
+        columns = []
+        for col, folds in folds_by_target.items():
+            weights = np.array([FOLD_WEIGHTS[col][f] for f in folds])
+            if len(folds) < 5:
+                weights = weights / weights.sum()
+            stacked = np.stack([np.asarray(results_map[f][col], dtype=float) for f in folds])
+            columns.append(weights @ stacked)
+        return np.stack(columns, axis=1)
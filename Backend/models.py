@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Literal
 
 # --- Component Models ---
 # FIX: The model now expects a simple 'id' field, with no aliasing.
@@ -47,12 +47,76 @@ class BlendComponent(BaseModel):
 
 class BlendManualRequest(BaseModel):
     components: List[BlendComponent]
+    # 'full' runs all 5 folds, 'preview' the best-weighted fold per target,
+    # 'fast' the distilled student model
+    quality: Literal['full', 'preview', 'fast'] = 'full'
+    # Subset of BlendProperty1..10 to predict (None = all), outputs follow this order
+    targets: Optional[List[str]] = None
+    # Profile the job (see profiling.py)
+    profile: bool = False
+
+class FractionConstraint(BaseModel):
+    # Bounds are in %, matched to a component by name
+    name: str
+    min_fraction: Optional[float] = None
+    max_fraction: Optional[float] = None
+    fixed_fraction: Optional[float] = None
 
 class EstimateFractionsRequest(BaseModel):
     target_properties: List[float]
     components: List[BlendComponent]
     n_trials: int
     target_cost: Optional[float] = None
+    warm_start: bool = True
+    constraints: List[FractionConstraint] = []
+    quality: Literal['full', 'preview', 'fast'] = 'full'
+    # Properties to match (None = all); target_properties lists one value per
+    # target here, or the full 10-value vector
+    targets: Optional[List[str]] = None
+    # Answer from the component set's simplex index if there is one; with
+    # refine_trials > 0, that many ensemble trials start from its best recipes
+    use_index: bool = True
+    refine_trials: int = Field(0, ge=0)
+    profile: bool = False
+
+class BlendTarget(BaseModel):
+    # Either the property values or the id of a stored target component
+    name: Optional[str] = None
+    target_properties: Optional[List[float]] = None
+    target_component_id: Optional[str] = None
+    target_cost: Optional[float] = None
+
+class EstimateFractionsMultiRequest(BaseModel):
+    # Several targets searched at once: each candidate is predicted once and
+    # scored against all of them
+    blend_targets: List[BlendTarget]
+    components: List[BlendComponent]
+    n_trials: int
+    warm_start: bool = True
+    constraints: List[FractionConstraint] = []
+    quality: Literal['full', 'preview', 'fast'] = 'full'
+    targets: Optional[List[str]] = None
+    profile: bool = False
+
+class SimplexIndexRequest(BaseModel):
+    components: List[BlendComponent]
+    # Grid size, rounded up to a power of two (plus the vertices)
+    n_points: int = Field(16384, ge=64, le=2097152)
+    quality: Literal['full', 'preview', 'fast'] = 'full'
+
+class SensitivityRequest(BaseModel):
+    components: List[BlendComponent]
+    # Finite-difference step in percentage points of each component's fraction
+    step: float = Field(1.0, gt=0, le=25)
+    quality: Literal['full', 'preview', 'fast'] = 'full'
+    targets: Optional[List[str]] = None
+    profile: bool = False
+
+class JobStatusRequest(BaseModel):
+    job_ids: List[str] = Field(..., min_length=1, max_length=1000)
+    # False leaves the results of finished jobs out (fetch them one by one)
+    include_results: bool = True
+    format: Literal['rows', 'columnar'] = 'rows'
 
 # --- App Data Models ---
 # FIX: Updated to expect a simple 'id' field.
@@ -7,16 +7,22 @@ import pandas as pd
 import numpy as np
 import random
 import multiprocessing as mp
-from itertools import cycle
 
 # Make sure these can be imported. They should be in the same directory
 # or your Python path.
-from celery_worker import TrainedTabPFN, _load_and_predict_worker
+from celery_worker import TrainedTabPFN, _load_and_predict_worker, _init_prediction_worker, prediction_devices
+from shared_matrix import SharedFeatureMatrix
+from config import settings
+from serialization import dumps_str
+import profiling
+import tracing
 
 def run_batch_predictions():
     # --- 1. Set up argument parser to read the file path ---
     parser = argparse.ArgumentParser(description="Run batch predictions on a CSV file.")
     parser.add_argument("--file-path", required=True, type=str, help="Path to the input CSV file.")
+    parser.add_argument("--quality", default="full", choices=["full", "preview"], help="Fold subset to run.")
+    parser.add_argument("--targets", default=None, type=str, help="Comma-separated target properties (default: all).")
     args = parser.parse_args()
 
     # --- 2. Initialize model and read data ---
@@ -32,62 +38,54 @@ def run_batch_predictions():
         return
 
     # --- 3. Preprocess and Set up Parallel Tasks (same as before) ---
-    X = tabpfn_model.preprocess(input_df)
+    with tracing.span('preprocess', rows=len(input_df)):
+        X = tabpfn_model.preprocess(input_df)
 
-    num_gpus = torch.cuda.device_count()
-    if num_gpus == 0:
+    devices, pool_size = prediction_devices()
+    if pool_size == 0:
         print(json.dumps({"type": "error", "message": "No GPUs found on worker."}), flush=True)
         return
 
-    devices = [f'cuda:{i}' for i in range(num_gpus)]
-    device_cycle = cycle(devices)
-    tasks = []
-    for fold_idx in range(5):
-        for col in tabpfn_model.target_columns:
-            model_info, used_features = tabpfn_model.models[col][fold_idx]
-            model_path, model_type = model_info
-            assigned_device = next(device_cycle)
-            # The worker function takes the entire dataframe X
-            task_args = (model_path, model_type, assigned_device, X, used_features, col, fold_idx)
-            tasks.append(task_args)
+    targets = args.targets.split(',') if args.targets else None
+    folds_by_target = tabpfn_model.select_folds(args.quality, targets)
+    n_rows = len(X)
             
-    # --- 4. Execute, Report Progress, and Re-assemble (same as before) ---
-    total_steps = len(tasks)
+    # --- 4. Execute, Report Progress, and Re-assemble ---
     results_map = {}
-    
-    with mp.Pool(processes=num_gpus) as pool:
-        for i, result in enumerate(pool.imap_unordered(_load_and_predict_worker, tasks)):
-            fold_idx, col_name, prediction = result
-            if fold_idx not in results_map:
-                results_map[fold_idx] = {}
-            results_map[fold_idx][col_name] = prediction
-            
-            progress = int(((i + 1) / total_steps) * 100)
-            print(json.dumps({"type": "progress", "value": progress}), flush=True)
 
-    final_pred_list = []
-    for fold_idx in range(5):
-        fold_preds = [results_map[fold_idx][col] for col in tabpfn_model.target_columns]
-        # Transpose to get shape (n_samples, n_targets)
-        final_pred_list.append(np.array(fold_preds).T)
+    # X is placed in shared memory once; the tasks only carry its handle
+    with SharedFeatureMatrix(X) as shared_X:
+        del X, input_df
+        tasks = tabpfn_model.prediction_tasks(shared_X.handle, devices, folds_by_target, settings.PREDICT_CHUNK_ROWS)
+        total_steps = len(tasks)
+
+        with tracing.span('pool_predict', tasks=total_steps, pool_size=pool_size), \
+                mp.Pool(processes=pool_size, initializer=_init_prediction_worker, initargs=(devices, pool_size, tracing.carrier())) as pool:
+            for i, result in enumerate(pool.imap_unordered(_load_and_predict_worker, tasks)):
+                tabpfn_model.collect(results_map, result, n_rows)
+                
+                progress = int(((i + 1) / total_steps) * 100)
+                print(json.dumps({"type": "progress", "value": progress}), flush=True)
 
     # --- 5. Final Processing & Formatting for Batch Output ---
-    final_pred_np = np.array(final_pred_list)
-    # final_pred will have shape (n_samples, n_targets) after weighted mean
-    final_pred = tabpfn_model.weighted_mean(final_pred_np)
+    # final_pred will have shape (n_samples, n_targets) after the weighted mean
+    with tracing.span('aggregate', rows=n_rows):
+        final_pred = tabpfn_model.combine(results_map, folds_by_target)
 
     # Format the results for each row in the input file
     results_list = []
-    for row in final_pred:
+    for row in final_pred.tolist():
         row_result = {
-            "blended_properties": list(row),
+            "blended_properties": row,
             "confidence_score": random.random(),
-            "model_version": "v1.0-multiGPU-batch"
+            "model_version": "v1.0-multiGPU-batch",
+            "quality": args.quality,
+            "targets": list(folds_by_target)
         }
         results_list.append(row_result)
 
-    # Print the final list of results to stdout
-    print(json.dumps({"type": "result", "data": results_list}), flush=True)
+    # Print the final list of results to stdout (orjson: large batches make this line big)
+    print(dumps_str({"type": "result", "data": results_list}), flush=True)
 
 
 if __name__ == '__main__':
@@ -95,4 +93,10 @@ if __name__ == '__main__':
         mp.set_start_method('spawn', force=True)
     except RuntimeError:
         pass
-    run_batch_predictions()
\ No newline at end of file
+    # No-op unless the job is profiled (BLEND_PROFILE_DIR set by the task)
+    tracing.setup('batch-script')
+    try:
+        with profiling.script('batch_script'), tracing.span('batch_script', parent=tracing.env_parent()):
+            run_batch_predictions()
+    finally:
+        tracing.shutdown()
\ No newline at end of file
@@ -0,0 +1,230 @@
+"""
+On-demand profiling of prediction jobs.
+
+A job is profiled if its request asks for it (profile=true) or it is sampled
+at PROFILE_SAMPLE_RATE. The job's task is then run under cProfile and
+tracemalloc. Its prediction script learns about this through the
+BLEND_PROFILE_DIR environment variable and profiles itself and its pool
+workers (a persistent pool's workers get the job's directory with each task,
+see `pool_call`). Each process writes its own files to PROFILE_DIR/<job_id>/. When
+the task ends they're merged into:
+  - merged.prof    pstats of all processes (snakeviz, `python -m pstats`)
+  - summary.txt    top functions by cumulative time
+  - memory.json    peak traced memory and top allocation sites per process
+served by GET /predict/profile/{job_id}.
+
+With profiling off, the only cost is a None/flag check per job and per pool task.
+PROFILE_DIR has to be shared by the workers and the API.
+"""
+import os
+import io
+import glob
+import json
+import random
+import shutil
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from config import settings
+
+PROFILE_ENV = 'BLEND_PROFILE_DIR'
+TOP_FUNCTIONS = 60
+TOP_ALLOCATIONS = 25
+POOL_PROFILERS = 8  # job directories a persistent pool worker keeps a profiler for
+
+_local = threading.local()
+_worker_profiler = None
+_worker_dir = None
+_pool_profilers = OrderedDict()  # directory -> cProfile.Profile, in a persistent pool worker
+
+
+def should_profile(requested=False):
+    """Whether a new job is profiled: on request, or sampled at PROFILE_SAMPLE_RATE."""
+    return bool(requested) or (settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE)
+
+
+def job_dir(job_id):
+    return os.path.join(settings.PROFILE_DIR, job_id)
+
+
+class Session():
+    """cProfile + tracemalloc of one process (or thread), written to `directory` as `<role>-<pid>`."""
+    def __init__(self, directory, role):
+        self.directory = directory
+        self.role = role
+        self.profiler = cProfile.Profile()
+        self._started_tracemalloc = False
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+        name = f"{self.role}-{os.getpid()}-{threading.get_ident()}"
+        self.profiler.dump_stats(os.path.join(self.directory, f"{name}.prof"))
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:TOP_ALLOCATIONS]
+            memory = {
+                'role': self.role,
+                'pid': os.getpid(),
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'top_allocations': [
+                    {'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count} for stat in top
+                ],
+            }
+            with open(os.path.join(self.directory, f"{name}.mem.json"), 'w') as f:
+                json.dump(memory, f)
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+
+# --- Task side (Celery task or embedded job) ---
+
+def start_job(job_id):
+    session = Session(job_dir(job_id), 'task')
+    session.start()
+    _local.session = session
+
+
+def finish_job(job_id):
+    """Stops the job's profiler (if it was started in this thread) and merges all its process files."""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        return
+    _local.session = None
+    try:
+        session.stop()
+        merge(job_id)
+    except Exception as e:
+        print(f"Warning: Could not write profile of {job_id}: {e}")
+
+
+@contextmanager
+def job(job_id, enabled):
+    if not enabled:
+        yield
+        return
+    start_job(job_id)
+    try:
+        yield
+    finally:
+        finish_job(job_id)
+
+
+def current_dir():
+    """Profile directory of the job running in this thread (None if it isn't profiled)."""
+    session = getattr(_local, 'session', None)
+    return session.directory if session is not None else None
+
+
+def child_env():
+    """Environment for a prediction subprocess, so it profiles itself if the current job is profiled."""
+    directory = current_dir()
+    if directory is None:
+        return None
+    return dict(os.environ, **{PROFILE_ENV: directory})
+
+
+# --- Subprocess side (prediction scripts and their pool workers) ---
+
+@contextmanager
+def script(role):
+    """Profiles a prediction script's process if BLEND_PROFILE_DIR is set."""
+    directory = os.environ.get(PROFILE_ENV)
+    if not directory:
+        yield
+        return
+    session = Session(directory, role)
+    session.start()
+    try:
+        yield
+    finally:
+        session.stop()
+
+
+def init_worker():
+    """Pool initializer hook: sets up a per-worker profiler if the parent script is profiled."""
+    global _worker_profiler, _worker_dir
+    _worker_dir = os.environ.get(PROFILE_ENV)
+    _worker_profiler = cProfile.Profile() if _worker_dir else None
+
+
+def worker_call(fn, args):
+    """Runs one pool task, under the worker's profiler if there is one."""
+    if _worker_profiler is None:
+        return fn(args)
+    return _profiled_call(_worker_profiler, _worker_dir, fn, args)
+
+
+def pool_call(fn, args, directory):
+    """
+    worker_call for the workers of a persistent pool, which outlive the jobs:
+    each task brings the profile directory of its job (None = not profiled).
+    Tasks of concurrent jobs interleave, so the worker keeps one profiler per
+    job directory and each job's file accumulates all of its tasks.
+    """
+    if not directory:
+        return fn(args)
+    profiler = _pool_profilers.get(directory)
+    if profiler is None:
+        profiler = _pool_profilers[directory] = cProfile.Profile()
+        while len(_pool_profilers) > POOL_PROFILERS:
+            _pool_profilers.popitem(last=False)
+    _pool_profilers.move_to_end(directory)
+    return _profiled_call(profiler, directory, fn, args)
+
+
+def _profiled_call(profiler, directory, fn, args):
+    profiler.enable()
+    try:
+        return fn(args)
+    finally:
+        profiler.disable()
+        # Pool workers are terminated without cleanup, so the stats are written after every task
+        profiler.dump_stats(os.path.join(directory, f"poolworker-{os.getpid()}.prof"))
+
+
+# --- Artifacts ---
+
+def merge(job_id):
+    directory = job_dir(job_id)
+    profiles = sorted(glob.glob(os.path.join(directory, '*-*.prof')))
+    if profiles:
+        stats = pstats.Stats(profiles[0])
+        for path in profiles[1:]:
+            stats.add(path)
+        stats.dump_stats(os.path.join(directory, 'merged.prof'))
+        summary = io.StringIO()
+        summary.write(f"Job {job_id}: merged from {', '.join(os.path.basename(p) for p in profiles)}\n\n")
+        pstats.Stats(os.path.join(directory, 'merged.prof'), stream=summary).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        with open(os.path.join(directory, 'summary.txt'), 'w') as f:
+            f.write(summary.getvalue())
+    memory = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.mem.json'))):
+        with open(path) as f:
+            memory.append(json.load(f))
+    with open(os.path.join(directory, 'memory.json'), 'w') as f:
+        json.dump({'job_id': job_id, 'processes': memory}, f)
+
+
+def artifact_path(job_id, name):
+    """Path of a merged artifact of a job, or None if it wasn't profiled (or isn't finished)."""
+    if os.path.basename(job_id) != job_id:
+        return None
+    path = os.path.join(job_dir(job_id), name)
+    return path if os.path.exists(path) else None
+
+
+def delete(job_id):
+    if os.path.basename(job_id) == job_id:
+        shutil.rmtree(job_dir(job_id), ignore_errors=True)
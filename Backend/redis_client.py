@@ -0,0 +1,25 @@
+import os
+import threading
+import redis
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_redis():
+    """
+    Shared Redis client for REDIS_URL (the Celery broker's Redis).
+    A 'fakeredis://' URL gives an in-process stand-in for local runs and load tests.
+    """
+    global _client
+    if _client is None:
+        # Every fakeredis client has its own data, so there must only be one
+        with _lock:
+            if _client is None:
+                url = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+                if url.startswith('fakeredis://'):
+                    import fakeredis
+                    _client = fakeredis.FakeRedis()
+                else:
+                    _client = redis.Redis.from_url(url, socket_timeout=2)
+    return _client
@@ -0,0 +1,126 @@
+"""
+Paged access to finished batch results (GET /predict/result/{job_id}).
+
+When a batch job finishes, its rows are also written as one float64 matrix,
+RESULT_STORE_DIR/<job_id>.npy (one column per target, then the confidence
+score), next to a small <job_id>.json with the targets, the fields shared by
+all rows and a per-property summary. Pages are sliced out of a memory map of
+the matrix, so serving rows offset..offset+limit of some columns only reads
+those rows, whatever the size of the batch.
+
+Files older than RESULT_STORE_TTL_S are removed when new results are saved.
+RESULT_STORE_DIR has to be shared by the workers and the API.
+"""
+import os
+import json
+import time
+import numpy as np
+
+from config import settings
+
+
+def _paths(job_id):
+    base = os.path.join(settings.RESULT_STORE_DIR, job_id)
+    return base + '.npy', base + '.json'
+
+
+def rows_matrix(rows):
+    """(matrix, targets) of a batch result (list of row dicts); the last column is the confidence score."""
+    targets = rows[0].get('targets') or [f'BlendProperty{j + 1}' for j in range(len(rows[0]['blended_properties']))]
+    matrix = np.empty((len(rows), len(targets) + 1), dtype=np.float64)
+    for i, row in enumerate(rows):
+        matrix[i, :-1] = row['blended_properties']
+        confidence = row.get('confidence_score')
+        matrix[i, -1] = np.nan if confidence is None else confidence
+    return matrix, list(targets)
+
+
+def summarize(matrix, targets):
+    """Row count and per-property min/max/mean of a result matrix."""
+    properties = {}
+    for j, target in enumerate(targets):
+        values = matrix[:, j]
+        finite = values[np.isfinite(values)]
+        properties[target] = {
+            'min': float(finite.min()) if len(finite) else None,
+            'max': float(finite.max()) if len(finite) else None,
+            'mean': float(finite.mean()) if len(finite) else None,
+        }
+    return {'rows': int(len(matrix)), 'targets': list(targets), 'properties': properties}
+
+
+def save(job_id, rows):
+    """Stores a finished batch result; failures only cost the paged access, not the job."""
+    if not isinstance(rows, list) or not rows or os.path.basename(job_id) != job_id:
+        return
+    try:
+        matrix, targets = rows_matrix(rows)
+        os.makedirs(settings.RESULT_STORE_DIR, exist_ok=True)
+        matrix_path, meta_path = _paths(job_id)
+        np.save(matrix_path + '.tmp.npy', matrix)
+        os.replace(matrix_path + '.tmp.npy', matrix_path)
+        meta = summarize(matrix, targets)
+        meta['fields'] = {key: rows[0][key] for key in ('model_version', 'quality') if key in rows[0]}
+        meta['stored_at'] = time.time()
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+    except Exception as e:
+        print(f"Warning: Could not store the result of {job_id} for paging: {e}")
+    prune()
+
+
+def exists(job_id):
+    return os.path.basename(job_id) == job_id and os.path.exists(_paths(job_id)[1])
+
+
+def load_meta(job_id):
+    """The stored summary and fields of a job, or None if its result isn't stored."""
+    if os.path.basename(job_id) != job_id:
+        return None
+    matrix_path, meta_path = _paths(job_id)
+    if not (os.path.exists(meta_path) and os.path.exists(matrix_path)):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def open_matrix(job_id):
+    return np.load(_paths(job_id)[0], mmap_mode='r')
+
+
+def page(matrix, targets, fields, offset, limit, columns=None, format='rows'):
+    """
+    Rows offset..offset+limit of a result matrix, restricted to `columns`
+    (target names, None = all), as row dicts or in the columnar form of
+    serialization.to_columnar.
+    """
+    columns = columns or targets
+    indices = [targets.index(c) for c in columns] + [len(targets)]
+    values = np.asarray(matrix[offset:offset + limit][:, indices], dtype=np.float64)
+    properties, confidence = values[:, :-1], values[:, -1]
+    confidence = [None if np.isnan(c) else float(c) for c in confidence]
+    if format == 'columnar':
+        return dict({
+            'rows': len(values),
+            'targets': list(columns),
+            'blended_properties': {c: properties[:, j].tolist() for j, c in enumerate(columns)},
+            'confidence_score': confidence,
+        }, **fields)
+    return [
+        dict({'blended_properties': row, 'confidence_score': c, 'targets': list(columns)}, **fields)
+        for row, c in zip(properties.tolist(), confidence)
+    ]
+
+
+def prune(now=None):
+    now = now or time.time()
+    if settings.RESULT_STORE_TTL_S <= 0 or not os.path.isdir(settings.RESULT_STORE_DIR):
+        return
+    for name in os.listdir(settings.RESULT_STORE_DIR):
+        path = os.path.join(settings.RESULT_STORE_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > settings.RESULT_STORE_TTL_S:
+                os.remove(path)
+        except OSError:
+            pass
@@ -1,6 +1,6 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
 from typing import List
-import database, models
+import database, models, etags
 
 router = APIRouter(
     tags=["Application Data"],
@@ -12,7 +12,10 @@ async def read_history():
 
 # FIX: Changed response_model to models.SettingsDB
 @router.get("/settings", response_model=models.SettingsDB)
-async def read_settings():
+async def read_settings(request: Request, response: Response):
+    not_modified = etags.conditional(request, response, "settings")
+    if not_modified is not None:
+        return not_modified
     return database.get_settings()
 
 # FIX: Changed response_model and type hint to models.SettingsDB
@@ -0,0 +1,149 @@
+import os
+import time
+import json
+from collections import Counter
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+import database, admission
+from config import settings
+from redis_client import get_redis
+from celery_worker import celery_app
+from model.trained_tabpfn import TrainedTabPFN, cached_model_path
+from model.residency import read_node_stats, summarize, warm_processes
+
+router = APIRouter(
+    tags=["Health"],
+)
+
+CELERY_QUEUE = 'celery'
+# Queued messages inspected for the per-task breakdown
+QUEUE_SAMPLE = 1000
+WORKER_PING_TIMEOUT_S = 1.0
+# Worker pings are broadcast over the broker; load balancers poll often
+WORKER_CACHE_TTL_S = 5.0
+_workers_cache = {'at': 0.0, 'value': None}
+
+
+def _timed(check):
+    start = time.perf_counter()
+    try:
+        check()
+        return {'ok': True, 'latency_ms': round((time.perf_counter() - start) * 1000, 2)}
+    except Exception as e:
+        return {'ok': False, 'error': str(e)}
+
+
+def queue_status():
+    """Queued messages in total and per task name (from the first QUEUE_SAMPLE messages)."""
+    r = get_redis()
+    depth = r.llen(CELERY_QUEUE)
+    by_task = Counter()
+    for raw in r.lrange(CELERY_QUEUE, 0, QUEUE_SAMPLE - 1):
+        try:
+            by_task[json.loads(raw).get('headers', {}).get('task', 'unknown')] += 1
+        except (ValueError, AttributeError):
+            by_task['unknown'] += 1
+    return {'depth': depth, 'by_task': dict(by_task), 'sampled': min(depth, QUEUE_SAMPLE)}
+
+
+def live_workers():
+    now = time.time()
+    if _workers_cache['value'] is None or now - _workers_cache['at'] > WORKER_CACHE_TTL_S:
+        replies = celery_app.control.inspect(timeout=WORKER_PING_TIMEOUT_S).ping() or {}
+        _workers_cache.update(at=now, value=sorted(replies))
+    return _workers_cache['value']
+
+
+def model_status():
+    """
+    Whether every fold/target model file is on disk, and whether any is
+    resident in a process that serves jobs (persistent pool workers, fan-out
+    Celery processes or the embedded API). The pools of per-job prediction
+    scripts (PREDICTION_POOL='subprocess') never count: their models go away
+    with the job, so such nodes don't report warm.
+    """
+    processes = read_node_stats()
+    status = {'backend': settings.MODEL_BACKEND, 'residency': summarize(processes)}
+    status['warm_processes'] = len(warm_processes(processes))
+    status['warm'] = status['warm_processes'] > 0
+    if settings.MODEL_BACKEND == 'stub':
+        status['weights_present'] = True
+        return status
+    files = TrainedTabPFN(download=False).model_files()
+    missing = [path for path, _ in files if not os.path.exists(path)]
+    status['weights_present'] = not missing
+    status['missing_weights'] = missing
+    status['cached_models'] = sum(
+        1 for path, model_type in files if model_type == 'tabpfn' and os.path.exists(cached_model_path(path))
+    )
+    return status
+
+
+def collect_status():
+    status = {
+        'mongo': _timed(lambda: database.db.command('ping')),
+        'redis': _timed(lambda: get_redis().ping()),
+    }
+    try:
+        status['queue'] = queue_status()
+    except Exception as e:
+        status['queue'] = {'error': str(e)}
+    try:
+        if settings.EXECUTION_MODE == 'embedded':
+            # Jobs run on the API process's own pool
+            status['workers'] = {'live': settings.EMBEDDED_WORKERS, 'names': ['embedded']}
+        else:
+            workers = live_workers()
+            status['workers'] = {'live': len(workers), 'names': workers}
+    except Exception as e:
+        status['workers'] = {'live': 0, 'error': str(e)}
+    try:
+        status['capacity'] = admission.stats()
+    except Exception as e:
+        status['capacity'] = {'error': str(e)}
+    status['models'] = model_status()
+    return status
+
+
+def not_ready_reasons(status):
+    reasons = []
+    for service in ('mongo', 'redis'):
+        if not status[service]['ok']:
+            reasons.append(f"{service} unreachable")
+    if status['workers'].get('live', 0) == 0:
+        reasons.append("no live workers")
+    depth = status['queue'].get('depth')
+    if depth is not None and settings.READY_MAX_QUEUE_DEPTH > 0 and depth >= settings.READY_MAX_QUEUE_DEPTH:
+        reasons.append(f"queue depth {depth} >= {settings.READY_MAX_QUEUE_DEPTH}")
+    for job_type, stats in status['capacity'].items():
+        if isinstance(stats, dict) and stats['limit'] > 0 and stats['inflight'] >= stats['limit']:
+            reasons.append(f"{job_type} jobs at capacity")
+    if not status['models']['weights_present']:
+        reasons.append("model weights missing")
+    if settings.READY_REQUIRE_WARM and not status['models']['warm']:
+        reasons.append("no models resident")
+    return reasons
+
+
+@router.get("/health")
+async def health_check():
+    """
+    Reachability and latency of Mongo/Redis, queue depth per task, live
+    workers, admission capacity and model weight/warm state. Always 200;
+    `status` is 'degraded' when the node wouldn't pass /ready.
+    """
+    status = await run_in_threadpool(collect_status)
+    reasons = not_ready_reasons(status)
+    return {'status': 'degraded' if reasons else 'ok', 'reasons': reasons, **status}
+
+
+@router.get("/ready")
+async def readiness_check():
+    """200 if this node can take prediction traffic now, 503 (with reasons) otherwise."""
+    status = await run_in_threadpool(collect_status)
+    reasons = not_ready_reasons(status)
+    if reasons:
+        return JSONResponse({'ready': False, 'reasons': reasons}, status_code=503)
+    return {'ready': True}
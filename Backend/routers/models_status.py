@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+from model.residency import read_node_stats, summarize
+
+router = APIRouter(
+    prefix="/models",
+    tags=["Models"],
+)
+
+@router.get("/residency")
+async def read_model_residency():
+    """
+    Resident models, memory use, evictions and reloads of every prediction
+    process on this node, for sizing memory budgets.
+    """
+    processes = read_node_stats()
+    return {"node": summarize(processes), "processes": processes}
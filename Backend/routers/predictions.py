@@ -1,14 +1,24 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
-from typing import List
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 import random
 import csv
 import uuid
 import os
 import io
-import database, models
-from celery_worker import run_single_prediction, run_batch_prediction, run_fraction_estimation
+import database, models, admission, embedded, simplex_index, profiling, tracing, result_store
+from celery_worker import (
+    run_single_prediction, run_batch_prediction, run_fraction_estimation,
+    run_distributed_prediction, run_multi_fraction_estimation, run_sensitivity_analysis, run_simplex_index_build,
+    fanout_progress, job_states,
+)
 from celery.result import AsyncResult
+from estimation import resolve_bounds, align_target_properties
+from model.student import student_available
+from model.trained_tabpfn import QUALITY_TIERS, TARGET_COLUMNS, resolve_targets
+from config import settings
+from serialization import FastJSONResponse, to_columnar
 import pandas as pd
 
 router = APIRouter(
@@ -17,62 +27,398 @@ router = APIRouter(
 
 UPLOADS_DIR = "uploads"
 os.makedirs(UPLOADS_DIR, exist_ok=True)
+def enqueue(task, job_id, *args, profile=False):
+    """
+    Sends an admitted job (see admission.py); its slot is freed again if sending fails.
+    profile=True has the worker profile it (see profiling.py); the current
+    trace context goes along in the headers too (see tracing.py).
+    """
+    headers = tracing.carrier()
+    if profile:
+        headers['profile'] = True
+    try:
+        return task.apply_async(args, task_id=job_id, headers=headers or None)
+    except Exception:
+        admission.release(job_id, completed=False)
+        raise
+
 input_columns = ['Component1_fraction','Component2_fraction','Component3_fraction','Component4_fraction','Component5_fraction','Component1_Property1','Component2_Property1','Component3_Property1','Component4_Property1','Component5_Property1','Component1_Property2','Component2_Property2','Component3_Property2','Component4_Property2','Component5_Property2','Component1_Property3','Component2_Property3','Component3_Property3','Component4_Property3','Component5_Property3','Component1_Property4','Component2_Property4','Component3_Property4','Component4_Property4','Component5_Property4','Component1_Property5','Component2_Property5','Component3_Property5','Component4_Property5','Component5_Property5','Component1_Property6','Component2_Property6','Component3_Property6','Component4_Property6','Component5_Property6','Component1_Property7','Component2_Property7','Component3_Property7','Component4_Property7','Component5_Property7','Component1_Property8','Component2_Property8','Component3_Property8','Component4_Property8','Component5_Property8','Component1_Property9','Component2_Property9','Component3_Property9','Component4_Property9','Component5_Property9','Component1_Property10','Component2_Property10','Component3_Property10','Component4_Property10','Component5_Property10']
     
 @router.post("/predict/blend_manual")
-async def start_manual_blend(request: models.BlendManualRequest):
+async def start_manual_blend(request: models.BlendManualRequest, http_request: Request):
     """
     Starts the long prediction task in the background and returns a job ID.
     """
+    if request.quality == 'fast' and not student_available():
+        raise HTTPException(status_code=400, detail="The 'fast' quality tier is not available on this server.")
+    request_data = request.model_dump()
+    profile = profiling.should_profile(request_data.pop('profile'))
+    if request.targets:
+        try:
+            request_data['targets'] = resolve_targets(request.targets)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    # 429 if the client or the blend queue is over its limit
+    job_id = admission.admit(http_request, 'blend')
+    if settings.EXECUTION_MODE == 'embedded':
+        return JSONResponse({"job_id": embedded.submit(job_id, embedded.run_single_prediction, request_data, profile=profile)})
     # Start the Celery task and pass the request data
-    task = run_single_prediction.delay(request.model_dump())
+    if settings.PREDICTION_FANOUT != 'local' and request.quality != 'fast':
+        task = enqueue(run_distributed_prediction, job_id, {'kind': 'single', 'request_data': request_data}, profile=profile)
+    else:
+        task = enqueue(run_single_prediction, job_id, request_data, profile=profile)
     # Immediately return the task's ID
     return JSONResponse({"job_id": task.id})
 
 @router.post("/predict/blend_batch")
-async def start_batch_blend(file: UploadFile = File(...)):
+async def start_batch_blend(http_request: Request, file: UploadFile = File(...), quality: str = Form('full'), targets: Optional[str] = Form(None), profile: bool = Form(False)):
     if not file.filename.endswith('.csv'):
         raise HTTPException(status_code=400, detail="Invalid file type.")
+    if quality not in QUALITY_TIERS:
+        raise HTTPException(status_code=400, detail=f"Unknown quality tier: {quality}")
+    if quality == 'fast' and not student_available():
+        raise HTTPException(status_code=400, detail="The 'fast' quality tier is not available on this server.")
+    # Comma-separated subset of the target properties
+    if targets:
+        try:
+            targets = resolve_targets([t.strip() for t in targets.split(',') if t.strip()])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    else:
+        targets = None
+    profile = profiling.should_profile(profile)
 
     # Save the uploaded file to a temporary location
     file_path = os.path.join(UPLOADS_DIR, f"{uuid.uuid4().hex}_{file.filename}")
     with open(file_path, "wb") as buffer:
         buffer.write(await file.read())
-    
-    input_df = pd.read_csv(file_path)
 
-    for col in input_columns:
-        if col not in input_df.columns:
-            raise HTTPException(status_code=400, detail=f"Wrong Format, make sure the column names are correct. ({col})")
+    # The file is checked before the job takes an in-flight slot
+    try:
+        try:
+            input_df = pd.read_csv(file_path)
+        except (pd.errors.EmptyDataError, pd.errors.ParserError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"Could not read the CSV file: {e}")
+        for col in input_columns:
+            if col not in input_df.columns:
+                raise HTTPException(status_code=400, detail=f"Wrong Format, make sure the column names are correct. ({col})")
+        job_id = admission.admit(http_request, 'batch')
+    except HTTPException:
+        os.remove(file_path)
+        raise
 
     # Start the batch prediction task with the file path
-    task = run_batch_prediction.delay(file_path, file.filename)
+    if settings.EXECUTION_MODE == 'embedded':
+        job_id = embedded.submit(job_id, embedded.run_batch_prediction, file_path, file.filename, quality, targets, job_id, profile=profile)
+        return JSONResponse({"job_id": job_id})
+    if settings.PREDICTION_FANOUT != 'local' and quality != 'fast':
+        task = enqueue(
+            run_distributed_prediction, job_id,
+            {'kind': 'batch', 'file_path': file_path, 'filename': file.filename, 'quality': quality, 'targets': targets},
+            profile=profile,
+        )
+    else:
+        task = enqueue(run_batch_prediction, job_id, file_path, file.filename, quality, targets, profile=profile)
     return JSONResponse({"job_id": task.id})
 
+def index_candidates(request_data, target_properties, lower, upper):
+    """Simplex index candidates for an estimation request, or None if its component set has no index (of its quality)."""
+    try:
+        known_costs = {c['name']: c.get('cost', 0.0) for c in database.get_all_components()}
+    except Exception:
+        known_costs = {}
+    found = simplex_index.lookup(
+        request_data['components'], target_properties, request_data['targets'] or TARGET_COLUMNS,
+        known_costs, lower, upper, quality=request_data.get('quality', 'full'),
+    )
+    return found if found and found['candidates'] else None
+
+
+def store_finished_job(job_id, result):
+    """Makes a job answered in the request itself visible through /predict/status."""
+    if settings.EXECUTION_MODE == 'embedded':
+        embedded.store_result(job_id, result)
+    else:
+        run_fraction_estimation.backend.store_result(job_id, result, 'SUCCESS')
+
 @router.post("/predict/estimate_fractions")
-async def start_fraction_estimation(request: models.EstimateFractionsRequest):
-    task = run_fraction_estimation.delay(request.model_dump())
+async def start_fraction_estimation(request: models.EstimateFractionsRequest, http_request: Request):
+    request_data = request.model_dump()
+    profile = profiling.should_profile(request_data.pop('profile'))
+    try:
+        lower, upper = resolve_bounds(request_data['components'], request_data['constraints'])
+        if request.targets:
+            request_data['targets'] = resolve_targets(request.targets)
+        target_properties = align_target_properties(request_data['target_properties'], request_data['targets'], TARGET_COLUMNS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.quality == 'fast' and not student_available():
+        raise HTTPException(status_code=400, detail="The 'fast' quality tier is not available on this server.")
+
+    # Registered component sets are answered from their precomputed simplex grid
+    found = None
+    if request.use_index:
+        found = await run_in_threadpool(index_candidates, request_data, target_properties, lower, upper)
+    if found:
+        if request.refine_trials == 0:
+            result = simplex_index.estimation_result(
+                request_data['components'], found, request_data['targets'] or TARGET_COLUMNS, request.target_cost,
+            )
+            job_id = str(uuid.uuid4())
+            store_finished_job(job_id, {'progress': 100, 'result': result})
+            database.add_history_log("blender", request_data, result)
+            return JSONResponse({"job_id": job_id, "result": result})
+        # A few ensemble trials starting from the index's best recipes
+        request_data['n_trials'] = request.refine_trials
+        request_data['seed_fractions'] = [c[0] for c in found['candidates'][:request.refine_trials]]
+
+    job_id = admission.admit(http_request, 'estimation')
+    if settings.EXECUTION_MODE == 'embedded':
+        return JSONResponse({"job_id": embedded.submit(job_id, embedded.run_fraction_estimation, request_data, profile=profile)})
+    task = enqueue(run_fraction_estimation, job_id, request_data, profile=profile)
     return JSONResponse({"job_id": task.id})
 
-@router.get("/predict/status/{job_id}")
-async def get_task_status(job_id: str):
+@router.post("/predict/estimate_fractions_multi")
+async def start_multi_fraction_estimation(request: models.EstimateFractionsMultiRequest, http_request: Request):
     """
-    Checks the status of a background job.
+    One estimation job for several targets (property vectors or stored target
+    components) on the same components; returns the best recipe per target.
     """
-    task_result = AsyncResult(job_id, app=run_single_prediction.app)
+    if not request.blend_targets:
+        raise HTTPException(status_code=400, detail="At least one blend target is required.")
+    request_data = request.model_dump()
+    profile = profiling.should_profile(request_data.pop('profile'))
+    stored = None
+    try:
+        resolve_bounds(request_data['components'], request_data['constraints'])
+        if request.targets:
+            request_data['targets'] = resolve_targets(request.targets)
+        blend_targets = []
+        for bt in request_data['blend_targets']:
+            if (bt['target_properties'] is None) == (bt['target_component_id'] is None):
+                raise ValueError("Each blend target needs either target_properties or target_component_id.")
+            if bt['target_component_id'] is not None:
+                if stored is None:
+                    stored = {c['id']: c for c in database.get_all_target_components()}
+                target_component = stored.get(bt['target_component_id'])
+                if target_component is None:
+                    raise ValueError(f"Unknown target component: {bt['target_component_id']}")
+                bt['target_properties'] = target_component['properties']
+                bt['name'] = bt['name'] or target_component['name']
+                if bt['target_cost'] is None:
+                    bt['target_cost'] = target_component.get('cost')
+            bt['target_properties'] = align_target_properties(bt['target_properties'], request_data['targets'], TARGET_COLUMNS)
+            blend_targets.append({k: bt[k] for k in ('name', 'target_properties', 'target_cost')})
+        request_data['blend_targets'] = blend_targets
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.quality == 'fast' and not student_available():
+        raise HTTPException(status_code=400, detail="The 'fast' quality tier is not available on this server.")
+    job_id = admission.admit(http_request, 'estimation')
+    if settings.EXECUTION_MODE == 'embedded':
+        return JSONResponse({"job_id": embedded.submit(job_id, embedded.run_multi_fraction_estimation, request_data, profile=profile)})
+    task = enqueue(run_multi_fraction_estimation, job_id, request_data, profile=profile)
+    return JSONResponse({"job_id": task.id})
+
+@router.post("/predict/simplex_index")
+async def start_simplex_index_build(request: models.SimplexIndexRequest, http_request: Request):
+    """
+    Registers a component set for instant fraction estimation: predicts its
+    simplex grid in batches and builds the lookup index (replacing an older one).
+    """
+    if len(request.components) < 2:
+        raise HTTPException(status_code=400, detail="A simplex index needs at least two components.")
+    if len({c.name for c in request.components}) != len(request.components):
+        raise HTTPException(status_code=400, detail="Component names must be unique.")
+    if request.quality == 'fast' and not student_available():
+        raise HTTPException(status_code=400, detail="The 'fast' quality tier is not available on this server.")
+    request_data = request.model_dump()
+    job_id = admission.admit(http_request, 'batch')
+    if settings.EXECUTION_MODE == 'embedded':
+        return JSONResponse({"job_id": embedded.submit(job_id, embedded.run_simplex_index_build, request_data)})
+    task = enqueue(run_simplex_index_build, job_id, request_data)
+    return JSONResponse({"job_id": task.id})
+
+@router.get("/predict/simplex_index")
+async def list_simplex_indexes():
+    """Component sets with a simplex index on this node."""
+    return await run_in_threadpool(simplex_index.list_indexes)
+
+@router.post("/predict/sensitivity")
+async def start_sensitivity_analysis(request: models.SensitivityRequest, http_request: Request):
+    """
+    Fraction -> property Jacobian around a blend, from finite differences that
+    are all predicted in one batch. The result's jacobian[t][i] is the change
+    of property t per percentage point of component i.
+    """
+    if len(request.components) < 2:
+        raise HTTPException(status_code=400, detail="Sensitivity analysis needs at least two components.")
+    if sum(c.fraction for c in request.components) <= 0:
+        raise HTTPException(status_code=400, detail="Component fractions must add up to more than 0.")
+    if request.quality == 'fast' and not student_available():
+        raise HTTPException(status_code=400, detail="The 'fast' quality tier is not available on this server.")
+    request_data = request.model_dump()
+    profile = profiling.should_profile(request_data.pop('profile'))
+    if request.targets:
+        try:
+            request_data['targets'] = resolve_targets(request.targets)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    job_id = admission.admit(http_request, 'blend')
+    if settings.EXECUTION_MODE == 'embedded':
+        return JSONResponse({"job_id": embedded.submit(job_id, embedded.run_sensitivity_analysis, request_data, profile=profile)})
+    task = enqueue(run_sensitivity_analysis, job_id, request_data, profile=profile)
+    return JSONResponse({"job_id": task.id})
+
+@router.get("/predict/admission")
+async def get_admission_stats():
+    """In-flight jobs, limits and recent throughput per job type."""
+    return admission.stats()
+
+def status_entry(job_id, state, info, result, progress=None, format="rows", include_result=True):
+    """Status response of one job; `progress` is its fan-out progress, if any."""
     response_data = {
-            "status": task_result.state,
+            "status": state,
             "progress": 0
         }
-    if task_result.state == 'PROGRESS':
-        if isinstance(task_result.info, dict):
-            response_data.update(task_result.info)
+    if state == 'PROGRESS':
+        if isinstance(info, dict):
+            response_data.update(info)
+        if progress is not None:
+            response_data['progress'] = progress
             
-    elif task_result.state == 'SUCCESS':
+    elif state == 'SUCCESS':
         response_data['progress'] = 100
-        response_data['result'] = task_result.result.get('result')
-    
-    return JSONResponse(response_data)
+        if include_result:
+            response_data['result'] = result.get('result')
+            if format == "columnar":
+                response_data['result'] = to_columnar(response_data['result'])
+
+    # Profiled jobs link their merged profile once they're done
+    if state in ('SUCCESS', 'FAILURE') and profiling.artifact_path(job_id, 'memory.json'):
+        response_data['profile'] = f"/predict/profile/{job_id}"
+    # Stored batch results can be paged instead of fetched whole
+    if state == 'SUCCESS' and result_store.exists(job_id):
+        response_data['result_pages'] = f"/predict/result/{job_id}"
+    return response_data
+
+@router.get("/predict/status/{job_id}")
+async def get_task_status(job_id: str, format: str = "rows", include_result: bool = True):
+    """
+    Checks the status of a background job.
+    format='columnar' returns batch results as one array per property,
+    include_result=false leaves the result out (see /predict/result/{job_id}).
+    """
+    if format not in ("rows", "columnar"):
+        raise HTTPException(status_code=400, detail=f"Unknown result format: {format}")
+    if settings.EXECUTION_MODE == 'embedded':
+        state, info, result = embedded.job_state(job_id)
+        progress = None
+    else:
+        task_result = AsyncResult(job_id, app=run_single_prediction.app)
+        state, info, result = task_result.state, task_result.info, task_result.result
+        # Fanned-out jobs report progress through their sub-task counters
+        progress = fanout_progress(job_id) if state == 'PROGRESS' else None
+    return FastJSONResponse(status_entry(job_id, state, info, result, progress, format, include_result))
+
+@router.post("/predict/status")
+async def get_task_statuses(request: models.JobStatusRequest):
+    """
+    Status of many jobs in one call (one result backend round trip), as
+    {'jobs': {job_id: <same entry as /predict/status/{job_id}>}, 'counts': {state: n}}.
+    """
+    job_ids = list(dict.fromkeys(request.job_ids))
+    if settings.EXECUTION_MODE == 'embedded':
+        states = [embedded.job_state(job_id) + (None,) for job_id in job_ids]
+    else:
+        states = await run_in_threadpool(job_states, job_ids)
+
+    jobs, counts = {}, {}
+    for job_id, (state, info, result, progress) in zip(job_ids, states):
+        jobs[job_id] = status_entry(job_id, state, info, result, progress, request.format, request.include_results)
+        counts[state] = counts.get(state, 0) + 1
+    return FastJSONResponse({"jobs": jobs, "counts": counts})
+
+def job_result_matrix(job_id):
+    """
+    (matrix, targets, fields, summary) of a finished prediction job: the stored
+    matrix (memory-mapped) if there is one, else built from the job's result.
+    """
+    meta = result_store.load_meta(job_id)
+    if meta is not None:
+        return result_store.open_matrix(job_id), meta['targets'], meta['fields'], meta
+
+    if settings.EXECUTION_MODE == 'embedded':
+        state, _, result = embedded.job_state(job_id)
+    else:
+        task_result = AsyncResult(job_id, app=run_single_prediction.app)
+        state, result = task_result.state, task_result.result
+    if state != 'SUCCESS':
+        raise HTTPException(status_code=404, detail=f"No finished result for this job (status {state}).")
+    rows = result.get('result')
+    if isinstance(rows, dict) and 'blended_properties' in rows:
+        rows = [rows]
+    if not isinstance(rows, list) or not rows or not isinstance(rows[0], dict) or 'blended_properties' not in rows[0]:
+        raise HTTPException(status_code=400, detail="This job's result isn't a prediction result.")
+    matrix, targets = result_store.rows_matrix(rows)
+    fields = {key: rows[0][key] for key in ('model_version', 'quality') if key in rows[0]}
+    return matrix, targets, fields, None
+
+@router.get("/predict/result/{job_id}")
+async def get_job_result(job_id: str, offset: int = 0, limit: int = 1000, columns: Optional[str] = None, format: str = "rows"):
+    """
+    Rows offset..offset+limit of a finished prediction job's result, with only
+    the comma-separated `columns` (BlendProperty names, default all).
+    """
+    if format not in ("rows", "columnar"):
+        raise HTTPException(status_code=400, detail=f"Unknown result format: {format}")
+    if offset < 0 or limit < 1 or limit > settings.RESULT_PAGE_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"offset must be >= 0 and limit between 1 and {settings.RESULT_PAGE_MAX_ROWS}.")
+    matrix, targets, fields, _ = await run_in_threadpool(job_result_matrix, job_id)
+    selected = [c.strip() for c in columns.split(',') if c.strip()] if columns else None
+    unknown = [c for c in selected or [] if c not in targets]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns for this result: {', '.join(unknown)}")
+    return FastJSONResponse({
+        "job_id": job_id,
+        "total_rows": len(matrix),
+        "offset": offset,
+        "limit": limit,
+        "result": result_store.page(matrix, targets, fields, offset, limit, selected, format),
+    })
+
+@router.get("/predict/result/{job_id}/summary")
+async def get_job_result_summary(job_id: str):
+    """Row count and per-property min/max/mean of a finished prediction job's result."""
+    matrix, targets, fields, summary = await run_in_threadpool(job_result_matrix, job_id)
+    if summary is None:
+        summary = result_store.summarize(matrix, targets)
+    return FastJSONResponse({
+        "job_id": job_id,
+        "rows": summary['rows'],
+        "targets": summary['targets'],
+        "properties": summary['properties'],
+        **fields,
+    })
+
+@router.get("/predict/profile/{job_id}")
+async def get_job_profile(job_id: str, format: str = "summary"):
+    """
+    Merged profile of a profiled job: 'summary' (top functions by cumulative
+    time), 'pstats' (merged.prof for snakeviz / pstats) or 'memory'
+    (tracemalloc peaks and top allocation sites per process).
+    """
+    names = {"summary": "summary.txt", "pstats": "merged.prof", "memory": "memory.json"}
+    if format not in names:
+        raise HTTPException(status_code=400, detail=f"Unknown profile format: {format}")
+    path = profiling.artifact_path(job_id, names[format])
+    if path is None:
+        raise HTTPException(status_code=404, detail="No profile for this job.")
+    if format == "pstats":
+        return FileResponse(path, media_type="application/octet-stream", filename=f"{job_id}.prof")
+    if format == "memory":
+        return FileResponse(path, media_type="application/json")
+    return FileResponse(path, media_type="text/plain")
 
 
 # @router.post("/blend_manual")
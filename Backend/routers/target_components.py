@@ -1,6 +1,8 @@
-from fastapi import APIRouter, HTTPException, status
-from typing import List
-import database, models
+from fastapi import APIRouter, HTTPException, status, Body, UploadFile, File, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from typing import List, Any
+import database, models, catalog_io, etags
 
 router = APIRouter(
     prefix="/target_components",
@@ -8,7 +10,11 @@ router = APIRouter(
 )
 
 @router.get("/", response_model=List[models.TargetComponent])
-async def read_all_target_components():
+async def read_all_target_components(request: Request, response: Response):
+    # 304 if the client's ETag matches the current catalog revision
+    not_modified = etags.conditional(request, response, "target_components")
+    if not_modified is not None:
+        return not_modified
     return database.get_all_target_components()
 
 @router.post("/", response_model=models.TargetComponent, status_code=status.HTTP_201_CREATED)
@@ -28,3 +34,40 @@ async def delete_target_component(component_id: str):
     if not database.delete_target_component_by_id(component_id):
         raise HTTPException(status_code=404, detail="Target component not found")
     return
+
+# --- Bulk Import / Export ---
+@router.post("/bulk")
+async def bulk_import_target_components(rows: Any = Body(None)):
+    """
+    Upserts a JSON array of target components by id in one bulk write.
+    Invalid rows are skipped and reported in `errors` with their index.
+    """
+    # Per-row problems are reported in `errors`, only the body's shape fails the request
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of target components.")
+    return await run_in_threadpool(database.bulk_import_target_components, rows)
+
+@router.post("/bulk/csv")
+async def bulk_import_target_components_csv(file: UploadFile = File(...)):
+    """Same as /bulk, for a CSV with columns id, name, cost, Property1..Property10."""
+    try:
+        rows = catalog_io.rows_from_csv((await file.read()).decode('utf-8-sig'))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_in_threadpool(database.bulk_import_target_components, rows)
+
+@router.get("/export")
+async def export_target_components(format: str = "csv"):
+    """Streams the whole catalog as CSV (importable via /bulk/csv) or as a JSON array."""
+    if format == "csv":
+        return StreamingResponse(
+            iterate_in_threadpool(catalog_io.stream_csv(database.iter_target_components())),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="target_components.csv"'},
+        )
+    if format == "json":
+        return StreamingResponse(
+            iterate_in_threadpool(catalog_io.stream_json(database.iter_target_components())),
+            media_type="application/json",
+        )
+    raise HTTPException(status_code=400, detail=f"Unknown export format: {format}")
@@ -0,0 +1,65 @@
+"""
+Local sensitivity of the blended properties to the component fractions.
+
+All perturbed blends are built up front and predicted as one multi-row batch,
+so the Jacobian costs a single ensemble pass over 2N+1 rows instead of 2N
+separate blend predictions.
+"""
+import numpy as np
+
+
+def perturbation_rows(fractions, step):
+    """
+    Fraction vectors (in %) for central differences around `fractions`.
+
+    Component i is moved by +step and -step; the opposite change is spread
+    over the other components in proportion to their fractions, so every row
+    still sums to 100 and stays within [0, 100]. Near 0 or 100% the step is
+    shortened on that side (one-sided if it can't move at all).
+
+    Returns (rows, plan): rows[0] is the base blend, and plan[i] is
+    (plus_row, minus_row, span) for component i, span being the total change
+    of its fraction between the two rows.
+    """
+    base = np.asarray(fractions, dtype=float)
+    if base.sum() <= 0:
+        raise ValueError("Component fractions must add up to more than 0.")
+    base = base / base.sum() * 100.0
+    n = len(base)
+    if n < 2:
+        raise ValueError("Sensitivity analysis needs at least two components.")
+
+    rows = [base]
+    plan = []
+    for i in range(n):
+        others = np.delete(np.arange(n), i)
+        rest = base[others].sum()
+        weights = base[others] / rest if rest > 0 else np.full(n - 1, 1.0 / (n - 1))
+        direction = np.zeros(n)
+        direction[i] = 1.0
+        direction[others] = -weights
+
+        up = min(step, 100.0 - base[i])
+        down = min(step, base[i])
+        plus_row = minus_row = 0
+        if up > 0:
+            rows.append(np.clip(base + up * direction, 0.0, 100.0))
+            plus_row = len(rows) - 1
+        if down > 0:
+            rows.append(np.clip(base - down * direction, 0.0, 100.0))
+            minus_row = len(rows) - 1
+        plan.append((plus_row, minus_row, up + down))
+    return np.array(rows), plan
+
+
+def jacobian(predictions, plan):
+    """
+    d(property)/d(fraction) per percentage point, shape (n_targets, n_components),
+    from the predictions of the rows of `perturbation_rows`.
+    """
+    predictions = np.asarray(predictions, dtype=float)
+    columns = [
+        (predictions[plus_row] - predictions[minus_row]) / span if span > 0 else np.zeros(predictions.shape[1])
+        for plus_row, minus_row, span in plan
+    ]
+    return np.array(columns).T
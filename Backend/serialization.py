@@ -0,0 +1,65 @@
+import orjson
+from fastapi.responses import JSONResponse
+from kombu.serialization import register
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+# GZipMiddleware settings: bodies of float arrays gain little from higher
+# levels (100k-row batch: 11.4MB at level 1, 10.7MB at 9) but cost ~3x the CPU
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 1
+
+
+def dumps(obj) -> bytes:
+    """orjson with NumPy arrays/scalars serialized natively."""
+    return orjson.dumps(obj, option=OPTIONS)
+
+
+def dumps_str(obj) -> str:
+    return dumps(obj).decode()
+
+
+loads = orjson.loads
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson; the app's default response class."""
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def register_celery_serializer():
+    """Registers 'orjson' as a kombu serializer for task messages and results."""
+    register(
+        'orjson', dumps_str, loads,
+        content_type='application/x-orjson',
+        content_encoding='utf-8',
+    )
+
+
+# --- Columnar batch results ---
+def to_columnar(results):
+    """
+    Compact form of a batch result (list of per-row dicts): one array per
+    property instead of one object per row.
+
+        {"rows": n, "targets": [...], "blended_properties": {target: [...]},
+         "confidence_score": [...], "model_version": ..., "quality": ...}
+    """
+    if not isinstance(results, list) or not results or not isinstance(results[0], dict):
+        return results
+    first = results[0]
+    targets = first.get('targets') or [f'BlendProperty{j + 1}' for j in range(len(first['blended_properties']))]
+    columnar = {
+        'rows': len(results),
+        'targets': targets,
+        'blended_properties': {
+            target: [row['blended_properties'][j] for row in results] for j, target in enumerate(targets)
+        },
+        'confidence_score': [row.get('confidence_score') for row in results],
+    }
+    # Fields that are the same for every row are kept once
+    for key in ('model_version', 'quality'):
+        if key in first:
+            columnar[key] = first[key]
+    return columnar
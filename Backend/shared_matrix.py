@@ -0,0 +1,78 @@
+from multiprocessing import shared_memory, resource_tracker
+import numpy as np
+import pandas as pd
+
+
+class SharedFeatureMatrix():
+    """
+    Places the preprocessed feature matrix in shared memory once, so pool
+    tasks only carry a small handle instead of a pickled copy of the DataFrame.
+
+    Use as a context manager; the segment is unlinked on exit.
+    """
+    def __init__(self, X):
+        X = X.drop(columns=['ID'], errors='ignore')
+        values = np.ascontiguousarray(X.to_numpy(dtype=np.float64))
+        self.shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        shared = np.ndarray(values.shape, dtype=np.float64, buffer=self.shm.buf)
+        shared[:] = values
+        self.handle = {
+            'name': self.shm.name,
+            'shape': values.shape,
+            'dtype': 'float64',
+            'columns': list(X.columns),
+        }
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+# Segments attached by this (worker) process, kept open for the process' lifetime
+_attached = {}
+_untrack_attached = False
+
+
+def untrack_attached():
+    """
+    For processes with a resource tracker of their own (persistent pool
+    workers): attaching registers a segment there as if this process owned it,
+    and that tracker would try to unlink it again when the process exits.
+    """
+    global _untrack_attached
+    _untrack_attached = True
+
+
+def _attach(handle):
+    name = handle['name']
+    if name not in _attached:
+        # Only one segment is in use per pool at a time; drop older ones (the
+        # workers of a persistent pool keep the last one until the next batch)
+        for old in list(_attached):
+            old_shm, old_array = _attached.pop(old)
+            del old_array
+            old_shm.close()
+        shm = shared_memory.SharedMemory(name=name)
+        if _untrack_attached:
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        array = np.ndarray(tuple(handle['shape']), dtype=handle['dtype'], buffer=shm.buf)
+        _attached[name] = (shm, array)
+    return _attached[name][1]
+
+
+def frame_from_handle(handle, columns, row_range=None):
+    """
+    Builds the model input for one task: the planned `columns` of rows
+    `row_range` (start, stop) of the shared matrix.
+    """
+    array = _attach(handle)
+    index = {c: i for i, c in enumerate(handle['columns'])}
+    col_idx = [index[c] for c in columns]
+    start, stop = row_range if row_range is not None else (0, array.shape[0])
+    return pd.DataFrame(array[start:stop, col_idx], columns=columns)
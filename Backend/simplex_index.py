@@ -0,0 +1,217 @@
+"""
+Precomputed simplex lookup index for fraction estimation.
+
+For a registered component set, `build` predicts the blended properties over
+a dense grid of the fraction simplex (scrambled Sobol points mapped like the
+Optuna sampler's parametrization, plus the vertices) in large batches, and
+stores the grid as float32 arrays in SIMPLEX_INDEX_DIR/<key>.npz.
+
+`lookup` answers a target from a KD-tree over the standardized predicted
+properties: the nearest SIMPLEX_INDEX_CANDIDATES grid points are re-ranked by
+the exact MAPE against the target (then cost), as the Optuna search would.
+With fraction constraints, every grid point within the bounds is scored.
+Trees are built on first use per (index, targets) and cached in-process.
+SIMPLEX_INDEX_DIR has to be shared by the workers that build indexes and the
+API processes that answer from them.
+"""
+import os
+import time
+import json
+import hashlib
+import threading
+import numpy as np
+from scipy.stats import qmc
+from sklearn.neighbors import KDTree
+
+from config import settings
+from estimation import constrained_fractions, component_costs
+
+# Grid rows per prediction call
+BATCH_ROWS = 20000
+# An index answers requests of its own quality tier or a lower one
+QUALITY_RANK = {'fast': 0, 'preview': 1, 'full': 2}
+
+_lock = threading.Lock()
+_indexes = {}  # key -> (mtime, arrays)
+_cache = {}  # (key, mtime, targets) -> (KDTree, scale)
+
+
+def component_set_key(components):
+    """
+    Id of a component set (names and properties). The order counts: the models
+    see Component1..5 by position, so a reordered set predicts differently.
+    """
+    canonical = [(c['name'], [round(float(p), 6) for p in c['properties']]) for c in components]
+    return hashlib.sha1(json.dumps(canonical).encode()).hexdigest()[:16]
+
+
+def index_path(key):
+    return os.path.join(settings.SIMPLEX_INDEX_DIR, f"{key}.npz")
+
+
+def simplex_grid(n_components, n_points, seed=0):
+    """At least n_points fraction vectors (in %) covering the simplex, vertices first."""
+    lower, upper = np.zeros(n_components), np.full(n_components, 100.0)
+    sobol = qmc.Sobol(d=n_components, scramble=True, seed=seed)
+    u = sobol.random_base2(int(np.ceil(np.log2(max(n_points, 2)))))
+    weights = -np.log(np.clip(u, 1e-12, 1.0))
+    points = np.array([constrained_fractions(w, lower, upper) for w in weights])
+    return np.vstack([np.eye(n_components) * 100.0, points])
+
+
+def build(components, predict, model, n_points, quality='full', on_progress=None):
+    """
+    Predicts the grid of this component set in batches of BATCH_ROWS and saves
+    the index. `predict(input_df, quality, targets, on_progress)` returns
+    (predictions, targets), `model.blends_frame` builds the input rows.
+    """
+    grid = simplex_grid(len(components), n_points)
+    predictions, targets = [], None
+    for start in range(0, len(grid), BATCH_ROWS):
+        rows = grid[start:start + BATCH_ROWS]
+        done = start
+
+        def chunk_progress(value):
+            if on_progress is not None:
+                on_progress(int((done + len(rows) * value / 100) / len(grid) * 100))
+
+        chunk, targets = predict(model.blends_frame(components, rows), quality, None, chunk_progress)
+        predictions.append(np.asarray(chunk, dtype=np.float32))
+
+    key = component_set_key(components)
+    os.makedirs(settings.SIMPLEX_INDEX_DIR, exist_ok=True)
+    tmp_path = index_path(key) + '.tmp.npz'
+    np.savez(
+        tmp_path,
+        fractions=grid.astype(np.float32),
+        predictions=np.vstack(predictions),
+        names=np.array([c['name'] for c in components]),
+        properties=np.array([c['properties'] for c in components], dtype=np.float64),
+        targets=np.array(targets),
+        quality=np.array(quality),
+        built_at=np.array(time.time()),
+    )
+    os.replace(tmp_path, index_path(key))
+    return describe(key)
+
+
+def load(key):
+    path = index_path(key)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def describe(key):
+    index = load(key)
+    if index is None:
+        return None
+    return {
+        'key': key,
+        'components': [str(n) for n in index['names']],
+        'points': int(len(index['fractions'])),
+        'quality': str(index['quality']),
+        'built_at': float(index['built_at']),
+        'size_bytes': os.path.getsize(index_path(key)),
+    }
+
+
+def list_indexes():
+    if not os.path.isdir(settings.SIMPLEX_INDEX_DIR):
+        return []
+    keys = [name[:-4] for name in os.listdir(settings.SIMPLEX_INDEX_DIR) if name.endswith('.npz') and '.tmp' not in name]
+    return [d for d in (describe(key) for key in sorted(keys)) if d is not None]
+
+
+def _cached_index(key):
+    """The index arrays, re-read only when the file was rebuilt; (None, None) if there's none."""
+    try:
+        mtime = os.path.getmtime(index_path(key))
+    except OSError:
+        return None, None
+    with _lock:
+        cached = _indexes.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, load(key))
+        with _lock:
+            _indexes[key] = cached
+    return cached
+
+
+def _tree(key, mtime, index, columns):
+    cache_key = (key, mtime, tuple(columns))
+    with _lock:
+        cached = _cache.get(cache_key)
+    if cached is None:
+        values = index['predictions'][:, columns].astype(np.float64)
+        scale = values.std(axis=0)
+        scale[scale <= 0] = 1.0
+        cached = (KDTree(values / scale), scale)
+        with _lock:
+            # Only the latest build of each index is kept
+            for stale in [k for k in _cache if k[0] == key and k[1] != cache_key[1]]:
+                del _cache[stale]
+            _cache[cache_key] = cached
+    return cached
+
+
+def lookup(components, target_properties, targets, known_costs, lower=None, upper=None, n_candidates=None, quality='full'):
+    """
+    Best grid recipes for a target from the component set's index, or None if
+    there's no index for it, it lacks some of `targets` or it was built at a
+    lower tier than the requested `quality` (fast < preview < full). Returns
+    {'quality', 'points', 'candidates'}, candidates being (fractions in %
+    ordered like `components`, MAPE in %, blend cost) within the bounds, best first.
+    """
+    key = component_set_key(components)
+    mtime, index = _cached_index(key)
+    if index is None or QUALITY_RANK.get(str(index['quality']), -1) < QUALITY_RANK[quality]:
+        return None
+    index_targets = [str(t) for t in index['targets']]
+    if any(t not in index_targets for t in targets):
+        return None
+    columns = [index_targets.index(t) for t in targets]
+    n_candidates = n_candidates or settings.SIMPLEX_INDEX_CANDIDATES
+    target = np.asarray(target_properties, dtype=np.float64)
+
+    if lower is not None and upper is not None and (np.any(lower > 0) or np.any(upper < 100)):
+        # Constrained: the nearest neighbours may all be out of bounds, so
+        # score every grid point inside them instead
+        nearest = np.flatnonzero(np.all(
+            (index['fractions'] >= lower - 1e-4) & (index['fractions'] <= upper + 1e-4), axis=1
+        ))
+    else:
+        tree, scale = _tree(key, mtime, index, columns)
+        _, nearest = tree.query((target / scale)[None, :], k=min(n_candidates, len(index['fractions'])))
+        nearest = nearest[0]
+
+    fractions = index['fractions'][nearest].astype(np.float64)
+    predictions = index['predictions'][nearest][:, columns].astype(np.float64)
+
+    mapes = 100 * np.mean(np.abs(predictions - target) / np.maximum(np.abs(target), np.finfo(np.float64).eps), axis=1)
+    costs = fractions @ np.array(component_costs(components, known_costs)) / 100
+    ranked = np.lexsort((costs, mapes))[:n_candidates]
+    return {
+        'quality': str(index['quality']),
+        'points': int(len(index['fractions'])),
+        'candidates': [(fractions[i].tolist(), float(mapes[i]), float(costs[i])) for i in ranked],
+    }
+
+
+def estimation_result(components, found, targets, target_cost=None):
+    """A `lookup` answer in the result format of the fraction estimation jobs."""
+    fractions, mape, cost = found['candidates'][0]
+    result = {
+        "estimated_fractions": [{"name": comp['name'], "fraction": f} for comp, f in zip(components, fractions)],
+        "mape_score": mape/100,
+        "blend_cost": cost,
+        "warm_started_trials": 0,
+        "quality": found['quality'],
+        "targets": list(targets),
+        "source": "simplex_index",
+        "index_points": found['points'],
+    }
+    if target_cost and float(target_cost) != 0:
+        result["savings_percent"] = (float(target_cost) - cost) / float(target_cost) * 100.0
+    return result
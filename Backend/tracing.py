@@ -0,0 +1,174 @@
+"""
+End-to-end tracing of prediction jobs (OpenTelemetry).
+
+A prediction crosses FastAPI -> Celery task -> prediction script -> pool
+workers. The W3C trace context (`traceparent`) is carried across each hop:
+  - API -> Celery:      the task message headers (routers/predictions.py `enqueue`)
+  - task -> script:     the script's TRACEPARENT environment variable
+  - script -> pool:     the pool initializer arguments
+  - task -> pool:       each pool task (persistent pools, PREDICTION_POOL)
+so all spans of a job end up in one trace, rooted at the HTTP request that
+started it. Spans are exported per TRACING_EXPORTER:
+  - 'none'   tracing is off (spans are no-ops, nothing is propagated)
+  - 'otlp'   OTLP/HTTP to TRACING_OTLP_ENDPOINT (e.g. a local collector)
+  - 'file'   one OTLP-style JSON span per line, appended to TRACING_FILE
+"""
+import os
+import fcntl
+import threading
+from contextlib import contextmanager
+
+from opentelemetry import trace, context, propagate
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult, BatchSpanProcessor, SimpleSpanProcessor
+
+from config import settings
+
+TRACE_ENV = 'TRACEPARENT'
+
+_provider = None
+_lock = threading.Lock()
+_task_spans = {}  # Celery task id -> (span, context token)
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends spans as JSON lines; the file is locked per write, since every process of a job appends to it."""
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans):
+        lines = ''.join(span.to_json(indent=None) + '\n' for span in spans)
+        try:
+            with open(self.path, 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                f.write(lines)
+        except OSError as e:
+            print(f"Warning: Could not write spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def enabled():
+    return settings.TRACING_EXPORTER != 'none'
+
+
+def setup(role, simple=False):
+    """
+    Sets up span export for this process, as service '<TRACING_SERVICE_NAME>-<role>'.
+    simple=True exports each span as it ends, for processes that may be
+    terminated without cleanup (pool workers).
+    """
+    global _provider
+    if not enabled() or _provider is not None:
+        return
+    if settings.TRACING_EXPORTER == 'file':
+        exporter = FileSpanExporter(settings.TRACING_FILE)
+    elif settings.TRACING_EXPORTER == 'otlp':
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    else:
+        print(f"Warning: Unknown TRACING_EXPORTER '{settings.TRACING_EXPORTER}', tracing is off.")
+        return
+    provider = TracerProvider(resource=Resource.create({'service.name': f"{settings.TRACING_SERVICE_NAME}-{role}"}))
+    provider.add_span_processor(SimpleSpanProcessor(exporter) if simple else BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _provider = provider
+
+
+def shutdown():
+    """Flushes the pending spans (end of a script or worker process)."""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+@contextmanager
+def span(name, parent=None, kind=trace.SpanKind.INTERNAL, **attributes):
+    """
+    A span around the block, child of the current span, or of the `parent`
+    carrier (e.g. message headers) if given. Yields the span (None when off).
+    """
+    if not enabled():
+        yield None
+        return
+    ctx = propagate.extract(parent) if parent else None
+    with trace.get_tracer(__name__).start_as_current_span(name, context=ctx, kind=kind, attributes=attributes) as current:
+        yield current
+
+
+def carrier():
+    """The current trace context as a {'traceparent': ...} dict (empty when off or outside a span)."""
+    headers = {}
+    if enabled():
+        propagate.inject(headers)
+    return headers
+
+
+def attach(parent):
+    """Makes the `parent` carrier the context of this process's next spans (pool initializer)."""
+    if enabled() and parent:
+        context.attach(propagate.extract(parent))
+
+
+@contextmanager
+def attached(parent):
+    """The `parent` carrier as the current context within the block (tasks of a persistent pool)."""
+    if not enabled() or not parent:
+        yield
+        return
+    token = context.attach(propagate.extract(parent))
+    try:
+        yield
+    finally:
+        context.detach(token)
+
+
+# --- Celery tasks ---
+
+def start_task(task_id, name, parent):
+    """Opens the span of a Celery task, child of the trace context sent in its headers."""
+    if not enabled():
+        return
+    current = trace.get_tracer(__name__).start_span(
+        f"task {name}", context=propagate.extract(parent or {}),
+        kind=trace.SpanKind.CONSUMER, attributes={'celery.task_id': task_id},
+    )
+    token = context.attach(trace.set_span_in_context(current))
+    with _lock:
+        _task_spans[task_id] = (current, token)
+
+
+def finish_task(task_id, state=None):
+    with _lock:
+        entry = _task_spans.pop(task_id, None)
+    if entry is None:
+        return
+    current, token = entry
+    if state is not None:
+        current.set_attribute('celery.state', state)
+    if state == 'FAILURE':
+        current.set_status(trace.StatusCode.ERROR)
+    current.end()
+    context.detach(token)
+
+
+# --- Prediction scripts ---
+
+def child_env(env=None):
+    """Environment of a prediction subprocess carrying the current trace context (None = inherit)."""
+    headers = carrier()
+    if 'traceparent' not in headers:
+        return env
+    return dict(env or os.environ, **{TRACE_ENV: headers['traceparent']})
+
+
+def env_parent():
+    """The trace context a prediction script was started with."""
+    traceparent = os.environ.get(TRACE_ENV)
+    return {'traceparent': traceparent} if traceparent else None